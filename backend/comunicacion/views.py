@@ -5,6 +5,7 @@ from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from utils.cache_referencia import cache_referencia
 
 from .models import Contacto, Contenido
 from .serializers import (ContactoListSerializer, ContactoRespuestaSerializer,
@@ -48,7 +49,9 @@ class ContenidoViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     filterset_fields = ["tipo", "activo"]
     search_fields = ["titulo", "subtitulo", "cuerpo"]
+    modelos_referencia = ("comunicacion.Contenido",)
 
+    @cache_referencia
     def list(self, request, *args, **kwargs):
         """Override del método list para manejar bases de datos vacías"""
         try:
@@ -85,7 +88,12 @@ class ContenidoViewSet(viewsets.ModelViewSet):
                 "results": []
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @cache_referencia
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     @action(detail=False, methods=["get"])
+    @cache_referencia
     def activos(self, request):
         """Obtener solo contenidos activos"""
         try:
@@ -101,15 +109,16 @@ class ContenidoViewSet(viewsets.ModelViewSet):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @action(detail=False, methods=["get"])
+    @cache_referencia
     def caracteristicas(self, request):
         """Obtener características activas para el frontend"""
         try:
-            caracteristicas = self.get_queryset().filter(
+            caracteristicas = list(self.get_queryset().filter(
                 activo=True, 
                 tipo="caracteristica"
-            ).order_by("orden", "titulo")
+            ).order_by("orden", "titulo"))
 
-            if not caracteristicas.exists():
+            if not caracteristicas:
                 return Response(
                     {
                         "success": True,
@@ -125,7 +134,7 @@ class ContenidoViewSet(viewsets.ModelViewSet):
             return Response(
                 {
                     "success": True,
-                    "count": caracteristicas.count(),
+                    "count": len(caracteristicas),
                     "results": serializer.data,
                 },
                 status=status.HTTP_200_OK,
@@ -144,16 +153,17 @@ class ContenidoViewSet(viewsets.ModelViewSet):
             )
 
     @action(detail=False, methods=["get"])
+    @cache_referencia
     def estadisticas(self, request):
         """Obtener estadísticas generales del sitio"""
         try:
             # Obtener contenidos estadísticos
-            estadisticas = self.get_queryset().filter(
+            estadisticas = list(self.get_queryset().filter(
                 activo=True, 
                 tipo="estadistica"
-            ).order_by("orden", "titulo")
+            ).order_by("orden", "titulo"))
 
-            if not estadisticas.exists():
+            if not estadisticas:
                 return Response(
                     {
                         "success": True,
@@ -169,7 +179,7 @@ class ContenidoViewSet(viewsets.ModelViewSet):
             return Response(
                 {
                     "success": True,
-                    "count": estadisticas.count(),
+                    "count": len(estadisticas),
                     "results": serializer.data,
                 },
                 status=status.HTTP_200_OK,
@@ -188,6 +198,7 @@ class ContenidoViewSet(viewsets.ModelViewSet):
             )
 
     @action(detail=False, methods=["get"])
+    @cache_referencia
     def por_tipo(self, request):
         """Obtener contenidos agrupados por tipo"""
         try:
@@ -212,3 +212,46 @@ CSRF_TRUSTED_ORIGINS = [
 # === CONFIGURACIÓN DE IVA ===
 # Porcentaje de IVA para mostrar en facturas y reservas (simbólico)
 IVA_PERCENTAGE = float(env("IVA_PERCENTAGE", default="0.10"))  # 10% por defecto
+
+# === ÍNDICE DE DISPONIBILIDAD ===
+# Filtra la flota en memoria en las búsquedas de disponibilidad (ver vehiculos/indice_disponibilidad.py)
+DISPONIBILIDAD_INDICE_ENABLED = env.bool("DISPONIBILIDAD_INDICE_ENABLED", default=True)
+# Caché de resultados de búsqueda (ver vehiculos/cache_disponibilidad.py)
+DISPONIBILIDAD_CACHE_ENABLED = env.bool("DISPONIBILIDAD_CACHE_ENABLED", default=True)
+DISPONIBILIDAD_CACHE_TIMEOUT = env.int("DISPONIBILIDAD_CACHE_TIMEOUT", default=300)
+
+# === CALENDARIO DE TARIFAS ===
+# Días materializados por vehículo en precio_diario_vehiculo (ver vehiculos/tarifas.py)
+CALENDARIO_TARIFAS_DIAS = env.int("CALENDARIO_TARIFAS_DIAS", default=400)
+
+# === VARIANTES DE IMÁGENES ===
+# Versiones WebP/AVIF redimensionadas de las imágenes de vehículos (ver vehiculos/imagenes.py)
+IMAGENES_VARIANTES_ENABLED = env.bool("IMAGENES_VARIANTES_ENABLED", default=True)
+# En un hilo de fondo tras confirmar la transacción; False para generarlas en el propio hilo
+IMAGENES_VARIANTES_ASINCRONAS = env.bool("IMAGENES_VARIANTES_ASINCRONAS", default=True)
+IMAGENES_VARIANTES_WORKERS = env.int("IMAGENES_VARIANTES_WORKERS", default=2)
+IMAGENES_VARIANTES_CALIDAD = env.int("IMAGENES_VARIANTES_CALIDAD", default=80)
+
+# === ANALÍTICA DE FLOTA ===
+# Vigencia de los resultados de utilización cacheados (ver vehiculos/analitica.py)
+ANALITICA_CACHE_TIMEOUT = env.int("ANALITICA_CACHE_TIMEOUT", default=60 * 60 * 24)
+
+# === PRECIOS POR LOTE ===
+# Límites de /api/reservas/calcular-precio-lote/ (ver reservas/services.py)
+PRECIO_LOTE_MAX_VEHICULOS = env.int("PRECIO_LOTE_MAX_VEHICULOS", default=100)
+PRECIO_LOTE_MAX_POLITICAS = env.int("PRECIO_LOTE_MAX_POLITICAS", default=10)
+
+# === PRESUPUESTOS FIRMADOS ===
+# Segundos de validez del token de calcular_precio reutilizado al crear la reserva (ver reservas/presupuestos.py)
+PRESUPUESTO_TOKEN_VIGENCIA = env.int("PRESUPUESTO_TOKEN_VIGENCIA", default=30 * 60)
+
+# === CACHÉ DE DATOS DE REFERENCIA ===
+# Respuestas de los catálogos (categorías, grupos, políticas, lugares, contenidos) versionadas por modelo (ver utils/cache_referencia.py)
+REFERENCIA_CACHE_ENABLED = env.bool("REFERENCIA_CACHE_ENABLED", default=True)
+REFERENCIA_CACHE_TIMEOUT = env.int("REFERENCIA_CACHE_TIMEOUT", default=60 * 60)
+# Entradas del LRU por proceso delante de la caché compartida
+REFERENCIA_CACHE_LRU_TAMANO = env.int("REFERENCIA_CACHE_LRU_TAMANO", default=512)
+
+# === NÚMEROS DE RESERVA ===
+# Clave de la permutación que convierte el contador en códigos M4Y (ver reservas/numeros.py)
+NUMERO_RESERVA_CLAVE = env("NUMERO_RESERVA_CLAVE", default=SECRET_KEY)
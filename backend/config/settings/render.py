@@ -143,6 +143,7 @@ CORS_ALLOW_METHODS = [
 CORS_EXPOSE_HEADERS = [
     'content-type',
     'x-csrftoken',
+    'x-disponibilidad-cache',
 ]
 
 # CSRF - Configuración específica para dominios cruzados
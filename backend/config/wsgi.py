@@ -25,3 +25,10 @@ else:
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", settings_module)
 
 application = get_wsgi_application()
+
+# Cargar el índice de disponibilidad al arrancar cada worker
+from vehiculos.indice_disponibilidad import (indice_disponibilidad,  # noqa: E402
+                                             indice_habilitado)
+
+if indice_habilitado():
+    indice_disponibilidad.precargar()
@@ -49,13 +49,17 @@ class Direccion(models.Model):
 
     def save(self, *args: Any, **kwargs: Any) -> None:
         # Normalizar datos antes de guardar
+        self.normalizar()
+        super().save(*args, **kwargs)
+
+    def normalizar(self) -> None:
+        """Normaliza ciudad, provincia y país (también antes de bulk_create)"""
         if self.ciudad:
             self.ciudad = self.ciudad.strip().title()
         if self.provincia:
             self.provincia = self.provincia.strip().title()
         if self.pais:
             self.pais = self.pais.strip().title()
-        super().save(*args, **kwargs)
 
 
 class Lugar(models.Model):
@@ -1,12 +1,16 @@
 # lugares/views.py
 import logging
+from datetime import timedelta
 from typing import Any
 
 from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.request import Request
 from rest_framework.response import Response
+from utils.cache_referencia import cache_referencia
 
 from .models import Direccion, Lugar
 from .permissions import IsAdminOrReadOnly, PublicAccessPermission
@@ -22,13 +26,15 @@ class DireccionViewSet(viewsets.ModelViewSet):
     queryset = Direccion.objects.all()
     serializer_class = DireccionSerializer
     permission_classes = [IsAdminOrReadOnly]
+    modelos_referencia = ("lugares.Direccion",)
 
+    @cache_referencia
     def list(self, request: Request, *args: Any, **kwargs: Any) -> Response:
         """Listado de direcciones con manejo de errores"""
         try:
-            queryset = self.get_queryset().order_by("ciudad", "provincia")
+            direcciones = list(self.get_queryset().order_by("ciudad", "provincia"))
 
-            if not queryset.exists():
+            if not direcciones:
                 logger.warning("No se encontraron direcciones")
                 return Response(
                     {
@@ -40,12 +46,12 @@ class DireccionViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_200_OK,
                 )
 
-            serializer = self.get_serializer(queryset, many=True)
+            serializer = self.get_serializer(direcciones, many=True)
 
             return Response(
                 {
                     "success": True,
-                    "count": queryset.count(),
+                    "count": len(direcciones),
                     "results": serializer.data,
                 },
                 status=status.HTTP_200_OK,
@@ -68,6 +74,7 @@ class LugarViewSet(viewsets.ModelViewSet):
 
     queryset = Lugar.objects.select_related("direccion")
     permission_classes = [PublicAccessPermission]
+    modelos_referencia = ("lugares.Lugar", "lugares.Direccion")
 
     def get_serializer_class(self):
         """Seleccionar serializer según la acción"""
@@ -77,12 +84,13 @@ class LugarViewSet(viewsets.ModelViewSet):
             return LugarCreateSerializer
         return LugarSerializer
 
+    @cache_referencia
     def list(self, request, *args, **kwargs):
         """Listado de lugares con manejo de errores"""
         try:
-            queryset = self.get_queryset().filter(activo=True).order_by("nombre")
+            lugares = list(self.get_queryset().filter(activo=True).order_by("nombre"))
 
-            if not queryset.exists():
+            if not lugares:
                 logger.warning("No se encontraron lugares activos")
                 return Response(
                     {
@@ -94,12 +102,12 @@ class LugarViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_200_OK,
                 )
 
-            serializer = self.get_serializer(queryset, many=True)
+            serializer = self.get_serializer(lugares, many=True)
 
             return Response(
                 {
                     "success": True,
-                    "count": queryset.count(),
+                    "count": len(lugares),
                     "results": serializer.data,
                 },
                 status=status.HTTP_200_OK,
@@ -116,6 +124,7 @@ class LugarViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
+    @cache_referencia
     def retrieve(self, request, *args, **kwargs):
         """Obtener un lugar específico"""
         try:
@@ -142,12 +151,13 @@ class LugarViewSet(viewsets.ModelViewSet):
             )
 
     @action(detail=False, methods=["get"])
+    @cache_referencia
     def populares(self, request):
         """Obtener lugares populares"""
         try:
-            lugares = self.get_queryset().filter(activo=True, popular=True).order_by("nombre")
+            lugares = list(self.get_queryset().filter(activo=True, popular=True).order_by("nombre"))
             
-            if not lugares.exists():
+            if not lugares:
                 return Response(
                     {
                         "success": True,
@@ -163,7 +173,7 @@ class LugarViewSet(viewsets.ModelViewSet):
             return Response(
                 {
                     "success": True,
-                    "count": lugares.count(),
+                    "count": len(lugares),
                     "results": serializer.data,
                 },
                 status=status.HTTP_200_OK,
@@ -181,12 +191,13 @@ class LugarViewSet(viewsets.ModelViewSet):
             )
 
     @action(detail=False, methods=["get"])
+    @cache_referencia
     def activos(self, request):
         """Obtener solo lugares activos"""
         try:
-            lugares = self.get_queryset().filter(activo=True).order_by("nombre")
+            lugares = list(self.get_queryset().filter(activo=True).order_by("nombre"))
             
-            if not lugares.exists():
+            if not lugares:
                 return Response(
                     {
                         "success": True,
@@ -202,7 +213,7 @@ class LugarViewSet(viewsets.ModelViewSet):
             return Response(
                 {
                     "success": True,
-                    "count": lugares.count(),
+                    "count": len(lugares),
                     "results": serializer.data,
                 },
                 status=status.HTTP_200_OK,
@@ -220,11 +231,12 @@ class LugarViewSet(viewsets.ModelViewSet):
             )
 
     @action(detail=False, methods=["get"])
+    @cache_referencia
     def destinos(self, request):
         """Obtener destinos disponibles (lugares con coordenadas)"""
         try:
             # Filtrar lugares que tengan coordenadas y estén activos
-            destinos = (
+            destinos = list(
                 self.get_queryset()
                 .filter(
                     activo=True,
@@ -234,7 +246,7 @@ class LugarViewSet(viewsets.ModelViewSet):
                 .order_by("nombre")
             )
 
-            if not destinos.exists():
+            if not destinos:
                 logger.warning("No se encontraron destinos disponibles")
                 return Response(
                     {
@@ -249,12 +261,12 @@ class LugarViewSet(viewsets.ModelViewSet):
             # Usar un serializer que incluya las coordenadas
             serializer = LugarSerializer(destinos, many=True)
 
-            logger.info(f"Destinos encontrados: {destinos.count()}")
+            logger.info(f"Destinos encontrados: {len(destinos)}")
 
             return Response(
                 {
                     "success": True,
-                    "count": destinos.count(),
+                    "count": len(destinos),
                     "results": serializer.data,
                 },
                 status=status.HTTP_200_OK,
@@ -279,22 +291,25 @@ class LugarViewSet(viewsets.ModelViewSet):
             
             # Lazy import para evitar dependencias circulares
             try:
-                from vehiculos.models import Vehiculo
-                vehiculos = Vehiculo.objects.filter(
-                    activo=True,
-                    disponible=True,
-                    # Aquí podrías agregar lógica para filtrar por lugar
-                    # lugar_recogida=lugar
-                )
-                
                 from vehiculos.serializers import VehiculoListSerializer
+                from vehiculos.services import buscar_vehiculos_disponibles
+
+                # Por defecto: vehículos presentes y libres durante el próximo día
+                fecha_inicio = parse_datetime(request.GET.get("fecha_inicio", "")) or timezone.now()
+                fecha_fin = parse_datetime(request.GET.get("fecha_fin", "")) or (
+                    fecha_inicio + timedelta(days=1)
+                )
+
+                vehiculos = list(
+                    buscar_vehiculos_disponibles(fecha_inicio, fecha_fin, lugar_id=lugar.id)
+                )
                 serializer = VehiculoListSerializer(vehiculos, many=True)
                 
                 return Response(
                     {
                         "success": True,
                         "lugar": lugar.nombre,
-                        "count": vehiculos.count(),
+                        "count": len(vehiculos),
                         "vehiculos": serializer.data,
                     },
                     status=status.HTTP_200_OK,
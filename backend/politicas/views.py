@@ -4,6 +4,7 @@ from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import filters, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from utils.cache_referencia import cache_referencia
 
 from .models import PoliticaPago, Promocion, TipoPenalizacion
 from .serializers import (PoliticaPagoSerializer, PromocionSerializer,
@@ -12,13 +13,29 @@ from .serializers import (PoliticaPagoSerializer, PromocionSerializer,
 # TODO: VERIFICAR EL CORRECTO USO DE TARIFA.
 class PoliticaPagoViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet para políticas de pago"""
-    queryset = PoliticaPago.objects.all()
+    queryset = PoliticaPago.objects.prefetch_related(
+        'items', 'penalizaciones__tipo_penalizacion'
+    )
     serializer_class = PoliticaPagoSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['deductible', 'tarifa']
     search_fields = ['titulo', 'descripcion']
     ordering_fields = ['created_at', 'deductible']
     ordering = ['-created_at']
+    modelos_referencia = (
+        'politicas.PoliticaPago',
+        'politicas.PoliticaIncluye',
+        'politicas.PoliticaPenalizacion',
+        'politicas.TipoPenalizacion',
+    )
+
+    @cache_referencia
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_referencia
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
 
 class TipoPenalizacionViewSet(viewsets.ReadOnlyModelViewSet):
@@ -29,6 +46,15 @@ class TipoPenalizacionViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_fields = ['tipo_tarifa']
     search_fields = ['nombre']
     ordering = ['nombre']
+    modelos_referencia = ('politicas.TipoPenalizacion',)
+
+    @cache_referencia
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_referencia
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
 
 class PromocionViewSet(viewsets.ReadOnlyModelViewSet):
@@ -40,8 +66,18 @@ class PromocionViewSet(viewsets.ReadOnlyModelViewSet):
     search_fields = ['nombre', 'descripcion']
     ordering_fields = ['fecha_inicio', 'fecha_fin', 'descuento_pct']
     ordering = ['-fecha_inicio']
+    modelos_referencia = ('politicas.Promocion',)
+
+    @cache_referencia
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_referencia
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
     @action(detail=False, methods=['get'])
+    @cache_referencia
     def vigentes(self, request):
         """Obtiene promociones vigentes"""
         now = timezone.now().date()
@@ -526,8 +526,7 @@ class ReservaAdmin(admin.ModelAdmin):
             if not reserva.verificar_disponibilidad_vehiculo():
                 return JsonResponse({'error': 'El vehículo no está disponible para estas fechas'}, status=400)
             
-            reserva.estado = 'confirmada'
-            reserva.save()
+            reserva.confirmar()
             
             logger.info(f"Reserva {reserva.id} confirmada por {request.user.username}")
             
@@ -559,8 +558,7 @@ class ReservaAdmin(admin.ModelAdmin):
             if reserva.estado == 'confirmada' and not confirmed_cancellation:
                 return JsonResponse({'error': 'Se requiere confirmación adicional para cancelar reservas confirmadas'}, status=400)
             
-            reserva.estado = 'cancelada'
-            reserva.save()
+            reserva.cancelar()
             
             logger.info(f"Reserva {reserva.id} cancelada por {request.user.username}")
             
@@ -652,14 +650,9 @@ class ReservaAdmin(admin.ModelAdmin):
 
     # Acciones masivas
     def confirmar_reservas(self, request, queryset):
-        """Confirmar reservas seleccionadas"""
-        count = 0
-        for reserva in queryset.filter(estado="pendiente"):
-            if reserva.verificar_disponibilidad_vehiculo():
-                reserva.estado = "confirmada"
-                reserva.save()
-                count += 1
-                logger.info(f"Reserva {reserva.pk} confirmada por {request.user.username}")
+        """Confirmar reservas seleccionadas (un único UPDATE)"""
+        count = queryset.confirmar()
+        logger.info(f"{count} reservas confirmadas por {request.user.username}")
         
         self.message_user(
             request,
@@ -668,8 +661,9 @@ class ReservaAdmin(admin.ModelAdmin):
         )
 
     def cancelar_reservas(self, request, queryset):
-        """Cancelar reservas seleccionadas"""
-        count = queryset.exclude(estado="cancelada").update(estado="cancelada")
+        """Cancelar reservas seleccionadas (un único UPDATE)"""
+        count = queryset.cancelar()
+        logger.info(f"{count} reservas canceladas por {request.user.username}")
         self.message_user(
             request,
             f"{count} reservas canceladas.",
@@ -7,5 +7,5 @@ class ReservasConfig(AppConfig):
     verbose_name = "Gestión de Reservas"
 
     def ready(self):
-        # Importar señales si las hay
-        pass
+        # Señales que invalidan el catálogo de extras en memoria
+        from . import signals  # noqa: F401
@@ -0,0 +1,432 @@
+# reservas/benchmark.py
+"""
+Benchmark del motor de precios
+
+Siembra una flota sintética (vehículos con varios tramos de tarifa, extras y
+políticas de pago) y mide latencia (percentiles) y número de consultas de:
+
+- `vehiculos.services.calcular_precio_alquiler`
+- `ReservaService.calcular_precio_reserva`
+- `Reserva.calcular_precio_total` (sobre reservas guardadas con extras)
+
+para varios tamaños de carga (1, 100 y 10.000 presupuestos por defecto). El
+informe es un dict serializable a JSON que `comparar_informes` contrasta con
+el de otro commit. Uso: `python manage.py benchmark_precios`.
+
+Todo se ejecuta dentro de una transacción que se deshace al terminar.
+"""
+import logging
+import math
+import platform
+import random
+import subprocess
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import django
+from django.db import connection, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+VERSION_INFORME = 1
+TAMANOS_POR_DEFECTO = (1, 100, 10000)
+
+# Reservas guardadas sobre las que se repite `calcular_precio_total`
+MAX_RESERVAS_GUARDADAS = 1000
+
+# Por debajo de estas llamadas los percentiles son ruido y no se comparan
+MIN_LLAMADAS_COMPARABLES = 20
+
+
+@dataclass
+class DatosBenchmark:
+    """Flota sintética sembrada para el benchmark"""
+
+    vehiculo_ids: List[int]
+    politica_ids: List[int]
+    extra_ids: List[int]
+    usuario: Any
+    lugar: Any
+    inicio: datetime
+    reservas_ids: List[int] = field(default_factory=list)
+
+
+@dataclass
+class Peticion:
+    vehiculo_id: int
+    fecha_recogida: datetime
+    fecha_devolucion: datetime
+    politica_pago_id: int
+    extras: List[Tuple[int, int]]
+
+
+class ContadorConsultas:
+    """`execute_wrapper` que cuenta las sentencias SQL ejecutadas"""
+
+    def __init__(self) -> None:
+        self.total = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.total += 1
+        return execute(sql, params, many, context)
+
+
+# === DATOS ===
+
+
+def sembrar_flota(vehiculos: int = 200, semilla: int = 0) -> DatosBenchmark:
+    """
+    Crea la flota sintética: cada vehículo con dos tramos de tarifa (el
+    segundo empieza dentro del horizonte de búsqueda), 3 políticas de pago y
+    6 extras. Regenera el calendario de precios de los vehículos creados.
+    """
+    from lugares.models import Direccion, Lugar
+    from politicas.models import PoliticaPago
+    from usuarios.models import Usuario
+    from vehiculos.models import Categoria, GrupoCoche, TarifaVehiculo, Vehiculo
+    from vehiculos.tarifas import reconstruir_calendario
+
+    from .models import Extras
+
+    rng = random.Random(semilla)
+    hoy = timezone.localdate()
+
+    categoria = Categoria.objects.create(nombre=f"Benchmark {semilla}")
+    grupo = GrupoCoche.objects.create(nombre=f"Benchmark {semilla}")
+    direccion = Direccion.objects.create(
+        calle="Calle Benchmark", ciudad="Málaga", pais="España", codigo_postal="29001"
+    )
+    lugar = Lugar.objects.create(nombre=f"Benchmark {semilla}", direccion=direccion)
+    usuario = Usuario.objects.create(
+        username=f"benchmark_{semilla}", email=f"benchmark_{semilla}@example.com"
+    )
+
+    politicas = PoliticaPago.objects.bulk_create(
+        PoliticaPago(titulo=f"Benchmark {tarifa}", tarifa=Decimal(tarifa))
+        for tarifa in ("0.00", "6.50", "12.00")
+    )
+    extras = Extras.objects.bulk_create(
+        Extras(nombre=f"Extra benchmark {n}", precio=Decimal(precio))
+        for n, precio in enumerate(("3.00", "5.50", "7.00", "9.90", "12.00", "15.00"))
+    )
+
+    combustibles = [opcion for opcion, _ in Vehiculo.COMBUSTIBLE_CHOICES]
+    flota = Vehiculo.objects.bulk_create(
+        Vehiculo(
+            categoria=categoria,
+            grupo=grupo,
+            combustible=rng.choice(combustibles),
+            marca=f"Marca{n % 20}",
+            modelo=f"Modelo{n}",
+            matricula=f"BM{semilla}-{n:06d}",
+            anio=2020 + n % 5,
+            color="Blanco",
+            num_puertas=5,
+            num_pasajeros=5,
+            capacidad_maletero=300,
+            disponible=True,
+            activo=True,
+        )
+        for n in range(vehiculos)
+    )
+
+    tarifas = []
+    for vehiculo in flota:
+        cambio = hoy + timedelta(days=rng.randint(15, 120))
+        tarifas.append(
+            TarifaVehiculo(
+                vehiculo=vehiculo,
+                fecha_inicio=hoy - timedelta(days=30),
+                fecha_fin=cambio - timedelta(days=1),
+                precio_dia=Decimal(rng.randint(2500, 9000)) / 100,
+            )
+        )
+        tarifas.append(
+            TarifaVehiculo(
+                vehiculo=vehiculo,
+                fecha_inicio=cambio,
+                precio_dia=Decimal(rng.randint(2500, 9000)) / 100,
+            )
+        )
+    TarifaVehiculo.objects.bulk_create(tarifas)
+
+    vehiculo_ids = [vehiculo.id for vehiculo in flota]
+    reconstruir_calendario(vehiculo_ids)
+
+    return DatosBenchmark(
+        vehiculo_ids=vehiculo_ids,
+        politica_ids=[politica.id for politica in politicas],
+        extra_ids=[extra.id for extra in extras],
+        usuario=usuario,
+        lugar=lugar,
+        inicio=timezone.now().replace(minute=0, second=0, microsecond=0),
+    )
+
+
+def generar_peticiones(datos: DatosBenchmark, cantidad: int, semilla: int = 0) -> List[Peticion]:
+    """Presupuestos aleatorios (reproducibles por semilla) de 1 a 14 días en los próximos 6 meses"""
+    rng = random.Random(semilla)
+    peticiones = []
+    for _ in range(cantidad):
+        recogida = datos.inicio + timedelta(days=rng.randint(1, 180), hours=rng.randint(0, 12))
+        extras = rng.sample(datos.extra_ids, rng.randint(0, 3))
+        peticiones.append(
+            Peticion(
+                vehiculo_id=rng.choice(datos.vehiculo_ids),
+                fecha_recogida=recogida,
+                fecha_devolucion=recogida + timedelta(days=rng.randint(1, 14)),
+                politica_pago_id=rng.choice(datos.politica_ids),
+                extras=[(extra_id, rng.randint(1, 2)) for extra_id in extras],
+            )
+        )
+    return peticiones
+
+
+def sembrar_reservas(datos: DatosBenchmark, cantidad: int, semilla: int = 0) -> List[int]:
+    """
+    Guarda `cantidad` reservas con extras sin solaparse por vehículo (con
+    bulk_create: sin número de reserva ni señales).
+    """
+    from .models import Reserva, ReservaExtra
+
+    rng = random.Random(semilla)
+    reservas = []
+    extras_por_reserva = []
+    for n in range(cantidad):
+        vehiculo_id = datos.vehiculo_ids[n % len(datos.vehiculo_ids)]
+        # Huecos de 8 días por vehículo: cada reserva dura de 1 a 7
+        hueco = n // len(datos.vehiculo_ids)
+        recogida = datos.inicio + timedelta(days=1 + hueco * 8, hours=rng.randint(0, 12))
+        reservas.append(
+            Reserva(
+                usuario=datos.usuario,
+                politica_pago_id=rng.choice(datos.politica_ids),
+                vehiculo_id=vehiculo_id,
+                lugar_recogida=datos.lugar,
+                lugar_devolucion=datos.lugar,
+                fecha_recogida=recogida,
+                fecha_devolucion=recogida + timedelta(days=rng.randint(1, 7)),
+                estado="confirmada",
+                precio_dia=Decimal("40.00"),
+                precio_total=Decimal("40.00"),
+            )
+        )
+        extras_por_reserva.append(rng.sample(datos.extra_ids, rng.randint(0, 3)))
+
+    reservas = Reserva.objects.bulk_create(reservas, batch_size=500)
+    ReservaExtra.objects.bulk_create(
+        (
+            ReservaExtra(reserva=reserva, extra_id=extra_id, cantidad=1)
+            for reserva, extras in zip(reservas, extras_por_reserva, strict=True)
+            for extra_id in extras
+        ),
+        batch_size=500,
+    )
+    datos.reservas_ids = [reserva.id for reserva in reservas]
+    return datos.reservas_ids
+
+
+# === ESCENARIOS ===
+
+
+def _llamadas_alquiler(datos: DatosBenchmark, peticiones: List[Peticion]) -> Iterable[Callable[[], Any]]:
+    from vehiculos.services import calcular_precio_alquiler
+
+    for peticion in peticiones:
+        yield lambda p=peticion: calcular_precio_alquiler(
+            p.vehiculo_id,
+            p.fecha_recogida,
+            p.fecha_devolucion,
+            extras=[extra_id for extra_id, _ in p.extras],
+        )
+
+
+def _llamadas_reserva(datos: DatosBenchmark, peticiones: List[Peticion]) -> Iterable[Callable[[], Any]]:
+    from .services import ReservaService
+
+    servicio = ReservaService()
+    for peticion in peticiones:
+        data = {
+            "vehiculo_id": peticion.vehiculo_id,
+            "fecha_recogida": peticion.fecha_recogida,
+            "fecha_devolucion": peticion.fecha_devolucion,
+            "politica_pago_id": peticion.politica_pago_id,
+            "extras": [{"extra_id": e, "cantidad": c} for e, c in peticion.extras],
+        }
+        yield lambda d=data: servicio.calcular_precio_reserva(d)
+
+
+def _llamadas_total(datos: DatosBenchmark, peticiones: List[Peticion]) -> Iterable[Callable[[], Any]]:
+    from .models import Reserva
+
+    # Se recorren las reservas guardadas; en cada vuelta se recargan (fuera de
+    # la medición) para que las relaciones no lleguen cacheadas de la anterior
+    restantes = len(peticiones)
+    while restantes > 0:
+        reservas = list(Reserva.objects.filter(id__in=datos.reservas_ids).order_by("id"))
+        for reserva in reservas[:restantes]:
+            yield reserva.calcular_precio_total
+        restantes -= len(reservas)
+
+
+ESCENARIOS: Dict[str, Callable[[DatosBenchmark, List[Peticion]], Iterable[Callable[[], Any]]]] = {
+    "calcular_precio_alquiler": _llamadas_alquiler,
+    "calcular_precio_reserva": _llamadas_reserva,
+    "calcular_precio_total": _llamadas_total,
+}
+
+
+# === MEDICIÓN ===
+
+
+def percentil(valores: List[float], p: float) -> float:
+    """Percentil `p` (0-100) por rango más cercano; `valores` ordenados"""
+    if not valores:
+        return 0.0
+    rango = math.ceil(p / 100 * len(valores))
+    return valores[min(max(rango, 1), len(valores)) - 1]
+
+
+def medir(llamadas: Iterable[Callable[[], Any]]) -> Dict[str, Any]:
+    """Latencia y consultas de cada llamada; solo se cronometra la llamada en sí"""
+    contador = ContadorConsultas()
+    latencias: List[float] = []
+    consultas: List[int] = []
+    errores = 0
+
+    with connection.execute_wrapper(contador):
+        for llamada in llamadas:
+            antes = contador.total
+            inicio = time.perf_counter()
+            try:
+                resultado = llamada()
+            except Exception:
+                resultado = None
+                errores += 1
+            latencias.append((time.perf_counter() - inicio) * 1000)
+            consultas.append(contador.total - antes)
+            if isinstance(resultado, dict) and resultado.get("success") is False:
+                errores += 1
+
+    latencias.sort()
+    llamadas_hechas = len(latencias)
+    return {
+        "llamadas": llamadas_hechas,
+        "errores": errores,
+        "total_s": round(sum(latencias) / 1000, 4),
+        "latencia_ms": {
+            "media": round(sum(latencias) / llamadas_hechas, 4) if llamadas_hechas else 0.0,
+            "p50": round(percentil(latencias, 50), 4),
+            "p90": round(percentil(latencias, 90), 4),
+            "p99": round(percentil(latencias, 99), 4),
+            "max": round(latencias[-1], 4) if latencias else 0.0,
+        },
+        "consultas": {
+            "total": sum(consultas),
+            "por_llamada": round(sum(consultas) / llamadas_hechas, 2) if llamadas_hechas else 0.0,
+            "max": max(consultas, default=0),
+        },
+    }
+
+
+def _commit_actual() -> Optional[str]:
+    try:
+        salida = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return salida.stdout.strip() or None
+
+
+def ejecutar_benchmark(
+    tamanos: Iterable[int] = TAMANOS_POR_DEFECTO,
+    vehiculos: int = 200,
+    semilla: int = 0,
+    escenarios: Optional[Iterable[str]] = None,
+    silenciar_logs: bool = True,
+) -> Dict[str, Any]:
+    """
+    Siembra la flota, mide cada escenario con cada tamaño y deshace todo.
+
+    Antes de cada medición se hace una llamada de calentamiento no medida
+    (carga del catálogo de extras, cachés de consultas, etc.).
+
+    Returns:
+        Informe serializable a JSON
+    """
+    tamanos = sorted(set(tamanos))
+    escenarios = list(escenarios or ESCENARIOS)
+    informe: Dict[str, Any] = {
+        "version": VERSION_INFORME,
+        "fecha": timezone.now().isoformat(),
+        "commit": _commit_actual(),
+        "entorno": {
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "bd": connection.vendor,
+        },
+        "parametros": {"tamanos": tamanos, "vehiculos": vehiculos, "semilla": semilla},
+        "escenarios": {},
+    }
+
+    # Los servicios registran cada cálculo a nivel INFO: con 10.000 llamadas
+    # el coste del logging taparía el del cálculo
+    if silenciar_logs:
+        logging.disable(logging.WARNING)
+    try:
+        with transaction.atomic():
+            datos = sembrar_flota(vehiculos, semilla)
+            peticiones = generar_peticiones(datos, max(tamanos) + 1, semilla)
+            if "calcular_precio_total" in escenarios:
+                sembrar_reservas(datos, min(max(tamanos) + 1, MAX_RESERVAS_GUARDADAS), semilla)
+
+            for nombre in escenarios:
+                llamadas = ESCENARIOS[nombre]
+                resultados = {}
+                for tamano in tamanos:
+                    # Calentamiento con la última petición, que nunca se mide
+                    medir(llamadas(datos, peticiones[-1:]))
+                    resultados[str(tamano)] = medir(llamadas(datos, peticiones[:tamano]))
+                informe["escenarios"][nombre] = resultados
+
+            transaction.set_rollback(True)
+    finally:
+        if silenciar_logs:
+            logging.disable(logging.NOTSET)
+
+    return informe
+
+
+def comparar_informes(
+    actual: Dict[str, Any], base: Dict[str, Any], tolerancia: float = 0.2
+) -> List[str]:
+    """
+    Regresiones de `actual` respecto a `base` para los escenarios y tamaños
+    presentes en ambos: p50 o p90 más de `tolerancia` por encima (solo con
+    al menos MIN_LLAMADAS_COMPARABLES llamadas), o más consultas por llamada
+    (las consultas son deterministas: sin tolerancia).
+    """
+    regresiones = []
+    for nombre, resultados in actual.get("escenarios", {}).items():
+        for tamano, medida in resultados.items():
+            anterior = base.get("escenarios", {}).get(nombre, {}).get(tamano)
+            if not anterior:
+                continue
+            etiqueta = f"{nombre} x{tamano}"
+            comparables = min(medida["llamadas"], anterior["llamadas"]) >= MIN_LLAMADAS_COMPARABLES
+            for clave in ("p50", "p90") if comparables else ():
+                ahora, antes = medida["latencia_ms"][clave], anterior["latencia_ms"][clave]
+                if antes and ahora > antes * (1 + tolerancia):
+                    regresiones.append(
+                        f"{etiqueta}: latencia {clave} {antes:.3f} -> {ahora:.3f} ms "
+                        f"(+{(ahora / antes - 1) * 100:.0f}%)"
+                    )
+            ahora, antes = medida["consultas"]["por_llamada"], anterior["consultas"]["por_llamada"]
+            if ahora > antes:
+                regresiones.append(f"{etiqueta}: consultas por llamada {antes} -> {ahora}")
+    return regresiones
@@ -0,0 +1,70 @@
+# reservas/extras.py
+"""
+Catálogo de extras en memoria
+
+La tabla de extras es pequeña y se consulta en cada cálculo de precio. Se
+carga completa con un `in_bulk()` y se guarda en el proceso; una versión en
+la caché compartida (incrementada por las señales de Extras al confirmar la
+transacción) indica a todos los procesos cuándo recargarla. Tarificar una
+reserva con varios extras no añade consultas mientras la versión no cambie.
+"""
+import logging
+import threading
+from typing import TYPE_CHECKING, Dict, Iterable, Optional
+
+from django.core.cache import cache
+from utils.cache_versiones import incrementar_version
+
+if TYPE_CHECKING:
+    from .models import Extras
+
+logger = logging.getLogger(__name__)
+
+CLAVE_VERSION = "reservas:extras:version"
+
+_lock = threading.Lock()
+_catalogo: Optional[Dict[int, "Extras"]] = None
+_version_catalogo: Optional[int] = None
+
+
+def version_catalogo() -> Optional[int]:
+    """Versión vigente del catálogo; None si no se puede leer la caché"""
+    try:
+        return cache.get(CLAVE_VERSION, 0)
+    except Exception as e:
+        logger.warning(f"Error leyendo la versión del catálogo de extras: {str(e)}")
+        return None
+
+
+def invalidar_catalogo() -> None:
+    """Obliga a todos los procesos a recargar el catálogo en su próxima lectura"""
+    global _catalogo
+    _catalogo = None
+    try:
+        incrementar_version(CLAVE_VERSION)
+    except Exception as e:
+        logger.warning(f"Error invalidando el catálogo de extras: {str(e)}")
+
+
+def obtener_catalogo() -> Dict[int, "Extras"]:
+    """{extra_id: Extras} del proceso, recargado si los extras han cambiado"""
+    global _catalogo, _version_catalogo
+    from .models import Extras
+
+    version = version_catalogo()
+    catalogo = _catalogo
+    if catalogo is not None and version is not None and version == _version_catalogo:
+        return catalogo
+
+    with _lock:
+        if _catalogo is None or version is None or version != _version_catalogo:
+            _catalogo = Extras.objects.in_bulk()
+            _version_catalogo = version
+            logger.info(f"Catálogo de extras cargado: {len(_catalogo)} extras")
+        return _catalogo
+
+
+def extras_por_id(ids: Iterable[int]) -> Dict[int, "Extras"]:
+    """Extras existentes de entre los IDs pedidos, sin consultar la BD"""
+    catalogo = obtener_catalogo()
+    return {extra_id: catalogo[extra_id] for extra_id in ids if extra_id in catalogo}
@@ -0,0 +1,116 @@
+# reservas/management/commands/benchmark_precios.py
+"""
+Comando para medir latencia y consultas del motor de precios (ver reservas/benchmark.py)
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from reservas.benchmark import (ESCENARIOS, TAMANOS_POR_DEFECTO,
+                                comparar_informes, ejecutar_benchmark)
+
+
+class Command(BaseCommand):
+    help = (
+        "Siembra una flota sintética (dentro de una transacción que se deshace) y mide "
+        "latencia por percentiles y consultas de los cálculos de precio. Genera un informe "
+        "JSON comparable entre commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--tamanos",
+            type=lambda valor: [int(parte) for parte in valor.split(",") if parte],
+            default=list(TAMANOS_POR_DEFECTO),
+            help="Presupuestos por medición, separados por comas (default: 1,100,10000)",
+        )
+        parser.add_argument(
+            "--vehiculos",
+            type=int,
+            default=200,
+            help="Vehículos de la flota sintética (default: 200)",
+        )
+        parser.add_argument(
+            "--semilla",
+            type=int,
+            default=0,
+            help="Semilla de los datos y peticiones aleatorios (default: 0)",
+        )
+        parser.add_argument(
+            "--escenario",
+            action="append",
+            choices=sorted(ESCENARIOS),
+            help="Escenario a medir (repetible; por defecto todos)",
+        )
+        parser.add_argument(
+            "--salida",
+            help="Fichero donde guardar el informe JSON (por defecto se imprime)",
+        )
+        parser.add_argument(
+            "--comparar",
+            help="Informe JSON de referencia: falla si hay regresiones",
+        )
+        parser.add_argument(
+            "--tolerancia",
+            type=float,
+            default=0.2,
+            help="Empeoramiento de latencia admitido al comparar (default: 0.2 = 20%%)",
+        )
+        parser.add_argument(
+            "--con-logs",
+            action="store_true",
+            help="No silenciar el logging de los servicios durante la medición",
+        )
+
+    def handle(self, *args, **options):
+        if options["vehiculos"] < 1 or not options["tamanos"] or min(options["tamanos"]) < 1:
+            raise CommandError("--vehiculos y --tamanos deben ser positivos")
+
+        self.stdout.write(
+            self.style.SUCCESS("⏱️ Ejecutando benchmark de precios...")
+        )
+
+        informe = ejecutar_benchmark(
+            tamanos=options["tamanos"],
+            vehiculos=options["vehiculos"],
+            semilla=options["semilla"],
+            escenarios=options["escenario"],
+            silenciar_logs=not options["con_logs"],
+        )
+
+        for nombre, resultados in informe["escenarios"].items():
+            for tamano, medida in resultados.items():
+                latencia = medida["latencia_ms"]
+                self.stdout.write(
+                    f"📋 {nombre} x{tamano}: p50 {latencia['p50']:.3f} ms, "
+                    f"p90 {latencia['p90']:.3f} ms, p99 {latencia['p99']:.3f} ms, "
+                    f"{medida['consultas']['por_llamada']} consultas/llamada, "
+                    f"{medida['errores']} errores"
+                )
+
+        contenido = json.dumps(informe, indent=2, ensure_ascii=False)
+        if options["salida"]:
+            with open(options["salida"], "w", encoding="utf-8") as fichero:
+                fichero.write(contenido + "\n")
+            self.stdout.write(
+                self.style.SUCCESS(f"✅ Informe guardado en {options['salida']}")
+            )
+        else:
+            self.stdout.write(contenido)
+
+        if options["comparar"]:
+            try:
+                with open(options["comparar"], encoding="utf-8") as fichero:
+                    base = json.load(fichero)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"No se pudo leer el informe de referencia: {e}") from e
+
+            regresiones = comparar_informes(informe, base, options["tolerancia"])
+            if regresiones:
+                for regresion in regresiones:
+                    self.stdout.write(self.style.ERROR(f"❌ {regresion}"))
+                raise CommandError(
+                    f"{len(regresiones)} regresiones respecto a {base.get('commit') or options['comparar']}"
+                )
+            self.stdout.write(
+                self.style.SUCCESS("✅ Sin regresiones respecto al informe de referencia")
+            )
@@ -0,0 +1,73 @@
+# Restricción de exclusión: un vehículo no puede tener dos reservas activas solapadas
+
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations
+
+RESTRICCION = "reserva_sin_solapes_vehiculo"
+
+# Debe coincidir con Reserva.ESTADOS_ACTIVOS (lo comprueba reservas/tests.py)
+ESTADOS_ACTIVOS = ("pendiente", "confirmada")
+
+MAX_SOLAPES_MOSTRADOS = 20
+
+
+def _solapes(cursor, estados):
+    """Pares de reservas activas del mismo vehículo que ya se solapan"""
+    marcadores = ", ".join(["%s"] * len(estados))
+    cursor.execute(
+        "SELECT a.id, b.id, a.vehiculo_id FROM reserva a "
+        "JOIN reserva b ON b.vehiculo_id = a.vehiculo_id AND b.id > a.id "
+        f"WHERE a.estado IN ({marcadores}) AND b.estado IN ({marcadores}) "
+        "AND a.fecha_recogida < b.fecha_devolucion "
+        "AND b.fecha_recogida < a.fecha_devolucion "
+        f"ORDER BY a.id, b.id LIMIT {MAX_SOLAPES_MOSTRADOS}",
+        [*estados, *estados],
+    )
+    return cursor.fetchall()
+
+
+def crear_restriccion(apps, schema_editor):
+    """
+    PostgreSQL: EXCLUDE USING gist sobre (vehiculo_id, tstzrange) limitada a
+    los estados que ocupan el vehículo (btree_gist aporta el `=` sobre
+    vehiculo_id). Es la garantía principal contra reservas dobles, así que
+    la migración falla si ya hay solapes: hay que resolverlos y reintentarla.
+    En otros motores solo queda el bloqueo de fila de Reserva.save.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        solapes = _solapes(cursor, ESTADOS_ACTIVOS)
+    if solapes:
+        pares = ", ".join(
+            f"{a}/{b} (vehículo {vehiculo})" for a, b, vehiculo in solapes
+        )
+        raise RuntimeError(
+            f"No se puede crear {RESTRICCION}: hay reservas activas solapadas "
+            f"({pares}). Cancela o corrige las fechas de esas reservas y vuelve a "
+            "ejecutar la migración."
+        )
+    estados = ", ".join(f"'{estado}'" for estado in ESTADOS_ACTIVOS)
+    schema_editor.execute(
+        f"ALTER TABLE reserva ADD CONSTRAINT {RESTRICCION} EXCLUDE USING gist ("
+        "vehiculo_id WITH =, "
+        "tstzrange(fecha_recogida, fecha_devolucion, '[)') WITH &&"
+        f") WHERE (estado IN ({estados}))"
+    )
+
+
+def eliminar_restriccion(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"ALTER TABLE reserva DROP CONSTRAINT IF EXISTS {RESTRICCION}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("reservas", "0007_make_iva_nullable"),
+    ]
+
+    operations = [
+        BtreeGistExtension(),
+        migrations.RunPython(crear_restriccion, eliminar_restriccion),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.9 on 2026-10-17 02:04
+
+from django.db import migrations, models
+
+SECUENCIA = "reserva_numero_bloque_seq"
+
+
+def crear_secuencia(apps, schema_editor):
+    """PostgreSQL: secuencia de bloques (nextval no retrocede con un rollback)"""
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"CREATE SEQUENCE IF NOT EXISTS {SECUENCIA} START WITH 0 MINVALUE 0")
+
+
+def eliminar_secuencia(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(f"DROP SEQUENCE IF EXISTS {SECUENCIA}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0008_reserva_sin_solapes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SecuenciaNumeroReserva',
+            fields=[
+                ('nombre', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Nombre')),
+                ('siguiente_bloque', models.PositiveBigIntegerField(default=0, verbose_name='Siguiente bloque')),
+            ],
+            options={
+                'verbose_name': 'Secuencia de números de reserva',
+                'verbose_name_plural': 'Secuencias de números de reserva',
+                'db_table': 'secuencia_numero_reserva',
+            },
+        ),
+        migrations.RunPython(crear_secuencia, eliminar_secuencia),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.9 on 2026-10-17 02:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservas', '0009_secuencia_numero_reserva'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reserva',
+            name='desglose_precio',
+            field=models.JSONField(blank=True, editable=False, help_text='Desglose del presupuesto con el que se creó la reserva (base, extras, política, IVA); se muestra sin volver a tarificar', null=True, verbose_name='Desglose de precio'),
+        ),
+    ]
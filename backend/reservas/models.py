@@ -4,7 +4,8 @@ from decimal import Decimal
 
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Exists, OuterRef
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
@@ -12,6 +13,52 @@ from .services import ReservaService
 
 logger = logging.getLogger(__name__)
 
+# Restricción de exclusión de PostgreSQL sobre ESTADOS_ACTIVOS (migración 0008)
+RESTRICCION_SIN_SOLAPES = "reserva_sin_solapes_vehiculo"
+
+
+class ReservaQuerySet(models.QuerySet):
+    """Transiciones de estado en bloque (acciones masivas del admin)"""
+
+    def transicionar(self, nuevo_estado):
+        """
+        Pasa a `nuevo_estado` las reservas del queryset cuyo estado actual lo
+        permite (ver `Reserva.TRANSICIONES`); las demás se ignoran. Es un único
+        UPDATE: sin full_clean, sin recalcular precios y sin señales por fila.
+
+        Returns:
+            Número de reservas actualizadas
+        """
+        origenes = [
+            estado for estado, destinos in Reserva.TRANSICIONES.items() if nuevo_estado in destinos
+        ]
+        actualizadas = self.filter(estado__in=origenes).update(
+            estado=nuevo_estado, updated_at=timezone.now()
+        )
+        if actualizadas:
+            # Lazy import: signals importa este módulo
+            from .signals import estado_cambiado
+
+            estado_cambiado.send(sender=Reserva, reservas=None, estado=nuevo_estado)
+            logger.info(f"{actualizadas} reservas pasadas a '{nuevo_estado}'")
+        return actualizadas
+
+    def confirmar(self):
+        """Confirma las pendientes que no se solapan con otra reserva activa del vehículo"""
+        conflicto = (
+            Reserva.objects.filter(
+                vehiculo_id=OuterRef("vehiculo_id"),
+                estado__in=Reserva.ESTADOS_ACTIVOS,
+                fecha_recogida__lt=OuterRef("fecha_devolucion"),
+                fecha_devolucion__gt=OuterRef("fecha_recogida"),
+            )
+            .exclude(pk=OuterRef("pk"))
+        )
+        return self.filter(~Exists(conflicto)).transicionar("confirmada")
+
+    def cancelar(self):
+        return self.transicionar("cancelada")
+
 
 class Reserva(models.Model):
     ESTADO_CHOICES = [
@@ -20,6 +67,16 @@ class Reserva(models.Model):
         ("cancelada", _("Cancelada")),
     ]
 
+    # Estados destino permitidos desde cada estado
+    TRANSICIONES = {
+        "pendiente": ("confirmada", "cancelada"),
+        "confirmada": ("cancelada",),
+        "cancelada": (),
+    }
+
+    # Estados que ocupan el vehículo
+    ESTADOS_ACTIVOS = ("pendiente", "confirmada")
+
     METODO_PAGO_CHOICES = [
         ("tarjeta", _("Tarjeta")),
         ("efectivo", _("Efectivo")),
@@ -117,6 +174,16 @@ class Reserva(models.Model):
         null=False,
         validators=[MinValueValidator(Decimal("0.01"))],
     )
+    desglose_precio = models.JSONField(
+        _("Desglose de precio"),
+        null=True,
+        blank=True,
+        editable=False,
+        help_text=_(
+            "Desglose del presupuesto con el que se creó la reserva (base, extras, "
+            "política, IVA); se muestra sin volver a tarificar"
+        ),
+    )
 
     # Métodos de pago
     metodo_pago = models.CharField(
@@ -168,6 +235,8 @@ class Reserva(models.Model):
     created_at = models.DateTimeField(default=timezone.now, editable=False)
     updated_at = models.DateTimeField(default=timezone.now)
 
+    objects = ReservaQuerySet.as_manager()
+
     class Meta:
         db_table = "reserva"
         verbose_name = _("Reserva")
@@ -212,11 +281,24 @@ class Reserva(models.Model):
                 logger.error(f"Error generando número de reserva: {str(e)}")
                 # Continuamos sin número, se puede generar manualmente
         
-        # Validar antes de guardar
-        self.full_clean()
-        
-        # GUARDAR UNA SOLA VEZ - Después de todas las operaciones preparatorias
-        super().save(*args, **kwargs)
+        with transaction.atomic():
+            # Bloquea la fila del vehículo hasta el commit: dos reservas
+            # simultáneas del mismo vehículo no pueden pasar ambas la
+            # comprobación de disponibilidad; las de otros vehículos no esperan
+            self._bloquear_vehiculo()
+
+            # Validar antes de guardar
+            self.full_clean()
+
+            # GUARDAR UNA SOLA VEZ - Después de todas las operaciones preparatorias
+            try:
+                super().save(*args, **kwargs)
+            except IntegrityError as e:
+                if RESTRICCION_SIN_SOLAPES not in str(e):
+                    raise
+                raise ValidationError({
+                    "vehiculo": "El vehículo no está disponible para las fechas seleccionadas"
+                }) from e
         
         # Operaciones post-save (solo logging, sin saves adicionales)
         if is_new:
@@ -233,6 +315,18 @@ class Reserva(models.Model):
                 except Exception as e:
                     logger.error(f"Error generando número de reserva post-save: {str(e)}")
 
+    def _bloquear_vehiculo(self):
+        """SELECT ... FOR UPDATE sobre el vehículo si la reserva lo ocupa"""
+        if not self.vehiculo_id or self.estado not in self.ESTADOS_ACTIVOS:
+            return
+        from vehiculos.models import Vehiculo
+
+        list(
+            Vehiculo.objects.select_for_update()
+            .filter(pk=self.vehiculo_id)
+            .values_list("pk", flat=True)
+        )
+
     def summary(self):
         return {
             "id": self.pk,
@@ -254,6 +348,49 @@ class Reserva(models.Model):
             "updated_at": self.updated_at,
         }
 
+    def puede_pasar_a(self, nuevo_estado):
+        return nuevo_estado in self.TRANSICIONES.get(self.estado, ())
+
+    def transicionar(self, nuevo_estado):
+        """
+        Cambia el estado con un UPDATE condicional (`WHERE estado=<actual>`)
+        que solo escribe estado y updated_at: sin full_clean ni recálculo de
+        precio.
+
+        Raises:
+            ValidationError: Si la transición no está permitida o la reserva
+                cambió de estado desde que se leyó
+        """
+        if not self.puede_pasar_a(nuevo_estado):
+            raise ValidationError({
+                "estado": f"No se puede pasar una reserva {self.estado} a {nuevo_estado}"
+            })
+
+        ahora = timezone.now()
+        actualizadas = Reserva.objects.filter(pk=self.pk, estado=self.estado).update(
+            estado=nuevo_estado, updated_at=ahora
+        )
+        if not actualizadas:
+            raise ValidationError({
+                "estado": "La reserva ha cambiado de estado mientras se procesaba"
+            })
+
+        estado_anterior = self.estado
+        self.estado = nuevo_estado
+        self.updated_at = ahora
+
+        # Lazy import: signals importa este módulo
+        from .signals import estado_cambiado
+
+        estado_cambiado.send(sender=Reserva, reservas=[self], estado=nuevo_estado)
+        logger.info(f"Reserva {self.pk}: {estado_anterior} -> {nuevo_estado}")
+
+    def confirmar(self):
+        self.transicionar("confirmada")
+
+    def cancelar(self):
+        self.transicionar("cancelada")
+
     def dias_alquiler(self):
         """Calcula los días de alquiler"""
         if self.fecha_recogida and self.fecha_devolucion:
@@ -303,7 +440,7 @@ class Reserva(models.Model):
             return False
 
         reservas_conflicto = Reserva.objects.filter(
-            vehiculo=self.vehiculo, estado__in=["confirmada", "pendiente"]
+            vehiculo=self.vehiculo, estado__in=self.ESTADOS_ACTIVOS
         ).filter(
             fecha_recogida__lt=self.fecha_devolucion,
             fecha_devolucion__gt=self.fecha_recogida,
@@ -542,3 +679,21 @@ class ReservaExtra(models.Model):
 
     def __str__(self):
         return f"{self.extra.nombre} x{self.cantidad} ({self.reserva})"
+
+
+class SecuenciaNumeroReserva(models.Model):
+    """
+    Contador de bloques de números de reserva (ver numeros.py) para motores
+    sin secuencias. En PostgreSQL se usa la secuencia reserva_numero_bloque_seq.
+    """
+
+    nombre = models.CharField(_("Nombre"), max_length=50, primary_key=True)
+    siguiente_bloque = models.PositiveBigIntegerField(_("Siguiente bloque"), default=0)
+
+    class Meta:
+        verbose_name = _("Secuencia de números de reserva")
+        verbose_name_plural = _("Secuencias de números de reserva")
+        db_table = "secuencia_numero_reserva"
+
+    def __str__(self):
+        return f"{self.nombre}: {self.siguiente_bloque}"
@@ -0,0 +1,180 @@
+# reservas/numeros.py
+"""
+Generación de números de reserva por bloques (hi/lo)
+
+Cada proceso reserva un bloque de TAMANO_BLOQUE números consecutivos de un
+contador compartido (secuencia de PostgreSQL o, en otros motores, la fila de
+SecuenciaNumeroReserva) y los reparte sin consultar la BD. El contador nunca
+entrega dos veces el mismo bloque, así que dos procesos no pueden generar el
+mismo número.
+
+En PostgreSQL nextval no se deshace con un rollback. En los demás motores el
+incremento de la fila contador forma parte de la transacción del llamante:
+si se reserva dentro de una transacción, el resto del bloque solo se guarda
+en el proceso cuando esa transacción se confirma (on_commit). Si se deshace,
+el bloque vuelve al contador y el proceso no se queda con sus códigos.
+
+Cada número se convierte en el código de 6 dígitos (M4Y123456) con una
+permutación de [0, 10^6): una red de Feistel de 4 rondas sobre dos mitades de
+3 dígitos, con la función de ronda derivada de NUMERO_RESERVA_CLAVE. Es
+biyectiva por construcción (códigos distintos para números distintos) y los
+códigos consecutivos no parecen correlativos.
+
+Al reservar cada bloque se descartan, con una sola consulta, los códigos que
+ya usen reservas antiguas (números aleatorios anteriores a este generador).
+"""
+import hashlib
+import hmac
+import logging
+import os
+import threading
+from typing import List, Optional
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+PREFIJO = "M4Y"
+DIGITOS = 6
+MITAD = 1000  # Cada mitad de la red de Feistel: 3 dígitos
+ESPACIO = MITAD * MITAD
+RONDAS = 4
+
+# Fijo: cambiarlo movería los rangos de los bloques ya entregados
+TAMANO_BLOQUE = 50
+
+SECUENCIA = "reserva_numero_bloque_seq"
+NOMBRE_CONTADOR = "numero_reserva"
+
+
+# === PERMUTACIÓN ===
+
+
+def _tabla_rondas() -> List[List[int]]:
+    """F(ronda, mitad) precalculada: RONDAS x MITAD HMAC en el primer uso"""
+    clave = getattr(settings, "NUMERO_RESERVA_CLAVE", settings.SECRET_KEY).encode("utf-8")
+    return [
+        [
+            int.from_bytes(
+                hmac.new(clave, f"{ronda}:{valor}".encode(), hashlib.sha256).digest()[:4], "big"
+            ) % MITAD
+            for valor in range(MITAD)
+        ]
+        for ronda in range(RONDAS)
+    ]
+
+
+_tabla: Optional[List[List[int]]] = None
+
+
+def _rondas() -> List[List[int]]:
+    global _tabla
+    if _tabla is None:
+        _tabla = _tabla_rondas()
+    return _tabla
+
+
+def permutar(numero: int) -> int:
+    """Imagen de `numero` en [0, ESPACIO) por la red de Feistel"""
+    izquierda, derecha = divmod(numero, MITAD)
+    for tabla in _rondas():
+        izquierda, derecha = derecha, (izquierda + tabla[derecha]) % MITAD
+    return izquierda * MITAD + derecha
+
+
+def despermutar(codigo: int) -> int:
+    """Inversa de `permutar`"""
+    izquierda, derecha = divmod(codigo, MITAD)
+    for tabla in reversed(_rondas()):
+        izquierda, derecha = (derecha - tabla[izquierda]) % MITAD, izquierda
+    return izquierda * MITAD + derecha
+
+
+def formatear(numero: int) -> str:
+    return f"{PREFIJO}{permutar(numero):0{DIGITOS}d}"
+
+
+# === BLOQUES ===
+
+
+def _siguiente_bloque() -> int:
+    """Índice de un bloque que ningún otro proceso ha recibido"""
+    if connection.vendor == "postgresql":
+        # Fuera del control transaccional: un rollback no devuelve el bloque
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT nextval(%s)", [SECUENCIA])
+            return cursor.fetchone()[0]
+
+    # Sin secuencias: fila contador bloqueada. Dentro de una transacción del
+    # llamante el incremento se deshace con ella (ver _bloque_duradero)
+    from .models import SecuenciaNumeroReserva
+
+    with transaction.atomic():
+        contador, _ = SecuenciaNumeroReserva.objects.select_for_update().get_or_create(
+            nombre=NOMBRE_CONTADOR
+        )
+        bloque = contador.siguiente_bloque
+        SecuenciaNumeroReserva.objects.filter(pk=contador.pk).update(
+            siguiente_bloque=F("siguiente_bloque") + 1
+        )
+    return bloque
+
+
+def _bloque_duradero() -> bool:
+    """Si el bloque recién reservado ya no puede volver al contador"""
+    return connection.vendor == "postgresql" or connection.get_autocommit()
+
+
+class GeneradorNumerosReserva:
+    """Reparte los códigos del bloque reservado por el proceso; seguro entre hilos"""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pendientes: List[str] = []
+        self._pid: Optional[int] = None
+
+    def siguiente(self) -> str:
+        with self._lock:
+            # Un proceso hijo (fork) no hereda el bloque del padre
+            if self._pid != os.getpid():
+                self._pendientes, self._pid = [], os.getpid()
+            while not self._pendientes:
+                codigos = self._reservar_bloque()
+                if _bloque_duradero():
+                    self._pendientes = codigos
+                elif codigos:
+                    # El resto del bloque solo es de este proceso si el
+                    # incremento del contador llega a confirmarse
+                    codigo = codigos.pop()
+                    transaction.on_commit(lambda resto=codigos: self._guardar(resto))
+                    return codigo
+            return self._pendientes.pop()
+
+    def _guardar(self, codigos: List[str]) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                self._pendientes.extend(codigos)
+
+    def _reservar_bloque(self) -> List[str]:
+        from .models import Reserva
+
+        bloque = _siguiente_bloque()
+        inicio = bloque * TAMANO_BLOQUE
+        if inicio >= ESPACIO:
+            raise ValidationError("Se ha agotado el espacio de números de reserva")
+
+        codigos = [formatear(numero) for numero in range(inicio, min(inicio + TAMANO_BLOQUE, ESPACIO))]
+        usados = set(
+            Reserva.objects.filter(numero_reserva__in=codigos).values_list("numero_reserva", flat=True)
+        )
+        if usados:
+            logger.info(f"Bloque {bloque}: {len(usados)} códigos ya usados por reservas anteriores")
+        logger.info(f"Bloque de números de reserva {bloque} asignado al proceso {os.getpid()}")
+        # pop() toma del final: invertir para repartir en orden de número
+        return [codigo for codigo in reversed(codigos) if codigo not in usados]
+
+
+generador_numeros = GeneradorNumerosReserva()
@@ -0,0 +1,105 @@
+# reservas/presupuestos.py
+"""
+Presupuestos firmados
+
+`calcular_precio` devuelve, junto al precio, un token firmado (HMAC con
+SECRET_KEY, vía django.core.signing) y con caducidad que contiene las
+entradas del cálculo y su resultado. Al crear la reserva, si el token es
+válido y sus entradas coinciden con las de la reserva, se usa su precio en
+lugar de volver a tarificar; cualquier modificación del token invalida la
+firma.
+"""
+import logging
+from datetime import datetime, timezone as dt_timezone
+from typing import Any, Dict, Iterable, Optional
+
+from django.conf import settings
+from django.core import signing
+
+logger = logging.getLogger(__name__)
+
+SALT_PRESUPUESTO = "reservas.presupuesto"
+
+
+def vigencia_presupuesto() -> int:
+    """Segundos durante los que se respeta un presupuesto"""
+    return getattr(settings, "PRESUPUESTO_TOKEN_VIGENCIA", 30 * 60)
+
+
+def _id(valor: Any) -> Optional[int]:
+    valor = getattr(valor, "pk", valor)
+    return int(valor) if valor else None
+
+
+def _instante(fecha: datetime) -> str:
+    return fecha.astimezone(dt_timezone.utc).isoformat()
+
+
+def entradas_presupuesto(
+    vehiculo: Any,
+    fecha_recogida: datetime,
+    fecha_devolucion: datetime,
+    politica_pago: Any,
+    extras: Iterable[Any],
+) -> Dict[str, Any]:
+    """
+    Forma canónica de las entradas de un cálculo de precio, comparable entre
+    la petición de presupuesto y la de creación de la reserva.
+
+    Args:
+        vehiculo, politica_pago: Instancias o IDs
+        extras: [{"extra_id"|"id", "cantidad"}] o IDs
+    """
+    cantidades: Dict[int, int] = {}
+    for extra in extras or []:
+        if isinstance(extra, dict):
+            extra_id, cantidad = _id(extra.get("extra_id") or extra.get("id")), int(extra.get("cantidad", 1))
+        else:
+            extra_id, cantidad = _id(extra), 1
+        if extra_id:
+            cantidades[extra_id] = cantidades.get(extra_id, 0) + cantidad
+
+    return {
+        "vehiculo": _id(vehiculo),
+        "recogida": _instante(fecha_recogida),
+        "devolucion": _instante(fecha_devolucion),
+        "politica": _id(politica_pago),
+        "extras": sorted(cantidades.items()),
+    }
+
+
+def firmar_presupuesto(entradas: Dict[str, Any], resultado: Dict[str, Any]) -> str:
+    """Token firmado con las entradas y el precio calculado"""
+    return signing.dumps(
+        {
+            "entradas": entradas,
+            "precio_total": resultado["precio_total"],
+            "desglose": resultado["desglose"],
+        },
+        salt=SALT_PRESUPUESTO,
+        compress=True,
+    )
+
+
+def verificar_presupuesto(token: str, entradas: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Contenido del token si la firma es válida, no ha caducado y corresponde a
+    las mismas entradas; None en otro caso.
+    """
+    if not token:
+        return None
+    try:
+        contenido = signing.loads(token, salt=SALT_PRESUPUESTO, max_age=vigencia_presupuesto())
+    except signing.SignatureExpired:
+        logger.info("Presupuesto caducado, se recalculará el precio")
+        return None
+    except signing.BadSignature:
+        logger.warning("Token de presupuesto con firma no válida")
+        return None
+
+    # JSON convierte las tuplas de extras en listas
+    firmadas = {**contenido["entradas"], "extras": [tuple(extra) for extra in contenido["entradas"]["extras"]]}
+    if firmadas != entradas:
+        logger.warning("El presupuesto no corresponde a los datos de la reserva")
+        return None
+    return contenido
@@ -1,7 +1,11 @@
 # reservas/serializers.py
 import logging
+from decimal import Decimal
+from functools import reduce
+from operator import or_
 
 from django.conf import settings
+from django.db.models import Q
 from lugares.models import Direccion
 from lugares.serializers import LugarSerializer
 from politicas.serializers import PoliticaPagoSerializer, PromocionSerializer
@@ -228,7 +232,7 @@ class ReservaDetailSerializer(ReservaSerializer):
             'vehiculo_detail', 'lugar_recogida_detail', 'lugar_devolucion_detail',
             'politica_pago_detail', 'usuario_detail', 'extras_detail', 'conductores_detail',
             'penalizaciones_detail', 'notas_internas',
-            'precio_base', 'precio_extras', 'tarifa_politica',
+            'precio_base', 'precio_extras', 'tarifa_politica', 'desglose_precio',
             'importe_pagado_inicial', 'importe_pendiente_inicial', 'dias_alquiler'
         ]
     
@@ -258,24 +262,36 @@ class ReservaDetailSerializer(ReservaSerializer):
     
     def get_precio_base(self, obj):
         """Precio del vehículo (ya incluye IVA)"""
-        if obj.vehiculo and obj.fecha_recogida and obj.fecha_devolucion:
-            dias = self.get_dias_alquiler(obj)
-            precio_dia = obj.vehiculo.precio_dia_actual or 0
-            return float(precio_dia * dias)
+        if obj.desglose_precio:
+            return obj.desglose_precio["precio_base"]
+        # Reservas sin desglose guardado: precio por día reservado, no el de hoy
+        if obj.precio_dia and obj.fecha_recogida and obj.fecha_devolucion:
+            return float(obj.precio_dia * self.get_dias_alquiler(obj))
         return 0.0
     
     def get_precio_extras(self, obj):
         """Precio total de extras (ya incluye IVA)"""
+        if obj.desglose_precio:
+            return obj.desglose_precio["precio_extras"]
+
         from decimal import Decimal
+        from .extras import extras_por_id
+
         total_extras = Decimal('0.00')
         dias = self.get_dias_alquiler(obj)
-        for reserva_extra in obj.extras.all():
-            if reserva_extra.extra and reserva_extra.extra.precio:
-                total_extras += reserva_extra.extra.precio * reserva_extra.cantidad * dias
+        reserva_extras = obj.extras.all()
+        # Precios desde el catálogo en memoria: sin cargar cada extra
+        catalogo = extras_por_id(reserva_extra.extra_id for reserva_extra in reserva_extras)
+        for reserva_extra in reserva_extras:
+            extra = catalogo.get(reserva_extra.extra_id)
+            if extra and extra.precio:
+                total_extras += extra.precio * reserva_extra.cantidad * dias
         return float(total_extras)
     
     def get_tarifa_politica(self, obj):
         """Tarifa de la política de pago (ya incluye IVA)"""
+        if obj.desglose_precio:
+            return obj.desglose_precio["tarifa_politica"]
         if obj.politica_pago and obj.fecha_recogida and obj.fecha_devolucion:
             dias = self.get_dias_alquiler(obj)
             if obj.politica_pago.tarifa:
@@ -300,6 +316,8 @@ class ReservaCreateSerializer(serializers.ModelSerializer):
         child=serializers.DictField(), write_only=True, required=True
     )
     usuario = serializers.IntegerField(required=False, allow_null=True)
+    # Token devuelto por calcular_precio: si es válido se usa su precio sin recalcular
+    token_presupuesto = serializers.CharField(write_only=True, required=False, allow_blank=True)
 
     class Meta:
         model = Reserva
@@ -322,6 +340,7 @@ class ReservaCreateSerializer(serializers.ModelSerializer):
             "importe_pendiente_extra",
             "extras",
             "conductores",
+            "token_presupuesto",
         ]
 
     def to_internal_value(self, data):
@@ -431,6 +450,11 @@ class ReservaCreateSerializer(serializers.ModelSerializer):
             except Usuario.DoesNotExist:
                 raise serializers.ValidationError("Usuario no encontrado")
 
+        # Precio del presupuesto firmado o, si no es válido, recalculado
+        token_presupuesto = validated_data.pop("token_presupuesto", None)
+        if token_presupuesto is not None:
+            self._aplicar_presupuesto(validated_data, extras_data, token_presupuesto)
+
         # Calcular importes según método de pago
         if validated_data.get("metodo_pago") == "tarjeta":
             validated_data["importe_pagado_inicial"] = validated_data.get(
@@ -443,12 +467,18 @@ class ReservaCreateSerializer(serializers.ModelSerializer):
                 "precio_total", 0
             )
 
+        # Usuarios de todos los conductores, existentes o nuevos, en lote
+        conductores_usuarios = self._resolver_conductores(conductores_data)
+
         # Crear o asignar usuario principal desde el conductor principal
         if not validated_data.get("usuario"):
             conductor_principal = self._find_conductor_principal(conductores_data)
             if conductor_principal:
-                usuario_principal = self._create_or_get_usuario(conductor_principal)
-                validated_data["usuario"] = usuario_principal
+                validated_data["usuario"] = next(
+                    usuario
+                    for conductor_data, usuario in zip(conductores_data, conductores_usuarios, strict=True)
+                    if conductor_data is conductor_principal
+                )
             else:
                 raise serializers.ValidationError("No se encontró conductor principal para crear usuario")
 
@@ -459,24 +489,81 @@ class ReservaCreateSerializer(serializers.ModelSerializer):
         reserva = Reserva.objects.create(**validated_data)
 
         # Crear extras
-        for extra in extras_data:
-            ReservaExtra.objects.create(
-                reserva=reserva,
-                extra_id=extra["extra_id"],
-                cantidad=extra.get("cantidad", 1),
-            )
+        ReservaExtra.objects.bulk_create(
+            [
+                ReservaExtra(
+                    reserva=reserva,
+                    extra_id=extra["extra_id"],
+                    cantidad=extra.get("cantidad", 1),
+                )
+                for extra in extras_data
+            ]
+        )
 
         # Crear conductores
-        for conductor_data in conductores_data:
-            conductor_usuario = self._create_or_get_usuario(conductor_data)
-            ReservaConductor.objects.create(
-                reserva=reserva,
-                conductor=conductor_usuario,
-                rol=conductor_data.get("rol", "principal"),
-            )
+        ReservaConductor.objects.bulk_create(
+            [
+                ReservaConductor(
+                    reserva=reserva,
+                    conductor=conductor_usuario,
+                    rol=conductor_data.get("rol", "principal"),
+                )
+                for conductor_data, conductor_usuario in zip(conductores_data, conductores_usuarios, strict=True)
+            ]
+        )
 
         return reserva
 
+    def _calcular_presupuesto(self, validated_data, extras_data):
+        """Presupuesto calculado en el servidor para los datos de la reserva"""
+        from .services import ReservaService
+
+        politica_pago = validated_data.get("politica_pago")
+        return ReservaService().calcular_precio_reserva(
+            {
+                "vehiculo_id": validated_data["vehiculo"].id,
+                "fecha_recogida": validated_data["fecha_recogida"],
+                "fecha_devolucion": validated_data["fecha_devolucion"],
+                "politica_pago_id": politica_pago.id if politica_pago else None,
+                "extras": extras_data,
+            }
+        )
+
+    def _aplicar_presupuesto(self, validated_data, extras_data, token):
+        """
+        Fija precio_total, IVA y el desglose guardado desde el presupuesto
+        firmado si corresponde a los datos de la reserva; si no (caducado,
+        manipulado o de otras fechas/vehículo/extras), los recalcula en el
+        servidor.
+        """
+        from .presupuestos import entradas_presupuesto, verificar_presupuesto
+
+        presupuesto = verificar_presupuesto(
+            token,
+            entradas_presupuesto(
+                validated_data["vehiculo"],
+                validated_data["fecha_recogida"],
+                validated_data["fecha_devolucion"],
+                validated_data.get("politica_pago"),
+                extras_data,
+            ),
+        )
+        if presupuesto is None:
+            presupuesto = self._calcular_presupuesto(validated_data, extras_data)
+            if not presupuesto.get("success"):
+                raise serializers.ValidationError(
+                    {"precio_total": presupuesto.get("error", "No se pudo calcular el precio")}
+                )
+
+        desglose = presupuesto["desglose"]
+        validated_data["precio_total"] = Decimal(str(presupuesto["precio_total"]))
+        validated_data["iva"] = Decimal(str(desglose["iva_simbolico"]))
+        validated_data["desglose_precio"] = desglose
+        if not validated_data.get("precio_dia"):
+            validated_data["precio_dia"] = (
+                Decimal(str(desglose["precio_base"])) / desglose["dias"]
+            ).quantize(Decimal("0.01"))
+
     def _find_conductor_principal(self, conductores_data):
         """Encuentra el conductor principal en los datos"""
         for conductor in conductores_data:
@@ -485,68 +572,103 @@ class ReservaCreateSerializer(serializers.ModelSerializer):
         # Si no hay rol especificado, tomar el primero
         return conductores_data[0] if conductores_data else None
 
-    def _create_or_get_usuario(self, conductor_data):
-        """Crea o obtiene un usuario basado en los datos del conductor"""
-        from lugares.models import Direccion
-        
-        email = conductor_data.get("email")
-        numero_documento = conductor_data.get("numero_documento")
-        
-        # Buscar usuario existente por email o documento
-        usuario = None
-        if email:
-            usuario = Usuario.objects.filter(email=email).first()
-        
-        if not usuario and numero_documento:
-            usuario = Usuario.objects.filter(numero_documento=numero_documento).first()
-            
-        # Si no existe, crear nuevo usuario
-        if not usuario:
-            usuario_data = {
-                "username": self._generate_username(conductor_data),
-                "email": email or "",
-                "first_name": conductor_data.get("nombre", ""),
-                "last_name": conductor_data.get("apellidos", ""),
-                "fecha_nacimiento": conductor_data.get("fecha_nacimiento"),
-                "sexo": conductor_data.get("sexo", "no_indicado"),
-                "nacionalidad": conductor_data.get("nacionalidad", ""),
-                "tipo_documento": conductor_data.get("tipo_documento", "dni"),
-                "numero_documento": numero_documento or "",
-                "telefono": conductor_data.get("telefono", ""),
-                "rol": "cliente",  # Por defecto cliente
-                "is_active": True,
-            }
-            
-            # Crear dirección si existe
-            direccion_data = conductor_data.get("direccion")
-            if direccion_data:
-                direccion = Direccion.objects.create(
-                    calle=direccion_data.get("calle", ""),
-                    ciudad=direccion_data.get("ciudad", ""),
-                    provincia=direccion_data.get("provincia", ""),
-                    pais=direccion_data.get("pais", "España"),
-                    codigo_postal=direccion_data.get("codigo_postal", ""),
-                )
-                usuario_data["direccion"] = direccion
-            
-            usuario = Usuario.objects.create(**usuario_data)
-            
-        return usuario
-
-    def _generate_username(self, conductor_data):
-        """Genera un username único basado en los datos del conductor"""
-        base_username = f"{conductor_data.get('nombre', 'user')}_{conductor_data.get('numero_documento', '')}"
-        base_username = base_username.lower().replace(" ", "_")
-        
-        from usuarios.models import Usuario
-        counter = 1
-        username = base_username
-        
-        while Usuario.objects.filter(username=username).exists():
-            username = f"{base_username}_{counter}"
-            counter += 1
-            
-        return username
+    def _resolver_conductores(self, conductores_data):
+        """
+        Usuario de cada conductor, en el mismo orden. Busca los existentes por
+        email o documento en una sola consulta (el email tiene preferencia) y
+        crea los que faltan, con sus direcciones, mediante bulk_create. Dos
+        conductores con el mismo email o documento comparten usuario.
+        """
+        emails = {c["email"] for c in conductores_data if c.get("email")}
+        documentos = {c["numero_documento"] for c in conductores_data if c.get("numero_documento")}
+
+        por_email, por_documento = {}, {}
+        if emails or documentos:
+            existentes = Usuario.objects.filter(
+                Q(email__in=emails) | Q(numero_documento__in=documentos)
+            ).order_by("pk")
+            for usuario in existentes:
+                por_email.setdefault(usuario.email, usuario)
+                por_documento.setdefault(usuario.numero_documento, usuario)
+
+        usuarios = []
+        nuevos = []
+        for conductor_data in conductores_data:
+            email = conductor_data.get("email")
+            numero_documento = conductor_data.get("numero_documento")
+            usuario = (email and por_email.get(email)) or (
+                numero_documento and por_documento.get(numero_documento)
+            )
+            if not usuario:
+                usuario = self._nuevo_usuario(conductor_data)
+                nuevos.append(usuario)
+                # Los conductores siguientes con el mismo email o documento lo reutilizan
+                if email:
+                    por_email[email] = usuario
+                if numero_documento:
+                    por_documento[numero_documento] = usuario
+            usuarios.append(usuario)
+
+        if nuevos:
+            self._asignar_usernames(nuevos)
+            # bulk_create de Usuario toma el id de cada dirección ya insertada
+            Direccion.objects.bulk_create([usuario.direccion for usuario in nuevos if usuario.direccion])
+            Usuario.objects.bulk_create(nuevos)
+            logger.info(f"Creados {len(nuevos)} usuarios desde los conductores de la reserva")
+
+        return usuarios
+
+    def _nuevo_usuario(self, conductor_data):
+        """Usuario (sin guardar) con los datos del conductor y su dirección"""
+        direccion = None
+        direccion_data = conductor_data.get("direccion")
+        if direccion_data:
+            direccion = Direccion(
+                calle=direccion_data.get("calle", ""),
+                ciudad=direccion_data.get("ciudad", ""),
+                provincia=direccion_data.get("provincia", ""),
+                pais=direccion_data.get("pais", "España"),
+                codigo_postal=direccion_data.get("codigo_postal", ""),
+            )
+            direccion.normalizar()
+
+        # Base del username; _asignar_usernames le añade un sufijo si está ocupado
+        username = f"{conductor_data.get('nombre', 'user')}_{conductor_data.get('numero_documento', '')}"
+
+        return Usuario(
+            username=username.lower().replace(" ", "_"),
+            email=conductor_data.get("email") or "",
+            first_name=conductor_data.get("nombre", ""),
+            last_name=conductor_data.get("apellidos", ""),
+            fecha_nacimiento=conductor_data.get("fecha_nacimiento"),
+            sexo=conductor_data.get("sexo", "no_indicado"),
+            nacionalidad=conductor_data.get("nacionalidad", ""),
+            tipo_documento=conductor_data.get("tipo_documento", "dni"),
+            numero_documento=conductor_data.get("numero_documento") or "",
+            telefono=conductor_data.get("telefono", ""),
+            rol="cliente",  # Por defecto cliente
+            is_active=True,
+            direccion=direccion,
+        )
+
+    def _asignar_usernames(self, usuarios):
+        """Usernames únicos (base, base_1, base_2...) con una sola consulta"""
+        bases = {usuario.username for usuario in usuarios}
+        ocupados = set(
+            Usuario.objects.filter(
+                reduce(or_, (Q(username__startswith=base) for base in bases))
+            ).values_list("username", flat=True)
+        )
+
+        for usuario in usuarios:
+            base_username = usuario.username
+            counter = 1
+            username = base_username
+            while username in ocupados:
+                username = f"{base_username}_{counter}"
+                counter += 1
+            usuario.username = username
+            ocupados.add(username)
 
 
 class ReservaUpdateSerializer(serializers.ModelSerializer):
@@ -554,6 +676,12 @@ class ReservaUpdateSerializer(serializers.ModelSerializer):
         child=serializers.DictField(), write_only=True, required=False
     )
 
+    # Campos que cambian el precio: si se editan, el desglose guardado deja de valer
+    CAMPOS_PRECIO = (
+        "vehiculo", "politica_pago", "promocion", "fecha_recogida",
+        "fecha_devolucion", "precio_dia", "precio_total",
+    )
+
     class Meta:
         model = Reserva
         fields = "__all__"
@@ -577,7 +705,15 @@ class ReservaUpdateSerializer(serializers.ModelSerializer):
                       'importe_pagado_extra', 'importe_pendiente_extra']:
             if field in validated_data:
                 validated_data[field] = round_currency(validated_data[field])
-        
+
+        # El detalle usaría el desglose de la creación: se descarta y se sirve
+        # el cálculo a partir de precio_dia
+        if extras_data is not None or any(
+            field in validated_data and validated_data[field] != getattr(instance, field)
+            for field in self.CAMPOS_PRECIO
+        ):
+            validated_data["desglose_precio"] = None
+
         instance = super().update(instance, validated_data)
         if extras_data is not None:
             instance.extras.all().delete()
@@ -25,8 +25,10 @@ class ReservaService:
             # Importaciones lazy para evitar problemas circulares
             from politicas.models import PoliticaPago
             from vehiculos.models import Vehiculo
+            from vehiculos.tarifas import precio_periodo
 
-            from .models import Extras
+            from .presupuestos import (entradas_presupuesto, firmar_presupuesto,
+                                       vigencia_presupuesto)
 
             # Mapear campos para compatibilidad
             vehiculo_id = data.get("vehiculo_id")
@@ -52,167 +54,342 @@ class ReservaService:
                     "error": f"Faltan datos requeridos: {', '.join(missing_fields)}",
                 }
 
-            # Convertir fechas y validar
-            from django.utils import timezone
-            from django.utils.dateparse import parse_date, parse_datetime
-
-            # Convertir fechas string a objetos datetime con zona horaria
-            if isinstance(fecha_recogida, str):
-                # Primero intentar parsear como date simple (YYYY-MM-DD)
-                date_only = parse_date(fecha_recogida)
-                if date_only:
-                    # Convertir a datetime con hora 00:00 en la zona horaria actual
-                    fecha_recogida = timezone.make_aware(datetime.combine(date_only, datetime.min.time()))
-                else:
-                    # Intentar parsear como datetime completo
-                    fecha_recogida = parse_datetime(fecha_recogida)
-                    if not fecha_recogida:
-                        return {
-                            "success": False,
-                            "error": f"Formato de fecha de recogida inválido: {fecha_recogida}",
-                        }
-                    if timezone.is_naive(fecha_recogida):
-                        fecha_recogida = timezone.make_aware(fecha_recogida)
-                        
-            if isinstance(fecha_devolucion, str):
-                # Primero intentar parsear como date simple (YYYY-MM-DD)
-                date_only = parse_date(fecha_devolucion)
-                if date_only:
-                    # Convertir a datetime con hora 23:59 en la zona horaria actual
-                    fecha_devolucion = timezone.make_aware(datetime.combine(date_only, datetime.max.time().replace(microsecond=0)))
-                else:
-                    # Intentar parsear como datetime completo
-                    fecha_devolucion = parse_datetime(fecha_devolucion)
-                    if not fecha_devolucion:
-                        return {
-                            "success": False,
-                            "error": f"Formato de fecha de devolución inválido: {fecha_devolucion}",
-                        }
-                    if timezone.is_naive(fecha_devolucion):
-                        fecha_devolucion = timezone.make_aware(fecha_devolucion)
-
-            # 🔍 VALIDAR FECHAS ANTES DE PROCEDER
-            now = timezone.now()
-            
-            # Validar que las fechas sean lógicas
-            if fecha_recogida >= fecha_devolucion:
-                return {
-                    "success": False,
-                    "error": "La fecha de devolución debe ser posterior a la fecha de recogida",
-                }
-            
-            # Validar que las fechas no sean en el pasado (con margen de 24 horas para ediciones de reservas existentes)
-            margin_time = now - timezone.timedelta(hours=24)
-            if fecha_recogida <= margin_time:
-                return {
-                    "success": False,
-                    "error": "La fecha de recogida debe ser en el futuro",
-                }
+            fecha_recogida, fecha_devolucion, error = self._validar_periodo(
+                fecha_recogida, fecha_devolucion
+            )
+            if error:
+                return {"success": False, "error": error}
 
             # Obtener vehículo y precio para las fechas específicas
-            try:
-                vehiculo = Vehiculo.objects.get(id=vehiculo_id)
-                # Usar el precio para la fecha de recogida específica
-                precio_dia_base = vehiculo.get_precio_para_fechas(fecha_recogida)
-                logger.info(f"Vehículo encontrado: {vehiculo.marca} {vehiculo.modelo}, precio para {fecha_recogida}: {precio_dia_base}€/día")
-            except Vehiculo.DoesNotExist:
+            if not Vehiculo.objects.filter(id=vehiculo_id).exists():
                 return {"success": False, "error": "Vehículo no encontrado"}
 
-            # Calcular días de reserva
-            dias = (fecha_devolucion - fecha_recogida).days
-            if dias < 1:
-                dias = 1  # Mínimo 1 día
+            # Precio de cada día según su tarifa (calendario materializado)
+            periodo = precio_periodo(vehiculo_id, fecha_recogida, fecha_devolucion)
+            dias = periodo.dias
 
-            logger.info(f"Días de reserva: {dias}")
+            logger.info(f"Días de reserva: {dias}, precio primer día: {periodo.precio_primer_dia}€/día")
 
             # 1. Calcular precio base del vehículo (YA INCLUYE IVA)
-            precio_base = precio_dia_base * dias
+            precio_base = periodo.total
             
             # 2. Obtener y calcular tarifa de política de pago (YA INCLUYE IVA)
             tarifa_politica = Decimal("0.00")
             if politica_pago_id:
                 try:
                     politica = PoliticaPago.objects.get(id=politica_pago_id)
-                    if politica.tarifa and politica.tarifa > 0:
-                        tarifa_politica = politica.tarifa * dias
+                    tarifa_politica = self._tarifa_politica(politica, dias)
+                    if tarifa_politica:
                         logger.info(f"Tarifa política aplicada: {politica.tarifa} x {dias} días = {tarifa_politica}")
                 except PoliticaPago.DoesNotExist:
                     logger.warning(f"Política de pago {politica_pago_id} no encontrada")
 
             # 3. Calcular precio de extras (YA INCLUYEN IVA)
-            precio_extras = Decimal("0.00")
-            extras_detalle = []
+            precio_extras, extras_detalle = self._precio_extras(extras_data, dias)
 
-            for extra_data in extras_data:
-                try:
-                    if isinstance(extra_data, dict):
-                        extra_id = extra_data.get("extra_id") or extra_data.get("id")
-                        cantidad = int(extra_data.get("cantidad", 1))
-                    else:
-                        extra_id = extra_data
-                        cantidad = 1
-                        
-                    if not extra_id:
-                        continue
-                        
-                    extra = Extras.objects.get(id=extra_id)
-                    precio_extra = extra.precio * cantidad * dias
-                    precio_extras += precio_extra
-
-                    extras_detalle.append({
-                        "id": extra.id,
-                        "nombre": extra.nombre,
-                        "precio_unitario": str(extra.precio),
-                        "cantidad": cantidad,
-                        "dias": dias,
-                        "subtotal": str(precio_extra),
-                    })
-                    logger.info(f"Extra agregado: {extra.nombre} x{cantidad} = {precio_extra}")
-                except (Extras.DoesNotExist, ValueError, TypeError) as e:
-                    logger.warning(f"Error procesando extra {extra_data}: {str(e)}")
-                    continue
-
-            # 4. PRECIO TOTAL = SUMA DIRECTA (todos los precios ya incluyen IVA)
-            precio_total = precio_base + tarifa_politica + precio_extras
-
-            # 5. CALCULAR IVA SIMBÓLICO PARA DESGLOSE
-            # Obtener porcentaje IVA de configuración
-            iva_percentage = getattr(settings, 'IVA_PERCENTAGE', 0.10)  # 10% por defecto
-            
-            # Extraer IVA del precio total para mostrarlo
-            # Fórmula: IVA = precio_total * iva_percentage / (1 + iva_percentage)
-            iva_simbolico = precio_total * Decimal(str(iva_percentage)) / (Decimal("1") + Decimal(str(iva_percentage)))
-            precio_sin_iva = precio_total - iva_simbolico
+            resultado = self._componer_precio(
+                precio_base, tarifa_politica, precio_extras, extras_detalle, dias
+            )
+            # Presupuesto firmado: la creación de la reserva lo reutiliza sin recalcular
+            resultado["token_presupuesto"] = firmar_presupuesto(
+                entradas_presupuesto(
+                    vehiculo_id, fecha_recogida, fecha_devolucion, politica_pago_id, extras_data
+                ),
+                resultado,
+            )
+            resultado["vigencia_presupuesto"] = vigencia_presupuesto()
+            logger.info(f"Precio calculado para reserva: {resultado['precio_total']} "
+                    f"(días: {dias}, base: {precio_base}, política: {tarifa_politica}, "
+                    f"extras: {precio_extras}, IVA simbólico: {resultado['desglose']['iva_simbolico']})")
+            return resultado
+
+        except Exception as e:
+            logger.error(f"Error calculando precio de reserva: {str(e)}")
+            return {"success": False, "error": f"Error en el cálculo: {str(e)}"}
+
+    def calcular_precio_lote(self, data):
+        """
+        Calcula el precio de varios vehículos con varias políticas de pago para
+        un mismo período y los mismos extras (página de resultados de búsqueda).
 
-            # Redondear a 2 decimales
-            precio_total = precio_total.quantize(Decimal('0.01'))
-            iva_simbolico = iva_simbolico.quantize(Decimal('0.01'))
-            precio_sin_iva = precio_sin_iva.quantize(Decimal('0.01'))
+        Mismas reglas que calcular_precio_reserva, pero con consultas por
+        conjuntos: una para los vehículos, una suma agrupada sobre el
+        calendario de tarifas y una para las políticas (los extras salen del
+        catálogo en memoria).
 
-            logger.info(f"Precio calculado para reserva: {precio_total} "
-                    f"(días: {dias}, base: {precio_base}, política: {tarifa_politica}, "
-                    f"extras: {precio_extras}, IVA simbólico: {iva_simbolico})")
+        Args:
+            data: {
+                "vehiculo_ids": [ids],
+                "politica_pago_ids": [ids] (opcional; sin ellas, solo precio base y extras),
+                "fecha_recogida", "fecha_devolucion",
+                "extras": [{"extra_id", "cantidad"} | id]
+            }
+
+        Returns:
+            dict con "resultados": una fila por vehículo con su precio para
+            cada política (matriz vehículos × políticas)
+        """
+        try:
+            from politicas.models import PoliticaPago
+            from vehiculos.models import Vehiculo
+            from vehiculos.tarifas import dias_tarificables, precios_periodo
+
+            fecha_recogida = data.get("fecha_recogida") or data.get("fechaRecogida")
+            fecha_devolucion = data.get("fecha_devolucion") or data.get("fechaDevolucion")
+            try:
+                vehiculo_ids = self._lista_ids(data.get("vehiculo_ids"))
+                politica_ids = self._lista_ids(
+                    data.get("politica_pago_ids") or data.get("politicaPago_ids")
+                )
+            except (TypeError, ValueError):
+                return {"success": False, "error": "Los IDs de vehículos y políticas deben ser enteros"}
+
+            if not all([vehiculo_ids, fecha_recogida, fecha_devolucion]):
+                missing_fields = [
+                    campo
+                    for campo, valor in (
+                        ("vehiculo_ids", vehiculo_ids),
+                        ("fecha_recogida", fecha_recogida),
+                        ("fecha_devolucion", fecha_devolucion),
+                    )
+                    if not valor
+                ]
+                return {
+                    "success": False,
+                    "error": f"Faltan datos requeridos: {', '.join(missing_fields)}",
+                }
+
+            max_vehiculos = getattr(settings, "PRECIO_LOTE_MAX_VEHICULOS", 100)
+            max_politicas = getattr(settings, "PRECIO_LOTE_MAX_POLITICAS", 10)
+            if len(vehiculo_ids) > max_vehiculos or len(politica_ids) > max_politicas:
+                return {
+                    "success": False,
+                    "error": f"Máximo {max_vehiculos} vehículos y {max_politicas} políticas por petición",
+                }
+
+            fecha_recogida, fecha_devolucion, error = self._validar_periodo(
+                fecha_recogida, fecha_devolucion
+            )
+            if error:
+                return {"success": False, "error": error}
+
+            existentes = set(
+                Vehiculo.objects.filter(id__in=vehiculo_ids).values_list("id", flat=True)
+            )
+            encontrados = [vehiculo_id for vehiculo_id in vehiculo_ids if vehiculo_id in existentes]
+            periodos = precios_periodo(encontrados, fecha_recogida, fecha_devolucion)
+            politicas = PoliticaPago.objects.in_bulk(politica_ids)
+
+            dias = dias_tarificables(fecha_recogida, fecha_devolucion)
+            precio_extras, extras_detalle = self._precio_extras(data.get("extras", []), dias)
+
+            # Columnas de la matriz; None = sin política
+            columnas = [politicas[pid] for pid in politica_ids if pid in politicas] or [None]
+
+            resultados = []
+            for vehiculo_id in encontrados:
+                periodo = periodos[vehiculo_id]
+                precios = []
+                for politica in columnas:
+                    precio = self._componer_precio(
+                        periodo.total,
+                        self._tarifa_politica(politica, periodo.dias),
+                        precio_extras,
+                        extras_detalle,
+                        periodo.dias,
+                    )
+                    precios.append(
+                        {
+                            "politica_pago_id": politica.id if politica else None,
+                            "precio_total": precio["precio_total"],
+                            "desglose": precio["desglose"],
+                        }
+                    )
+                resultados.append(
+                    {
+                        "vehiculo_id": vehiculo_id,
+                        "precio_base": float(periodo.total),
+                        "precio_dia": float(periodo.precio_primer_dia),
+                        "dias_sin_tarifa": periodo.dias_sin_tarifa,
+                        "precios": precios,
+                    }
+                )
+
+            no_encontrados = [vehiculo_id for vehiculo_id in vehiculo_ids if vehiculo_id not in existentes]
+            if no_encontrados:
+                logger.warning(f"Vehículos no encontrados en cálculo por lote: {no_encontrados}")
+            logger.info(
+                f"Precio por lote calculado: {len(resultados)} vehículos x {len(columnas)} políticas, "
+                f"{dias} días"
+            )
 
             return {
                 "success": True,
-                "precio_total": float(precio_total),
                 "dias_alquiler": dias,
-                "desglose": {
-                    "precio_base": float(precio_base),
-                    "precio_extras": float(precio_extras),
-                    "tarifa_politica": float(tarifa_politica),
-                    "precio_sin_iva": float(precio_sin_iva),
-                    "iva_simbolico": float(iva_simbolico),
-                    "total": float(precio_total),
-                    "dias": dias,
-                    "iva_percentage": float(iva_percentage),
-                    "extras_detalle": extras_detalle,
+                "count": len(resultados),
+                "politicas": [
+                    {"id": politica.id, "titulo": politica.titulo, "tarifa": float(politica.tarifa)}
+                    for politica in columnas
+                    if politica is not None
+                ],
+                "extras_detalle": extras_detalle,
+                "resultados": resultados,
+                "no_encontrados": {
+                    "vehiculos": no_encontrados,
+                    "politicas": [pid for pid in politica_ids if pid not in politicas],
                 },
             }
 
         except Exception as e:
-            logger.error(f"Error calculando precio de reserva: {str(e)}")
+            logger.error(f"Error calculando precio por lote: {str(e)}")
             return {"success": False, "error": f"Error en el cálculo: {str(e)}"}
+
+    @staticmethod
+    def _lista_ids(valores):
+        """IDs enteros sin duplicados, en el orden recibido (acepta "1,2,3")"""
+        if not valores:
+            return []
+        if isinstance(valores, str):
+            valores = [valor for valor in valores.split(",") if valor.strip()]
+        return list(dict.fromkeys(int(valor) for valor in valores))
+
+    @staticmethod
+    def _parsear_fecha(valor, fin_del_dia=False):
+        """
+        Convierte una fecha recibida (date o datetime ISO) a datetime con zona
+        horaria. Una fecha sin hora es el inicio del día (o su final, 23:59:59,
+        para devoluciones). Devuelve None si el formato no es válido.
+        """
+        from django.utils import timezone
+        from django.utils.dateparse import parse_date, parse_datetime
+
+        if not isinstance(valor, str):
+            return valor
+
+        # Primero intentar parsear como date simple (YYYY-MM-DD)
+        date_only = parse_date(valor)
+        if date_only:
+            hora = datetime.max.time().replace(microsecond=0) if fin_del_dia else datetime.min.time()
+            return timezone.make_aware(datetime.combine(date_only, hora))
+
+        # Intentar parsear como datetime completo
+        fecha = parse_datetime(valor)
+        if fecha and timezone.is_naive(fecha):
+            fecha = timezone.make_aware(fecha)
+        return fecha
+
+    def _validar_periodo(self, fecha_recogida, fecha_devolucion):
+        """Convierte y valida las fechas del alquiler: (recogida, devolución, error)"""
+        from django.utils import timezone
+
+        recogida = self._parsear_fecha(fecha_recogida)
+        if not recogida:
+            return None, None, f"Formato de fecha de recogida inválido: {fecha_recogida}"
+        devolucion = self._parsear_fecha(fecha_devolucion, fin_del_dia=True)
+        if not devolucion:
+            return None, None, f"Formato de fecha de devolución inválido: {fecha_devolucion}"
+
+        # Validar que las fechas sean lógicas
+        if recogida >= devolucion:
+            return None, None, "La fecha de devolución debe ser posterior a la fecha de recogida"
+
+        # Validar que las fechas no sean en el pasado (con margen de 24 horas para ediciones de reservas existentes)
+        margin_time = timezone.now() - timezone.timedelta(hours=24)
+        if recogida <= margin_time:
+            return None, None, "La fecha de recogida debe ser en el futuro"
+
+        return recogida, devolucion, None
+
+    @staticmethod
+    def _tarifa_politica(politica, dias):
+        """Suplemento de la política de pago para el alquiler (YA INCLUYE IVA)"""
+        if politica is not None and politica.tarifa and politica.tarifa > 0:
+            return politica.tarifa * dias
+        return Decimal("0.00")
+
+    def _precio_extras(self, extras_data, dias):
+        """
+        Precio de los extras solicitados (YA INCLUYEN IVA) desde el catálogo de
+        extras en memoria, sin consultas.
+
+        Returns:
+            (precio_extras, extras_detalle)
+        """
+        from .extras import extras_por_id
+
+        solicitados = []
+        for extra_data in extras_data or []:
+            try:
+                if isinstance(extra_data, dict):
+                    extra_id = extra_data.get("extra_id") or extra_data.get("id")
+                    cantidad = int(extra_data.get("cantidad", 1))
+                else:
+                    extra_id = extra_data
+                    cantidad = 1
+                if extra_id:
+                    solicitados.append((int(extra_id), cantidad))
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Error procesando extra {extra_data}: {str(e)}")
+
+        extras = extras_por_id(extra_id for extra_id, _cantidad in solicitados)
+        precio_extras = Decimal("0.00")
+        extras_detalle = []
+        for extra_id, cantidad in solicitados:
+            extra = extras.get(extra_id)
+            if extra is None:
+                logger.warning(f"Extra {extra_id} no encontrado")
+                continue
+            precio_extra = extra.precio * cantidad * dias
+            precio_extras += precio_extra
+
+            extras_detalle.append({
+                "id": extra.id,
+                "nombre": extra.nombre,
+                "precio_unitario": str(extra.precio),
+                "cantidad": cantidad,
+                "dias": dias,
+                "subtotal": str(precio_extra),
+            })
+            logger.info(f"Extra agregado: {extra.nombre} x{cantidad} = {precio_extra}")
+
+        return precio_extras, extras_detalle
+
+    @staticmethod
+    def _componer_precio(precio_base, tarifa_politica, precio_extras, extras_detalle, dias):
+        """Total y desglose con IVA simbólico a partir de los importes ya calculados"""
+        # 4. PRECIO TOTAL = SUMA DIRECTA (todos los precios ya incluyen IVA)
+        precio_total = precio_base + tarifa_politica + precio_extras
+
+        # 5. CALCULAR IVA SIMBÓLICO PARA DESGLOSE
+        # Obtener porcentaje IVA de configuración
+        iva_percentage = getattr(settings, 'IVA_PERCENTAGE', 0.10)  # 10% por defecto
+        
+        # Extraer IVA del precio total para mostrarlo
+        # Fórmula: IVA = precio_total * iva_percentage / (1 + iva_percentage)
+        iva_simbolico = precio_total * Decimal(str(iva_percentage)) / (Decimal("1") + Decimal(str(iva_percentage)))
+        precio_sin_iva = precio_total - iva_simbolico
+
+        # Redondear a 2 decimales
+        precio_total = precio_total.quantize(Decimal('0.01'))
+        iva_simbolico = iva_simbolico.quantize(Decimal('0.01'))
+        precio_sin_iva = precio_sin_iva.quantize(Decimal('0.01'))
+
+        return {
+            "success": True,
+            "precio_total": float(precio_total),
+            "dias_alquiler": dias,
+            "desglose": {
+                "precio_base": float(precio_base),
+                "precio_extras": float(precio_extras),
+                "tarifa_politica": float(tarifa_politica),
+                "precio_sin_iva": float(precio_sin_iva),
+                "iva_simbolico": float(iva_simbolico),
+                "total": float(precio_total),
+                "dias": dias,
+                "iva_percentage": float(iva_percentage),
+                "extras_detalle": extras_detalle,
+            },
+        }
     
     def validar_disponibilidad(
         self, vehiculo_id, fecha_recogida, fecha_devolucion, reserva_id=None
@@ -0,0 +1,28 @@
+# reservas/signals.py
+"""
+Señales de la app de reservas
+
+Invalidan el catálogo de extras en memoria (ver extras.py) cuando cambia un
+extra: al momento, para el proceso actual, y de nuevo al confirmar la
+transacción, para que ningún proceso se quede con la versión anterior.
+
+`estado_cambiado` se envía tras las transiciones de estado de Reserva, que
+escriben con UPDATE y no disparan post_save.
+"""
+from django.db import transaction
+from django.db.models.signals import ModelSignal, post_delete, post_save
+from django.dispatch import receiver
+
+from .extras import invalidar_catalogo
+from .models import Extras
+
+# Argumentos: reservas (instancias cambiadas, o None en una transición en
+# bloque, cuyas filas no se conocen) y estado (el nuevo)
+estado_cambiado = ModelSignal(use_caching=True)
+
+
+@receiver(post_save, sender=Extras)
+@receiver(post_delete, sender=Extras)
+def extra_modificado(sender, instance, **kwargs):
+    invalidar_catalogo()
+    transaction.on_commit(invalidar_catalogo)
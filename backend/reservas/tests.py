@@ -0,0 +1,499 @@
+# reservas/tests.py
+"""
+Tests para la funcionalidad de reservas
+"""
+
+import json
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from unittest import skipUnless
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from politicas.models import PoliticaPago
+from usuarios.models import Usuario
+from vehiculos.indice_disponibilidad import indice_disponibilidad
+from vehiculos.models import TarifaVehiculo, Vehiculo
+from vehiculos.tests import FlotaTestMixin
+
+from .benchmark import ESCENARIOS, comparar_informes, ejecutar_benchmark
+from .extras import obtener_catalogo as obtener_catalogo_extras
+from .models import Extras, Reserva, SecuenciaNumeroReserva
+from .numeros import (ESPACIO, TAMANO_BLOQUE, GeneradorNumerosReserva,
+                      despermutar, formatear, permutar)
+from .presupuestos import entradas_presupuesto, verificar_presupuesto
+from .serializers import (ReservaCreateSerializer, ReservaDetailSerializer,
+                          ReservaUpdateSerializer)
+from .services import ReservaService
+from .utils import validar_numero_reserva
+
+
+class PrecioLoteTest(FlotaTestMixin, TestCase):
+    """Tests para el cálculo de precios por lote y los presupuestos firmados"""
+
+    url = "/api/reservas/calcular-precio-lote/"
+
+    def setUp(self):
+        self.crear_datos_base()
+        self.hoy = timezone.now().date()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vehiculos = [self.crear_vehiculo(f"70{n}0LLL") for n in range(3)]
+            TarifaVehiculo.objects.create(
+                vehiculo=self.vehiculos[0],
+                fecha_inicio=self.hoy + timedelta(days=10),
+                fecha_fin=self.hoy + timedelta(days=11),
+                precio_dia=Decimal("25.00"),
+            )
+        self.flexible = PoliticaPago.objects.create(titulo="Flexible", tarifa=Decimal("5.00"))
+        self.extra = Extras.objects.create(nombre="Silla bebé", precio=Decimal("3.00"))
+        self.recogida = (timezone.now() + timedelta(days=9)).replace(microsecond=0)
+        self.devolucion = self.recogida + timedelta(days=4)
+
+    def test_matriz_vehiculos_por_politicas(self):
+        """Cada celda coincide con calcular_precio y las consultas no crecen con el lote"""
+        datos = {
+            "vehiculo_ids": [vehiculo.id for vehiculo in self.vehiculos] + [99999],
+            "politica_pago_ids": [self.politica.id, self.flexible.id],
+            "fecha_recogida": self.recogida.isoformat(),
+            "fecha_devolucion": self.devolucion.isoformat(),
+            "extras": [{"extra_id": self.extra.id, "cantidad": 2}],
+        }
+        obtener_catalogo_extras()
+        with self.assertNumQueries(3):
+            respuesta = self.client.post(self.url, datos, content_type="application/json")
+        resultado = respuesta.json()
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(resultado["count"], 3)
+        self.assertEqual(resultado["no_encontrados"]["vehiculos"], [99999])
+        for fila in resultado["resultados"]:
+            for celda in fila["precios"]:
+                individual = self.client.post(
+                    "/api/reservas/calcular-precio/",
+                    {**datos, "vehiculo_id": fila["vehiculo_id"], "politica_pago_id": celda["politica_pago_id"]},
+                    content_type="application/json",
+                ).json()
+                self.assertEqual(celda["precio_total"], individual["precio_total"])
+        # 2 días a 25 + 2 a 40, 4 días de política flexible y 2 sillas x 4 días
+        primera = resultado["resultados"][0]
+        self.assertEqual(primera["precios"][1]["precio_total"], 130.0 + 20.0 + 24.0)
+
+    def test_extras_desde_catalogo_en_memoria(self):
+        """Los extras no añaden consultas y un cambio de precio recarga el catálogo"""
+        extras = [self.extra] + [
+            Extras.objects.create(nombre=f"Extra {n}", precio=Decimal("1.00")) for n in range(4)
+        ]
+        pedidos = [{"extra_id": extra.id, "cantidad": 1} for extra in extras]
+        servicio = ReservaService()
+        obtener_catalogo_extras()
+
+        with self.assertNumQueries(0):
+            precio, detalle = servicio._precio_extras(pedidos, 2)
+        self.assertEqual((precio, len(detalle)), (Decimal("14.00"), 5))
+
+        self.extra.precio = Decimal("4.00")
+        self.extra.save()
+        self.assertEqual(servicio._precio_extras(pedidos, 2)[0], Decimal("16.00"))
+
+    def test_presupuesto_firmado_evita_recalcular(self):
+        """La reserva usa el precio del token válido sin consultas y recalcula si se manipula"""
+        datos = {
+            "vehiculo_id": self.vehiculos[0].id,
+            "politica_pago_id": self.flexible.id,
+            "fecha_recogida": self.recogida.isoformat(),
+            "fecha_devolucion": self.devolucion.isoformat(),
+            "extras": [{"extra_id": self.extra.id, "cantidad": 2}],
+        }
+        presupuesto = self.client.post(
+            "/api/reservas/calcular-precio/", datos, content_type="application/json"
+        ).json()
+        reserva = {
+            "vehiculo": self.vehiculos[0],
+            "politica_pago": self.flexible,
+            "fecha_recogida": self.recogida,
+            "fecha_devolucion": self.devolucion,
+            "precio_total": Decimal("1.00"),
+        }
+        extras = [{"extra_id": self.extra.id, "cantidad": 2}]
+        serializer = ReservaCreateSerializer()
+
+        with self.assertNumQueries(0):
+            serializer._aplicar_presupuesto(reserva, extras, presupuesto["token_presupuesto"])
+        self.assertEqual(reserva["precio_total"], Decimal("174.00"))
+
+        # Token de otros extras o manipulado: se recalcula en el servidor
+        reserva["precio_total"] = Decimal("1.00")
+        serializer._aplicar_presupuesto(reserva, [], presupuesto["token_presupuesto"])
+        self.assertEqual(reserva["precio_total"], Decimal("150.00"))
+        token = presupuesto["token_presupuesto"]
+        manipulado = token[:-3] + ("AAA" if not token.endswith("AAA") else "BBB")
+        self.assertIsNone(
+            verificar_presupuesto(
+                manipulado,
+                entradas_presupuesto(self.vehiculos[0], self.recogida, self.devolucion, self.flexible, extras),
+            )
+        )
+
+    def test_desglose_guardado_no_se_recalcula(self):
+        """El detalle sirve el desglose guardado aunque cambien tarifas y extras"""
+        reserva = {
+            "vehiculo": self.vehiculos[0],
+            "politica_pago": self.flexible,
+            "fecha_recogida": self.recogida,
+            "fecha_devolucion": self.devolucion,
+        }
+        extras = [{"extra_id": self.extra.id, "cantidad": 2}]
+        ReservaCreateSerializer()._aplicar_presupuesto(reserva, extras, "token-invalido")
+        desglose = reserva["desglose_precio"]
+        self.assertEqual(
+            desglose["precio_base"] + desglose["precio_extras"] + desglose["tarifa_politica"],
+            float(reserva["precio_total"]),
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            guardada = self.crear_reserva(self.vehiculos[0], self.recogida, self.devolucion)
+        Reserva.objects.filter(pk=guardada.pk).update(desglose_precio=desglose)
+        TarifaVehiculo.objects.filter(vehiculo=self.vehiculos[0]).update(precio_dia=Decimal("99.00"))
+        self.extra.precio = Decimal("9.00")
+        self.extra.save()
+
+        guardada = Reserva.objects.get(pk=guardada.pk)
+        serializer = ReservaDetailSerializer()
+        with self.assertNumQueries(0):
+            precios = (
+                serializer.get_precio_base(guardada),
+                serializer.get_precio_extras(guardada),
+                serializer.get_tarifa_politica(guardada),
+            )
+        self.assertEqual(
+            precios, (desglose["precio_base"], desglose["precio_extras"], desglose["tarifa_politica"])
+        )
+
+    def test_editar_precio_descarta_desglose(self):
+        """Al editar fechas o precio el detalle deja de usar el desglose de la creación"""
+        with self.captureOnCommitCallbacks(execute=True):
+            reserva = self.crear_reserva(self.vehiculos[0], self.recogida, self.recogida + timedelta(days=3))
+        Reserva.objects.filter(pk=reserva.pk).update(
+            desglose_precio={"precio_base": 120.0, "precio_extras": 0.0, "tarifa_politica": 0.0}
+        )
+        reserva.refresh_from_db()
+
+        serializer = ReservaUpdateSerializer(reserva, data={"notas_internas": "Llamar"}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        self.assertIsNotNone(serializer.save().desglose_precio)
+
+        serializer = ReservaUpdateSerializer(
+            reserva,
+            data={"fecha_devolucion": (self.recogida + timedelta(days=6)).isoformat(), "precio_total": 300},
+            partial=True,
+        )
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        reserva = Reserva.objects.get(pk=reserva.pk)
+        self.assertIsNone(reserva.desglose_precio)
+        self.assertEqual(ReservaDetailSerializer().get_precio_base(reserva), 240.0)
+
+
+class ReservaCreacionLoteTest(FlotaTestMixin, TestCase):
+    """Tests para la creación de reservas con extras y conductores en lote"""
+
+    def setUp(self):
+        self.crear_datos_base()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vehiculo = self.crear_vehiculo("8080MMM")
+        self.extras = [
+            Extras.objects.create(nombre=f"Extra {n}", precio=Decimal("3.00")) for n in range(3)
+        ]
+        self.recogida = (timezone.now() + timedelta(days=20)).replace(microsecond=0)
+
+    def conductor(self, n, **kwargs):
+        datos = {
+            "nombre": "Ana María",
+            "apellidos": f"Conductora {n}",
+            "email": f"conductor{n}@test.com",
+            "numero_documento": f"1234567{n}Z",
+            "rol": "principal" if n == 0 else "secundario",
+            "direccion": {"calle": "Calle Larios", "ciudad": " málaga ", "codigo_postal": "29005"},
+        }
+        datos.update(kwargs)
+        return datos
+
+    def crear(self, conductores, extras, dia=0):
+        inicio = self.recogida + timedelta(days=dia * 5)
+        serializer = ReservaCreateSerializer(
+            data={
+                "politica_pago": self.politica.id,
+                "vehiculo": self.vehiculo.id,
+                "lugar_recogida": self.lugar.id,
+                "lugar_devolucion": self.lugar.id,
+                "fecha_recogida": inicio.isoformat(),
+                "fecha_devolucion": (inicio + timedelta(days=3)).isoformat(),
+                "precio_total": 120,
+                "metodo_pago": "efectivo",
+                "extras": [{"extra_id": extra.id, "cantidad": 1} for extra in extras],
+                "conductores": conductores,
+            }
+        )
+        serializer.is_valid(raise_exception=True)
+        with CaptureQueriesContext(connection) as consultas:
+            reserva = serializer.save()
+        return reserva, len(consultas)
+
+    def test_conductores_existentes_y_nuevos(self):
+        """Reutiliza usuarios por documento y crea el resto con username libre y dirección normalizada"""
+        existente = Usuario.objects.create(
+            username="ana_maría_12345670z", email="otro@test.com", numero_documento="12345671Z"
+        )
+        reserva, _ = self.crear([self.conductor(0), self.conductor(1)], self.extras[:2])
+
+        principal = reserva.conductores.get(rol="principal").conductor
+        self.assertEqual(reserva.usuario, principal)
+        # Sin token de presupuesto no se recalcula el precio ni se guarda desglose
+        self.assertIsNone(reserva.desglose_precio)
+        self.assertEqual(principal.username, "ana_maría_12345670z_1")
+        self.assertEqual(principal.direccion.ciudad, "Málaga")
+        self.assertEqual(reserva.conductores.get(rol="secundario").conductor, existente)
+        self.assertEqual(reserva.extras.count(), 2)
+
+    def test_consultas_no_crecen_con_conductores(self):
+        """Las sentencias de la creación no dependen del número de conductores y extras"""
+        # La primera reserva del proceso reserva el bloque de números y carga el catálogo de extras
+        self.crear([self.conductor(0)], self.extras[:1])
+        _, una = self.crear([self.conductor(1)], self.extras[:1], dia=1)
+        _, varias = self.crear([self.conductor(n) for n in range(2, 6)], self.extras, dia=2)
+
+        self.assertEqual(una, varias)
+
+
+class BenchmarkPreciosTest(TestCase):
+    """Tests para el benchmark del motor de precios"""
+
+    def test_informe_por_escenario_y_tamano(self):
+        """Mide los tres escenarios sin errores y no deja datos sembrados"""
+        informe = ejecutar_benchmark(tamanos=[1, 5], vehiculos=3)
+
+        self.assertEqual(set(informe["escenarios"]), set(ESCENARIOS))
+        for resultados in informe["escenarios"].values():
+            self.assertEqual(set(resultados), {"1", "5"})
+            medida = resultados["5"]
+            self.assertEqual((medida["llamadas"], medida["errores"]), (5, 0))
+            self.assertGreater(medida["consultas"]["por_llamada"], 0)
+            self.assertLessEqual(medida["latencia_ms"]["p50"], medida["latencia_ms"]["max"])
+        self.assertFalse(Vehiculo.objects.exists())
+        json.dumps(informe)
+
+    def test_comparar_detecta_regresiones(self):
+        """Peor latencia fuera de tolerancia o más consultas son regresiones"""
+
+        def informe(p50, consultas):
+            medida = {
+                "llamadas": 100,
+                "latencia_ms": {"p50": p50, "p90": p50},
+                "consultas": {"por_llamada": consultas},
+            }
+            return {"escenarios": {"calcular_precio_reserva": {"100": medida}}}
+
+        self.assertEqual(comparar_informes(informe(1.1, 4), informe(1.0, 4)), [])
+        self.assertEqual(len(comparar_informes(informe(1.5, 4), informe(1.0, 4))), 2)
+        self.assertEqual(len(comparar_informes(informe(1.0, 5), informe(1.0, 4))), 1)
+
+
+class TransicionesReservaTest(FlotaTestMixin, TestCase):
+    """Tests para las transiciones de estado de Reserva"""
+
+    def setUp(self):
+        self.crear_datos_base()
+        self.inicio = timezone.now() + timedelta(days=5)
+        self.fin = self.inicio + timedelta(days=3)
+        self.vehiculo = self.crear_vehiculo("3333CCC")
+        self.reserva = self.crear_reserva(self.vehiculo, self.inicio, self.fin, estado="pendiente")
+        indice_disponibilidad.cargar()
+
+    def test_transicion_es_un_update_condicional(self):
+        """Confirmar escribe solo el estado en una sentencia; las no permitidas fallan"""
+        with self.assertNumQueries(1):
+            self.reserva.confirmar()
+        self.reserva.refresh_from_db()
+        self.assertEqual(self.reserva.estado, "confirmada")
+
+        self.reserva.cancelar()
+        with self.assertRaises(ValidationError):
+            self.reserva.confirmar()
+
+    def test_estado_obsoleto_no_se_sobrescribe(self):
+        """Una instancia leída antes de otra transición no puede aplicarse"""
+        obsoleta = Reserva.objects.get(pk=self.reserva.pk)
+        self.reserva.cancelar()
+
+        with self.assertRaises(ValidationError):
+            obsoleta.confirmar()
+        self.assertEqual(Reserva.objects.get(pk=self.reserva.pk).estado, "cancelada")
+
+    def test_cancelar_en_bloque_libera_vehiculos(self):
+        """Cancelar en bloque es un único UPDATE y actualiza el índice al confirmar"""
+        otro = self.crear_vehiculo("4444DDD")
+        self.crear_reserva(otro, self.inicio, self.fin)
+        self.assertEqual(indice_disponibilidad.vehiculos_libres(self.inicio, self.fin), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(1):
+                canceladas = Reserva.objects.all().cancelar()
+
+        self.assertEqual(canceladas, 2)
+        self.assertEqual(
+            sorted(indice_disponibilidad.vehiculos_libres(self.inicio, self.fin)),
+            [self.vehiculo.id, otro.id],
+        )
+
+    def test_confirmar_en_bloque_omite_solapadas(self):
+        """No se confirman pendientes que se solapan con otra reserva activa"""
+        solapada = self.crear_reserva(self.crear_vehiculo("5555EEE"), self.inicio, self.fin, estado="pendiente")
+        Reserva.objects.filter(pk=solapada.pk).update(vehiculo=self.vehiculo)
+
+        self.assertEqual(Reserva.objects.all().confirmar(), 0)
+        Reserva.objects.filter(pk=solapada.pk).cancelar()
+        self.assertEqual(Reserva.objects.all().confirmar(), 1)
+
+
+class ReservaSinSolapesTest(FlotaTestMixin, TestCase):
+    """Tests para la prevención de reservas solapadas al guardar"""
+
+    def test_reserva_solapada_rechazada(self):
+        """Una segunda reserva activa solapada no se guarda; una cancelada no bloquea"""
+        self.crear_datos_base()
+        vehiculo = self.crear_vehiculo("6666FFF")
+        inicio = timezone.now() + timedelta(days=5)
+        self.crear_reserva(vehiculo, inicio, inicio + timedelta(days=3))
+
+        with self.assertRaises(ValidationError):
+            self.crear_reserva(vehiculo, inicio + timedelta(days=1), inicio + timedelta(days=4))
+        self.assertEqual(Reserva.objects.count(), 1)
+
+        Reserva.objects.all().cancelar()
+        self.crear_reserva(vehiculo, inicio + timedelta(days=1), inicio + timedelta(days=4))
+
+    def test_restriccion_con_estados_del_modelo(self):
+        """La restricción de la migración 0008 cubre los mismos estados que Reserva"""
+        migracion = import_module("reservas.migrations.0008_reserva_sin_solapes")
+        self.assertEqual(migracion.ESTADOS_ACTIVOS, Reserva.ESTADOS_ACTIVOS)
+
+
+@skipUnless(connection.vendor == "postgresql", "Requiere PostgreSQL")
+class ReservaConcurrenteTest(FlotaTestMixin, TransactionTestCase):
+    """Tests de concurrencia contra PostgreSQL (bloqueo de fila y restricción de exclusión)"""
+
+    def setUp(self):
+        self.crear_datos_base()
+        self.inicio = timezone.now() + timedelta(days=5)
+        self.fin = self.inicio + timedelta(days=2)
+
+    def reservar_a_la_vez(self, vehiculos):
+        """Crea una reserva por vehículo, en hilos que arrancan a la vez"""
+        barrera = threading.Barrier(len(vehiculos))
+        resultados = []
+
+        def reservar(vehiculo):
+            try:
+                barrera.wait()
+                self.crear_reserva(vehiculo, self.inicio, self.fin)
+                resultados.append("ok")
+            except ValidationError:
+                resultados.append("conflicto")
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=reservar, args=(vehiculo,)) for vehiculo in vehiculos]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join(timeout=30)
+        return sorted(resultados)
+
+    def test_mismo_vehiculo_solo_una(self):
+        vehiculo = self.crear_vehiculo("7777GGG")
+        self.assertEqual(self.reservar_a_la_vez([vehiculo] * 2), ["conflicto", "ok"])
+
+    def test_vehiculos_distintos_no_se_bloquean(self):
+        vehiculos = [self.crear_vehiculo("8888HHH"), self.crear_vehiculo("9999JJJ")]
+        self.assertEqual(self.reservar_a_la_vez(vehiculos), ["ok", "ok"])
+
+    def test_restriccion_sin_pasar_por_save(self):
+        """La restricción rechaza solapes aunque no se use Reserva.save"""
+        vehiculo = self.crear_vehiculo("1212KKK")
+        datos = {
+            "usuario": self.usuario,
+            "politica_pago": self.politica,
+            "vehiculo": vehiculo,
+            "lugar_recogida": self.lugar,
+            "lugar_devolucion": self.lugar,
+            "fecha_recogida": self.inicio,
+            "fecha_devolucion": self.fin,
+            "precio_dia": Decimal("40.00"),
+            "precio_total": Decimal("80.00"),
+        }
+        with self.assertRaises(IntegrityError):
+            Reserva.objects.bulk_create([Reserva(**datos), Reserva(**datos)])
+
+
+class NumerosReservaTest(FlotaTestMixin, TestCase):
+    """Tests para la generación de números de reserva por bloques"""
+
+    def test_permutacion_biyectiva(self):
+        """Números distintos dan códigos distintos, invertibles y no correlativos"""
+        numeros = range(0, ESPACIO, 37)
+        codigos = [permutar(numero) for numero in numeros]
+
+        self.assertEqual(len(set(codigos)), len(codigos))
+        self.assertTrue(all(0 <= codigo < ESPACIO for codigo in codigos))
+        self.assertEqual([despermutar(codigo) for codigo in codigos], list(numeros))
+        self.assertNotEqual(permutar(1) - permutar(0), 1)
+
+    def test_bloque_sin_consultas(self):
+        """Solo se consulta la BD al reservar un bloque"""
+        generador = GeneradorNumerosReserva()
+        with self.captureOnCommitCallbacks(execute=True):
+            numeros = [generador.siguiente()]
+        with self.assertNumQueries(0):
+            numeros += [generador.siguiente() for _ in range(TAMANO_BLOQUE - 1)]
+
+        self.assertEqual(len(set(numeros)), TAMANO_BLOQUE)
+        for numero in numeros:
+            validar_numero_reserva(numero)
+        self.assertNotIn(numeros[0], [GeneradorNumerosReserva().siguiente() for _ in range(5)])
+
+    def test_bloque_deshecho_no_se_reparte(self):
+        """Si la transacción que reservó el bloque se deshace, el proceso no se queda con él"""
+        generador = GeneradorNumerosReserva()
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                generador.siguiente()
+                raise RuntimeError("rollback")
+
+        otro = GeneradorNumerosReserva()
+        with self.captureOnCommitCallbacks(execute=True):
+            numeros = [otro.siguiente(), generador.siguiente()]
+        numeros += [otro.siguiente() for _ in range(TAMANO_BLOQUE - 1)]
+        numeros += [generador.siguiente() for _ in range(TAMANO_BLOQUE - 1)]
+
+        self.assertEqual(len(set(numeros)), len(numeros))
+
+    def test_omite_codigos_de_reservas_anteriores(self):
+        """Los códigos ya usados por reservas con números antiguos se saltan"""
+        self.crear_datos_base()
+        reserva = self.crear_reserva(
+            self.crear_vehiculo("1313LLL"),
+            timezone.now() + timedelta(days=5),
+            timezone.now() + timedelta(days=7),
+        )
+        SecuenciaNumeroReserva.objects.update_or_create(
+            nombre="numero_reserva", defaults={"siguiente_bloque": 7}
+        )
+        Reserva.objects.filter(pk=reserva.pk).update(numero_reserva=formatear(7 * TAMANO_BLOQUE))
+
+        self.assertEqual(GeneradorNumerosReserva().siguiente(), formatear(7 * TAMANO_BLOQUE + 1))
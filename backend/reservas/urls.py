@@ -28,6 +28,11 @@ urlpatterns = [
         ReservaViewSet.as_view({"post": "calcular_precio"}),
         name="calculate-reservation-price",
     ),
+    path(
+        "calcular-precio-lote/",
+        ReservaViewSet.as_view({"post": "calcular_precio_lote"}),
+        name="calcular-precio-lote",
+    ),
     path(
         "find-by-number/<str:numero_reserva>/",
         ReservaViewSet.as_view({"post": "buscar_por_numero"}),
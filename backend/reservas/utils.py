@@ -1,53 +1,29 @@
 # reservas/utils.py
 import logging
-import random
-import string
 
 from django.core.exceptions import ValidationError
-from django.db import transaction
 
 logger = logging.getLogger(__name__)
 
 
 def generar_numero_reserva_unico():
     """
-    Genera un número de reserva único siguiendo el patrón M4Y + 6 dígitos aleatorios.
-    
+    Genera un número de reserva único siguiendo el patrón M4Y + 6 dígitos.
+
+    Los números salen del bloque reservado por el proceso (ver numeros.py):
+    sin consultas salvo al agotar el bloque y sin colisiones entre procesos.
+
     Returns:
         str: Número de reserva único en formato M4Y123456
-        
+
     Raises:
-        ValidationError: Si no se puede generar un número único después de múltiples intentos
+        ValidationError: Si se ha agotado el espacio de números
     """
-    from .models import \
-        Reserva  # Importación lazy para evitar dependencias circulares
-    
-    prefijo = "M4Y"
-    max_intentos = 100  # Límite de seguridad para evitar bucle infinito
-    
-    for intento in range(max_intentos):
-        # Generar 6 dígitos aleatorios
-        numero_aleatorio = ''.join(random.choices(string.digits, k=6))
-        numero_reserva = f"{prefijo}{numero_aleatorio}"
-        
-        # Verificar unicidad usando una consulta atómica
-        try:
-            with transaction.atomic():
-                # Verificar si ya existe
-                if not Reserva.objects.filter(numero_reserva=numero_reserva).exists():
-                    logger.info(f"Número de reserva generado: {numero_reserva} (intento {intento + 1})")
-                    return numero_reserva
-                    
-        except Exception as e:
-            logger.warning(f"Error verificando unicidad en intento {intento + 1}: {str(e)}")
-            continue
-            
-        logger.debug(f"Número de reserva {numero_reserva} ya existe, reintentando... (intento {intento + 1})")
-    
-    # Si llegamos aquí, no pudimos generar un número único
-    error_msg = f"No se pudo generar un número de reserva único después de {max_intentos} intentos"
-    logger.error(error_msg)
-    raise ValidationError(error_msg)
+    from .numeros import generador_numeros
+
+    numero_reserva = generador_numeros.siguiente()
+    logger.debug(f"Número de reserva generado: {numero_reserva}")
+    return numero_reserva
 
 
 def validar_numero_reserva(numero_reserva):
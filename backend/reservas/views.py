@@ -144,6 +144,33 @@ class ReservaViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
+    @action(detail=False, methods=["post"])
+    def calcular_precio_lote(self, request):
+        """
+        Calcula en una petición el precio de varios vehículos con varias
+        políticas de pago para el mismo período (página de resultados).
+        """
+        logger.info("Calculando precios por lote")
+
+        try:
+            resultado = self.reserva_service.calcular_precio_lote(request.data)
+
+            if resultado.get("success", False):
+                logger.info(f"Cálculo por lote exitoso: {resultado.get('count', 0)} vehículos")
+                return Response(resultado, status=status.HTTP_200_OK)
+            else:
+                logger.warning(
+                    f"Error en cálculo por lote: {resultado.get('error', 'Error desconocido')}"
+                )
+                return Response(resultado, status=status.HTTP_400_BAD_REQUEST)
+
+        except Exception as e:
+            logger.error(f"Error calculando precios por lote: {str(e)}")
+            return Response(
+                {"success": False, "error": "Error interno del servidor"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
     @action(detail=True, methods=["post"])
     def cancelar(self, request, pk=None):
         """Cancelar una reserva"""
@@ -154,7 +181,7 @@ class ReservaViewSet(viewsets.ModelViewSet):
             logger.info(f"Reserva encontrada - Estado actual: {reserva.estado}")
             
             # Verificar estado actual
-            if reserva.estado in ["cancelada", "completada"]:
+            if not reserva.puede_pasar_a("cancelada"):
                 logger.warning(f"Intento de cancelar reserva en estado: {reserva.estado}")
                 return Response(
                     {
@@ -165,21 +192,20 @@ class ReservaViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
-            with transaction.atomic():
-                reserva.estado = "cancelada"
-                reserva.save()
+            # Solo escribe estado/updated_at: sin full_clean ni recálculo de precio
+            reserva.cancelar()
 
-                logger.info(f"Reserva {reserva.id} cancelada exitosamente")
+            logger.info(f"Reserva {reserva.id} cancelada exitosamente")
 
-                return Response(
-                    {
-                        "success": True, 
-                        "message": "Reserva cancelada exitosamente",
-                        "reserva_id": reserva.id,
-                        "nuevo_estado": reserva.estado,
-                    },
-                    status=status.HTTP_200_OK,
-                )
+            return Response(
+                {
+                    "success": True, 
+                    "message": "Reserva cancelada exitosamente",
+                    "reserva_id": reserva.id,
+                    "nuevo_estado": reserva.estado,
+                },
+                status=status.HTTP_200_OK,
+            )
 
         except Reserva.DoesNotExist:
             logger.error(f"Reserva {pk} no encontrada")
@@ -187,6 +213,12 @@ class ReservaViewSet(viewsets.ModelViewSet):
                 {"success": False, "error": "Reserva no encontrada"},
                 status=status.HTTP_404_NOT_FOUND,
             )
+        except ValidationError as e:
+            # Otra petición cambió el estado entre la lectura y la escritura
+            return Response(
+                {"success": False, "error": "; ".join(e.messages)},
+                status=status.HTTP_409_CONFLICT,
+            )
         except Exception as e:
             logger.error(f"Error cancelando reserva {pk}: {str(e)}")
             return Response(
@@ -204,7 +236,7 @@ class ReservaViewSet(viewsets.ModelViewSet):
         """Confirmar una reserva pendiente"""
         reserva = self.get_object()
 
-        if reserva.estado != "pendiente":
+        if not reserva.puede_pasar_a("confirmada"):
             return Response(
                 {
                     "success": False,
@@ -214,16 +246,20 @@ class ReservaViewSet(viewsets.ModelViewSet):
             )
 
         try:
-            with transaction.atomic():
-                reserva.estado = "confirmada"
-                reserva.save()
+            reserva.confirmar()
 
-                logger.info(f"Reserva {reserva.id} confirmada exitosamente")
+            logger.info(f"Reserva {reserva.id} confirmada exitosamente")
 
-                return Response(
-                    {"success": True, "message": "Reserva confirmada exitosamente"}
-                )
+            return Response(
+                {"success": True, "message": "Reserva confirmada exitosamente"}
+            )
 
+        except ValidationError as e:
+            # Otra petición cambió el estado entre la lectura y la escritura
+            return Response(
+                {"success": False, "error": "; ".join(e.messages)},
+                status=status.HTTP_409_CONFLICT,
+            )
         except Exception as e:
             logger.error(f"Error confirmando reserva {pk}: {str(e)}")
             return Response(
@@ -17,4 +17,8 @@ class UtilsConfig(AppConfig):
         """
         Se ejecuta cuando Django ha cargado completamente
         """
+        # Versiones de la caché de datos de referencia
+        from .cache_referencia import conectar_senales
+
+        conectar_senales()
         logger.info("✅ Aplicación utils inicializada")
@@ -0,0 +1,222 @@
+# utils/cache_referencia.py
+"""
+Caché de datos de referencia
+
+Tablas de catálogo que casi nunca cambian (categorías, grupos, políticas de
+pago con sus items y penalizaciones, tipos de penalización, promociones,
+lugares y contenidos) pero que se consultan en casi todas las peticiones.
+
+- Cada modelo tiene un número de versión en la caché compartida (Redis en
+  producción). Las señales post_save/post_delete lo incrementan al momento y
+  otra vez al confirmar la transacción.
+- Las respuestas de los viewsets de catálogo (decorador `cache_referencia`)
+  se guardan con una clave que incluye las versiones de los modelos de los
+  que dependen: un cambio deja las claves anteriores sin uso, sin borrarlas.
+- Delante de la caché compartida hay un LRU por proceso: una petición con
+  la respuesta ya en el proceso solo lee las versiones (un get_many).
+
+La fecha del día forma parte de la clave, de modo que lo que depende de ella
+(promociones vigentes, días restantes) no sobrevive al cambio de día.
+"""
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .cache_versiones import incrementar_version
+
+logger = logging.getLogger(__name__)
+
+PREFIJO = "referencia"
+
+# Modelos con versión propia ("app.Modelo")
+MODELOS_REFERENCIA = (
+    "vehiculos.Categoria",
+    "vehiculos.GrupoCoche",
+    "politicas.PoliticaPago",
+    "politicas.PoliticaIncluye",
+    "politicas.PoliticaPenalizacion",
+    "politicas.TipoPenalizacion",
+    "politicas.Promocion",
+    "lugares.Lugar",
+    "lugares.Direccion",
+    "comunicacion.Contenido",
+)
+
+
+def cache_habilitada() -> bool:
+    return getattr(settings, "REFERENCIA_CACHE_ENABLED", True)
+
+
+def _timeout() -> int:
+    return getattr(settings, "REFERENCIA_CACHE_TIMEOUT", 60 * 60)
+
+
+def _clave_version(modelo: str) -> str:
+    return f"{PREFIJO}:version:{modelo.lower()}"
+
+
+class CacheLRU:
+    """LRU en memoria del proceso, seguro entre hilos"""
+
+    def __init__(self, tamano: int) -> None:
+        self.tamano = tamano
+        self._datos: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clave: str) -> Any:
+        with self._lock:
+            if clave not in self._datos:
+                return None
+            self._datos.move_to_end(clave)
+            return self._datos[clave]
+
+    def set(self, clave: str, valor: Any) -> None:
+        with self._lock:
+            self._datos[clave] = valor
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.tamano:
+                self._datos.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._datos.clear()
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+
+lru_referencia = CacheLRU(getattr(settings, "REFERENCIA_CACHE_LRU_TAMANO", 512))
+
+
+# === VERSIONES ===
+
+
+def versiones(modelos: Iterable[str]) -> Optional[Tuple[int, ...]]:
+    """Versiones vigentes de los modelos (una lectura); None si la caché falla"""
+    claves = [_clave_version(modelo) for modelo in modelos]
+    try:
+        leidas = cache.get_many(claves)
+    except Exception as e:
+        logger.warning(f"Error leyendo versiones de datos de referencia: {str(e)}")
+        return None
+    return tuple(leidas.get(clave, 0) for clave in claves)
+
+
+def _incrementar(modelo: str) -> None:
+    try:
+        incrementar_version(_clave_version(modelo))
+    except Exception as e:
+        logger.warning(f"Error invalidando datos de referencia de {modelo}: {str(e)}")
+
+
+def invalidar(modelo: str) -> None:
+    """Invalida lo cacheado que depende del modelo ("app.Modelo")"""
+    _incrementar(modelo)
+    transaction.on_commit(lambda: _incrementar(modelo))
+
+
+def conectar_senales() -> None:
+    """Conecta post_save/post_delete de los modelos de referencia (desde UtilsConfig.ready)"""
+    for modelo in MODELOS_REFERENCIA:
+
+        def _invalidar(sender, modelo=modelo, **kwargs):
+            invalidar(modelo)
+
+        uid = f"cache_referencia:{modelo}"
+        post_save.connect(_invalidar, sender=modelo, weak=False, dispatch_uid=f"{uid}:save")
+        post_delete.connect(_invalidar, sender=modelo, weak=False, dispatch_uid=f"{uid}:delete")
+
+
+# === LECTURA ===
+
+
+def obtener(clave: str, modelos: Iterable[str], calcular: Callable[[], Any]) -> Any:
+    """
+    Valor cacheado de `clave` para las versiones vigentes de `modelos`, o el
+    resultado de `calcular()` guardado en la caché compartida y en el LRU.
+    `calcular` puede devolver None para no cachear.
+    """
+    if not cache_habilitada():
+        return calcular()
+
+    vigentes = versiones(modelos)
+    if vigentes is None:
+        return calcular()
+    clave_versionada = f"{PREFIJO}:{clave}:{'.'.join(str(v) for v in vigentes)}"
+
+    valor = lru_referencia.get(clave_versionada)
+    if valor is not None:
+        return valor
+
+    try:
+        valor = cache.get(clave_versionada)
+    except Exception as e:
+        logger.warning(f"Error leyendo datos de referencia cacheados: {str(e)}")
+        valor = None
+    if valor is None:
+        valor = calcular()
+        if valor is None:
+            return None
+        try:
+            cache.set(clave_versionada, valor, timeout=_timeout())
+        except Exception as e:
+            logger.warning(f"Error guardando datos de referencia en caché: {str(e)}")
+
+    lru_referencia.set(clave_versionada, valor)
+    return valor
+
+
+def cache_referencia(metodo: Callable) -> Callable:
+    """
+    Decorador para acciones GET de viewsets de catálogo.
+
+    El viewset declara `modelos_referencia`; se cachean solo las respuestas
+    200, por acción, parámetros de URL y query string.
+    """
+
+    @wraps(metodo)
+    def envoltura(self, request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return metodo(self, request, *args, **kwargs)
+
+        descripcion = json.dumps(
+            [
+                type(self).__name__,
+                metodo.__name__,
+                kwargs,
+                sorted(request.query_params.lists()),
+                timezone.localdate().isoformat(),
+            ],
+            sort_keys=True,
+            default=str,
+        )
+        clave = hashlib.sha1(descripcion.encode("utf-8")).hexdigest()
+
+        no_cacheable = []
+
+        def calcular():
+            respuesta = metodo(self, request, *args, **kwargs)
+            if respuesta.status_code != status.HTTP_200_OK:
+                # Errores y 404 no se cachean: se devuelven tal cual
+                no_cacheable.append(respuesta)
+                return None
+            return respuesta.data
+
+        datos = obtener(clave, self.modelos_referencia, calcular)
+        if datos is None:
+            return no_cacheable[0] if no_cacheable else metodo(self, request, *args, **kwargs)
+        return Response(datos, status=status.HTTP_200_OK)
+
+    return envoltura
@@ -0,0 +1,29 @@
+# utils/cache_versiones.py
+"""
+Contadores de versión en la caché compartida
+
+Las cachés por proceso (índice de disponibilidad, catálogos) y las claves de
+la caché compartida se invalidan incrementando un número de versión: quien lo
+lee y no coincide con el suyo recarga o deja de usar sus claves.
+"""
+from typing import Optional
+
+from django.core.cache import cache
+
+
+def incrementar_version(clave: str, timeout: Optional[int] = None) -> int:
+    """
+    Incrementa el contador de versión `clave` de la caché compartida y devuelve
+    su nuevo valor. Por defecto no caduca: una versión que expira podría volver
+    a un valor ya visto. Los errores de la caché se propagan al llamante.
+    """
+    try:
+        version = cache.incr(clave)
+    except ValueError:
+        # La clave no existe todavía (o expiró)
+        if cache.add(clave, 1, timeout=timeout):
+            return 1
+        version = cache.incr(clave)
+    if timeout is not None:
+        cache.touch(clave, timeout)
+    return version
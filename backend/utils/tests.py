@@ -0,0 +1,64 @@
+# utils/tests.py
+"""
+Tests para las utilidades compartidas
+"""
+
+from django.core.cache import cache
+from django.test import TestCase
+from vehiculos.models import Categoria
+
+from .cache_referencia import CacheLRU, lru_referencia
+from .cache_versiones import incrementar_version
+
+
+class CacheVersionesTest(TestCase):
+    """Tests para los contadores de versión de la caché compartida"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_incrementar_version(self):
+        """El contador empieza en 1 y sigue incrementando aunque tenga caducidad"""
+        self.assertEqual(incrementar_version("prueba:version"), 1)
+        self.assertEqual(incrementar_version("prueba:version"), 2)
+        self.assertEqual(incrementar_version("prueba:version", timeout=60), 3)
+
+
+class CacheReferenciaTest(TestCase):
+    """Tests para la caché versionada de datos de referencia"""
+
+    url = "/api/vehiculos/categorias/"
+
+    def setUp(self):
+        cache.clear()
+        lru_referencia.clear()
+        Categoria.objects.create(nombre="Coches")
+
+    def test_segunda_lectura_sin_consultas(self):
+        """Con la respuesta en el LRU del proceso no se consulta la BD"""
+        primera = self.client.get(self.url).json()
+        with self.assertNumQueries(0):
+            segunda = self.client.get(self.url).json()
+        self.assertEqual(primera, segunda)
+        self.assertEqual(segunda["count"], 1)
+
+    def test_cambio_en_el_modelo_invalida(self):
+        """Crear o borrar una categoría cambia su versión y la respuesta"""
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            nueva = Categoria.objects.create(nombre="Furgonetas")
+        self.assertEqual(self.client.get(self.url).json()["count"], 2)
+
+        nueva.delete()
+        self.assertEqual(self.client.get(self.url).json()["count"], 1)
+
+    def test_lru_acotado(self):
+        """El LRU descarta la entrada usada hace más tiempo"""
+        lru = CacheLRU(2)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+        self.assertEqual(len(lru), 2)
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual(lru.get("a"), 1)
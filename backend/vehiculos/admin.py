@@ -1,5 +1,6 @@
 # vehiculos/admin.py
 import logging
+from datetime import timedelta
 from typing import Any, Optional
 
 from django.contrib import admin, messages
@@ -12,11 +13,16 @@ from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 
+from .imagenes import url_variante
 from .models import (Categoria, GrupoCoche, ImagenVehiculo, Mantenimiento,
                      TarifaVehiculo, Vehiculo)
+from .tarifas import seleccionar_tarifa
 
 logger = logging.getLogger("admin_operations")
 
+# Ventana de la analítica de uso que muestra el admin de vehículos
+DIAS_ANALITICA_ADMIN = 90
+
 
 class DisponibilidadFilter(SimpleListFilter):
     """Filtro personalizado para disponibilidad de vehículos"""
@@ -75,7 +81,7 @@ class ImagenVehiculoInline(admin.TabularInline):
 
             # Construir URL de la imagen
             try:
-                imagen_url = obj.imagen.url
+                imagen_url = url_variante(obj, "thumbnail") or obj.imagen.url
                 logger.info(f"[ADMIN] Imagen URL generada: {imagen_url}")
                 
                 # Para desarrollo local, verificar si necesitamos construir URL completa
@@ -274,9 +280,11 @@ class VehiculoAdmin(admin.ModelAdmin):
         "combustible", 
         "disponible", 
         "activo",
+        "lugar_actual",
         "anio",
     )
-    search_fields = ("marca", "modelo", "matricula", "categoria__nombre")
+    # marca/modelo/matrícula usan los índices de trigramas; la categoría, igualdad exacta
+    search_fields = ("marca", "modelo", "matricula", "=categoria__nombre")
     readonly_fields = (
         "created_at", 
         "updated_at",
@@ -317,6 +325,7 @@ class VehiculoAdmin(admin.ModelAdmin):
             {
                 "fields": (
                     ("disponible", "activo"),
+                    "lugar_actual",
                     "fianza",
                     "notas_internas",
                 )
@@ -373,7 +382,7 @@ class VehiculoAdmin(admin.ModelAdmin):
     @admin.display(description="Portada")
     def portada_display(self, obj):
         """Muestra solo la imagen de portada del vehículo"""
-        imagen_portada = obj.imagenes.filter(portada=True).first()
+        imagen_portada = obj.imagen_portada
         if imagen_portada and imagen_portada.imagen:
             import logging
 
@@ -382,7 +391,7 @@ class VehiculoAdmin(admin.ModelAdmin):
             logger = logging.getLogger(__name__)
             
             try:
-                imagen_url = imagen_portada.imagen.url
+                imagen_url = url_variante(imagen_portada, "thumbnail") or imagen_portada.imagen.url
                 logger.info(f"[ADMIN Portada] Imagen URL generada: {imagen_url}")
                 
                 # Para desarrollo local, verificar si necesitamos construir URL completa
@@ -466,59 +475,77 @@ class VehiculoAdmin(admin.ModelAdmin):
     def tarifa_actual(self, obj):
         """Tarifa actual del vehículo"""
         hoy = timezone.now().date()
-        
-        # Buscar tarifa específica activa (con fecha_fin)
-        tarifa_especifica = obj.tarifas.filter(
-            fecha_inicio__lte=hoy,
-            fecha_fin__gte=hoy,
-            fecha_fin__isnull=False
-        ).order_by('-fecha_inicio').first()
-        
-        if tarifa_especifica:
+
+        # Selección en memoria sobre las tarifas ya precargadas (get_queryset)
+        tarifa = seleccionar_tarifa(obj.tarifas.all(), hoy)
+
+        if tarifa and tarifa.fecha_fin:
             return format_html(
                 '<strong style="color: #007bff;">€{}/día</strong><br>'
                 '<small>Válida hasta {}</small>',
-                tarifa_especifica.precio_dia,
-                tarifa_especifica.fecha_fin.strftime("%d/%m/%Y")
+                tarifa.precio_dia,
+                tarifa.fecha_fin.strftime("%d/%m/%Y")
             )
-        
-        # Si no hay tarifa específica, buscar tarifa por defecto (sin fecha_fin)
-        tarifa_defecto = obj.tarifas.filter(
-            fecha_inicio__lte=hoy,
-            fecha_fin__isnull=True
-        ).order_by('-fecha_inicio').first()
-        
-        if tarifa_defecto:
+
+        if tarifa:
             return format_html(
                 '<strong style="color: #28a745;">€{}/día</strong><br>'
                 '<small>Tarifa por defecto</small>',
-                tarifa_defecto.precio_dia
+                tarifa.precio_dia
             )
-        
+
         return format_html(
             '<span style="color: #dc3545;">❌ Sin tarifa</span>'
         )
 
-    def estadisticas_uso(self, obj):
-        """Estadísticas de uso del vehículo"""
-        from reservas.models import Reserva
-        reservas = Reserva.objects.filter(vehiculo=obj)
-        total_reservas = reservas.count()
-        confirmadas = reservas.filter(estado="confirmada").count()
-        
-        if total_reservas > 0:
-            porcentaje_exito = (confirmadas / total_reservas) * 100
-            return format_html(
-                '<strong>{} reservas</strong><br>'
-                '<small>{} confirmadas ({}%)</small>',
-                total_reservas,
-                confirmadas,
-                round(porcentaje_exito, 1)
-            )
-        else:
+    def get_list_display(self, request):
+        """La analítica de uso se lee una vez por listado (cacheada por día) y no por fila"""
+        utilizacion = None
+
+        def estadisticas_uso(obj):
+            nonlocal utilizacion
+            # None = sin leer: una flota vacía o un error ({}) no se repite por fila
+            if utilizacion is None:
+                utilizacion = self._utilizacion_por_vehiculo()
+            return self._formato_estadisticas(utilizacion.get(obj.pk))
+
+        estadisticas_uso.short_description = f"Uso ({DIAS_ANALITICA_ADMIN} días)"
+        return tuple(
+            estadisticas_uso if campo == "estadisticas_uso" else campo
+            for campo in super().get_list_display(request)
+        )
+
+    @staticmethod
+    def _utilizacion_por_vehiculo():
+        from .analitica import utilizacion_cacheada
+
+        hoy = timezone.localdate()
+        try:
+            resultado = utilizacion_cacheada(hoy - timedelta(days=DIAS_ANALITICA_ADMIN - 1), hoy)
+        except Exception as e:
+            logger.error(f"Error obteniendo analítica de utilización: {str(e)}")
+            return {}
+        return {fila["vehiculo_id"]: fila for fila in resultado["vehiculos"]}
+
+    @staticmethod
+    def _formato_estadisticas(fila):
+        if not fila or not fila["reservas"]:
             return format_html(
                 '<span style="color: #6c757d;">Sin reservas</span>'
             )
+        return format_html(
+            '<strong>{} reservas</strong><br>'
+            '<small>{} confirmadas · {}% ocupación</small><br>'
+            '<small>€{}/día disponible</small>',
+            fila["reservas"],
+            fila["reservas_confirmadas"],
+            fila["ocupacion"],
+            fila["ingreso_por_dia_disponible"],
+        )
+
+    def estadisticas_uso(self, obj):
+        """Estadísticas de uso del vehículo"""
+        return self._formato_estadisticas(self._utilizacion_por_vehiculo().get(obj.pk))
 
     def ultimo_mantenimiento(self, obj):
         """Último mantenimiento realizado"""
@@ -583,10 +610,8 @@ class VehiculoAdmin(admin.ModelAdmin):
         return "N/A"
 
     def dias_ocupado(self, obj):
-        from reservas.models import Reserva
-        reservas = Reserva.objects.filter(vehiculo=obj, estado="confirmada")
-        total_dias = sum(reserva.dias_alquiler() for reserva in reservas)
-        return f"{total_dias} días"
+        from .analitica import dias_ocupados_vehiculo
+        return f"{dias_ocupados_vehiculo(obj.pk)} días"
 
     def proximo_mantenimiento(self, obj):
         # Aquí podrías agregar lógica para calcular próximo mantenimiento
@@ -747,7 +772,7 @@ class ImagenVehiculoAdmin(admin.ModelAdmin):
             logger = logging.getLogger(__name__)
 
             try:
-                imagen_url = obj.imagen.url
+                imagen_url = url_variante(obj, "thumbnail") or obj.imagen.url
                 logger.info(f"[ADMIN ImagenVehiculo] Imagen URL generada: {imagen_url}")
                 
                 # Para desarrollo local, verificar si necesitamos construir URL completa
@@ -0,0 +1,285 @@
+# vehiculos/analitica.py
+"""
+Analítica de utilización de la flota
+
+Calcula, para un rango de fechas, la ocupación, los huecos sin alquilar, los
+ingresos por día disponible y la utilización de cada vehículo, y los agrega
+por categoría y por sede.
+
+Cada vehículo es una fila de bits (1 = ocupado ese día), igual que la matriz
+de disponibilidad: cada reserva se pinta con una máscara de bits contiguos y
+los totales salen de operaciones sobre el entero completo (bit_count, AND,
+desplazamientos), sin recorrer días. Las reservas, los mantenimientos y los
+vehículos se leen con una consulta cada uno.
+
+Los resultados se cachean por día y rango con las versiones de la caché de
+disponibilidad (ver cache_disponibilidad.py): un cambio en una reserva del
+rango los invalida.
+"""
+import logging
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+from . import cache_disponibilidad
+
+logger = logging.getLogger(__name__)
+
+# Estados que cuentan como ocupación e ingreso
+ESTADOS_OCUPACION = ("confirmada",)
+
+MAX_DIAS_ANALITICA = 366
+
+
+def dias_ocupados(
+    recogida: datetime, devolucion: datetime, fecha_inicio: date, dias: int
+) -> Optional[Tuple[int, int]]:
+    """
+    Primer y último día (índices desde fecha_inicio) que ocupa una reserva
+    dentro del rango, o None si no lo toca. Una devolución a las 00:00 no
+    ocupa ese día.
+    """
+    primero = max((timezone.localtime(recogida).date() - fecha_inicio).days, 0)
+    fin_ocupado = timezone.localtime(devolucion) - timedelta(microseconds=1)
+    ultimo = min((fin_ocupado.date() - fecha_inicio).days, dias - 1)
+    if ultimo < primero:
+        return None
+    return primero, ultimo
+
+
+def _dias_reserva(recogida: datetime, devolucion: datetime) -> int:
+    """Días naturales que ocupa una reserva completa (al menos 1)"""
+    primero = timezone.localtime(recogida).date()
+    ultimo = (timezone.localtime(devolucion) - timedelta(microseconds=1)).date()
+    return max((ultimo - primero).days + 1, 1)
+
+
+def _mascara(primero: int, ultimo: int) -> int:
+    """Bits primero..ultimo a 1 (bit d = día d)"""
+    return ((1 << (ultimo - primero + 1)) - 1) << primero
+
+
+def _huecos(libres: int) -> Tuple[int, int]:
+    """Número de tramos de días libres y longitud del más largo"""
+    if not libres:
+        return 0, 0
+    # Un tramo empieza donde hay un bit libre y el anterior no lo está
+    tramos = (libres & ~(libres << 1)).bit_count()
+    mas_largo = 0
+    while libres:
+        libres &= libres >> 1
+        mas_largo += 1
+    return tramos, mas_largo
+
+
+def _porcentaje(parte: float, total: float) -> float:
+    return round(parte * 100 / total, 1) if total else 0.0
+
+
+def _agregar(filas: List[Dict[str, Any]], campo: str, dias: int) -> List[Dict[str, Any]]:
+    """Totales de las filas de vehículos agrupadas por `campo`"""
+    grupos: Dict[Any, Dict[str, Any]] = {}
+    for fila in filas:
+        grupo = grupos.setdefault(
+            fila[campo],
+            {campo: fila[campo], "vehiculos": 0, "dias_ocupados": 0, "dias_disponibles": 0,
+             "ingresos": Decimal("0.00"), "reservas": 0},
+        )
+        grupo["vehiculos"] += 1
+        grupo["dias_ocupados"] += fila["dias_ocupados"]
+        grupo["dias_disponibles"] += fila["dias_disponibles"]
+        grupo["ingresos"] += fila["ingresos"]
+        grupo["reservas"] += fila["reservas"]
+
+    resultado = []
+    for grupo in grupos.values():
+        grupo["ocupacion"] = _porcentaje(grupo["dias_ocupados"], grupo["vehiculos"] * dias)
+        grupo["utilizacion"] = _porcentaje(grupo["dias_ocupados"], grupo["dias_disponibles"])
+        grupo["ingreso_por_dia_disponible"] = (
+            round(grupo["ingresos"] / grupo["dias_disponibles"], 2)
+            if grupo["dias_disponibles"] else Decimal("0.00")
+        )
+        resultado.append(grupo)
+    return sorted(resultado, key=lambda grupo: (grupo[campo] is None, grupo[campo] or 0))
+
+
+def calcular_utilizacion(
+    fecha_inicio: date,
+    fecha_fin: date,
+    categoria_id: Optional[int] = None,
+    lugar_id: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Utilización de la flota entre fecha_inicio y fecha_fin (incluidas).
+
+    Por vehículo:
+        dias_ocupados: días con alguna reserva confirmada
+        dias_disponibles: días del rango menos los de mantenimiento sin alquiler
+        ocupacion: % de días ocupados sobre los del rango
+        utilizacion: % de días ocupados sobre los disponibles
+        huecos / hueco_mas_largo: tramos de días libres y el mayor de ellos
+        ingresos: importe de las reservas prorrateado a los días dentro del rango
+        ingreso_por_dia_disponible: ingresos / dias_disponibles
+        reservas / reservas_confirmadas: reservas (cualquier estado) que tocan el rango
+
+    Returns:
+        Dict con "vehiculos", "categorias", "lugares" (sede base) y "flota"
+    """
+    from reservas.models import Reserva
+
+    from .models import Mantenimiento, Vehiculo
+
+    dias = (fecha_fin - fecha_inicio).days + 1
+    if dias <= 0:
+        raise ValueError("La fecha de fin debe ser igual o posterior a la de inicio")
+    if dias > MAX_DIAS_ANALITICA:
+        raise ValueError(f"El rango máximo es de {MAX_DIAS_ANALITICA} días")
+
+    vehiculos = Vehiculo.objects.filter(activo=True)
+    if categoria_id:
+        vehiculos = vehiculos.filter(categoria_id=categoria_id)
+    if lugar_id:
+        vehiculos = vehiculos.filter(lugar_actual_id=lugar_id)
+    fichas = {
+        vehiculo_id: {"matricula": matricula, "categoria_id": cat_id, "lugar_id": sede_id}
+        for vehiculo_id, matricula, cat_id, sede_id in vehiculos.order_by("id").values_list(
+            "id", "matricula", "categoria_id", "lugar_actual_id"
+        )
+    }
+
+    inicio_rango = timezone.make_aware(datetime.combine(fecha_inicio, time.min))
+    fin_rango = inicio_rango + timedelta(days=dias)
+
+    ocupado = dict.fromkeys(fichas, 0)
+    mantenimiento = dict.fromkeys(fichas, 0)
+    ingresos = dict.fromkeys(fichas, Decimal("0.00"))
+    reservas = dict.fromkeys(fichas, 0)
+    confirmadas = dict.fromkeys(fichas, 0)
+
+    for vehiculo_id, estado, recogida, devolucion, precio_total in Reserva.objects.filter(
+        vehiculo_id__in=list(fichas),
+        fecha_recogida__lt=fin_rango,
+        fecha_devolucion__gt=inicio_rango,
+    ).values_list("vehiculo_id", "estado", "fecha_recogida", "fecha_devolucion", "precio_total"):
+        reservas[vehiculo_id] += 1
+        if estado not in ESTADOS_OCUPACION:
+            continue
+        confirmadas[vehiculo_id] += 1
+        tramo = dias_ocupados(recogida, devolucion, fecha_inicio, dias)
+        if tramo is None:
+            continue
+        ocupado[vehiculo_id] |= _mascara(*tramo)
+        # Ingreso prorrateado a los días de la reserva que caen en el rango
+        ingresos[vehiculo_id] += (
+            (precio_total or Decimal("0.00"))
+            * (tramo[1] - tramo[0] + 1)
+            / _dias_reserva(recogida, devolucion)
+        )
+
+    for vehiculo_id, fecha in Mantenimiento.objects.filter(
+        vehiculo_id__in=list(fichas), fecha__gte=inicio_rango, fecha__lt=fin_rango
+    ).values_list("vehiculo_id", "fecha"):
+        dia = (timezone.localtime(fecha).date() - fecha_inicio).days
+        if 0 <= dia < dias:
+            mantenimiento[vehiculo_id] |= 1 << dia
+
+    completo = (1 << dias) - 1
+    filas = []
+    for vehiculo_id, ficha in fichas.items():
+        ocupados = ocupado[vehiculo_id].bit_count()
+        # El mantenimiento solo resta días que no se llegaron a alquilar
+        disponibles = dias - (mantenimiento[vehiculo_id] & ~ocupado[vehiculo_id]).bit_count()
+        huecos, mas_largo = _huecos(completo & ~(ocupado[vehiculo_id] | mantenimiento[vehiculo_id]))
+        importe = ingresos[vehiculo_id].quantize(Decimal("0.01"))
+        filas.append(
+            {
+                "vehiculo_id": vehiculo_id,
+                **ficha,
+                "dias_ocupados": ocupados,
+                "dias_disponibles": disponibles,
+                "ocupacion": _porcentaje(ocupados, dias),
+                "utilizacion": _porcentaje(ocupados, disponibles),
+                "huecos": huecos,
+                "hueco_mas_largo": mas_largo,
+                "ingresos": importe,
+                "ingreso_por_dia_disponible": (
+                    round(importe / disponibles, 2) if disponibles else Decimal("0.00")
+                ),
+                "reservas": reservas[vehiculo_id],
+                "reservas_confirmadas": confirmadas[vehiculo_id],
+            }
+        )
+
+    flota = _agregar([{**fila, "flota": "total"} for fila in filas], "flota", dias)
+    return {
+        "fecha_inicio": fecha_inicio.isoformat(),
+        "fecha_fin": fecha_fin.isoformat(),
+        "dias": dias,
+        "vehiculos": filas,
+        "categorias": _agregar(filas, "categoria_id", dias),
+        "lugares": _agregar(filas, "lugar_id", dias),
+        "flota": flota[0] if flota else None,
+    }
+
+
+def dias_ocupados_vehiculo(vehiculo_id: int) -> int:
+    """
+    Días naturales con alguna reserva confirmada del vehículo en toda su
+    historia: la máscara cubre desde la primera recogida hasta la última
+    devolución, con una consulta.
+    """
+    from reservas.models import Reserva
+
+    reservas = list(
+        Reserva.objects.filter(vehiculo_id=vehiculo_id, estado__in=ESTADOS_OCUPACION).values_list(
+            "fecha_recogida", "fecha_devolucion"
+        )
+    )
+    if not reservas:
+        return 0
+
+    primer_dia = min(timezone.localtime(recogida).date() for recogida, _ in reservas)
+    ultimo_dia = max(
+        (timezone.localtime(devolucion) - timedelta(microseconds=1)).date()
+        for _, devolucion in reservas
+    )
+    dias = (ultimo_dia - primer_dia).days + 1
+    ocupado = 0
+    for recogida, devolucion in reservas:
+        tramo = dias_ocupados(recogida, devolucion, primer_dia, dias)
+        if tramo is not None:
+            ocupado |= _mascara(*tramo)
+    return ocupado.bit_count()
+
+
+def utilizacion_cacheada(
+    fecha_inicio: date,
+    fecha_fin: date,
+    categoria_id: Optional[int] = None,
+    lugar_id: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    calcular_utilizacion() cacheada por día de cálculo y rango; se invalida
+    con los cambios de reservas, vehículos o mantenimientos del rango.
+    """
+    clave = cache_disponibilidad.clave_resultado(
+        cache_disponibilidad.clave_busqueda(
+            fecha_inicio,
+            fecha_fin,
+            analitica=timezone.localdate(),
+            categoria_id=categoria_id,
+            lugar_id=lugar_id,
+        ),
+        fecha_inicio,
+        fecha_fin,
+    )
+    resultado = cache_disponibilidad.obtener_resultado(clave)
+    if resultado is None:
+        resultado = calcular_utilizacion(fecha_inicio, fecha_fin, categoria_id, lugar_id)
+        cache_disponibilidad.guardar_resultado(
+            clave, resultado, timeout=getattr(settings, "ANALITICA_CACHE_TIMEOUT", 60 * 60 * 24)
+        )
+    return resultado
@@ -7,5 +7,5 @@ class VehiculosConfig(AppConfig):
     verbose_name = "Gestión de Vehículos y Ubicaciones"
 
     def ready(self):
-        # Importar señales si las hay
-        pass
+        # Señales que mantienen el índice de disponibilidad sincronizado
+        from . import signals  # noqa: F401
@@ -0,0 +1,177 @@
+# vehiculos/busqueda.py
+"""
+Búsqueda de texto por marca y modelo
+
+- Filtros (`VehiculoFilter`, admin): siguen usando `icontains`. En PostgreSQL
+  los sirven los índices GIN de trigramas sobre UPPER(campo) (migración 0006);
+  en SQLite, los índices NOCASE.
+- Autocompletado: catálogo en memoria de las combinaciones marca/modelo de la
+  flota activa, con listas ordenadas para buscar prefijos por bisección y
+  trigramas precalculados para tolerar erratas. Se reconstruye con una
+  consulta agrupada cuando cambia la versión global de la caché de
+  disponibilidad (cualquier cambio de vehículo la incrementa).
+"""
+import logging
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+from django.db.models import Count
+
+from . import cache_disponibilidad
+
+logger = logging.getLogger(__name__)
+
+LIMITE_POR_DEFECTO = 10
+LIMITE_MAXIMO = 50
+
+# Similitud mínima de trigramas (la misma que el umbral por defecto de pg_trgm)
+UMBRAL_SIMILITUD = 0.3
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sin acentos y con espacios simples"""
+    sin_acentos = unicodedata.normalize("NFKD", texto or "")
+    sin_acentos = "".join(c for c in sin_acentos if not unicodedata.combining(c))
+    return " ".join(sin_acentos.lower().split())
+
+
+def trigramas(texto: str) -> FrozenSet[str]:
+    """Trigramas de cada palabra con el relleno de pg_trgm ("  p", " pa", ...)"""
+    resultado = set()
+    for palabra in texto.split():
+        relleno = f"  {palabra} "
+        resultado.update(relleno[i : i + 3] for i in range(len(relleno) - 2))
+    return frozenset(resultado)
+
+
+class EntradaCatalogo(NamedTuple):
+    marca: str
+    modelo: str
+    vehiculos: int
+    texto: str
+    trigramas: FrozenSet[str]
+
+
+class CatalogoMarcasModelos:
+    """Combinaciones marca/modelo de la flota activa, indexadas para autocompletar"""
+
+    def __init__(self, filas: List[Tuple[str, str, int]]) -> None:
+        self.entradas: List[EntradaCatalogo] = []
+        for marca, modelo, vehiculos in filas:
+            texto = normalizar(f"{marca} {modelo}")
+            self.entradas.append(EntradaCatalogo(marca, modelo, vehiculos, texto, trigramas(texto)))
+
+        # (clave, posición): una clave por palabra inicial posible ("seat ibiza", "ibiza")
+        claves = []
+        for posicion, entrada in enumerate(self.entradas):
+            palabras = entrada.texto.split()
+            claves.extend((" ".join(palabras[i:]), posicion) for i in range(len(palabras)))
+        claves.sort()
+        self._claves = [clave for clave, _posicion in claves]
+        self._posiciones = [posicion for _clave, posicion in claves]
+
+        # Índice invertido trigrama -> posiciones, para la búsqueda por similitud
+        self._por_trigrama: Dict[str, List[int]] = {}
+        for posicion, entrada in enumerate(self.entradas):
+            for trigrama in entrada.trigramas:
+                self._por_trigrama.setdefault(trigrama, []).append(posicion)
+
+    def _por_prefijo(self, termino: str) -> List[int]:
+        posiciones = []
+        i = bisect_left(self._claves, termino)
+        while i < len(self._claves) and self._claves[i].startswith(termino):
+            posiciones.append(self._posiciones[i])
+            i += 1
+        return posiciones
+
+    def sugerir(self, termino: str, limite: int = LIMITE_POR_DEFECTO) -> List[Dict[str, Any]]:
+        """
+        Sugerencias ordenadas por relevancia:
+        1. el texto completo empieza por el término ("seat ib")
+        2. alguna palabra empieza por el término ("ibi")
+        3. trigramas parecidos (erratas: "ibza"), por similitud
+        Dentro de cada nivel, las combinaciones con más vehículos primero.
+        """
+        termino = normalizar(termino)
+        if not termino:
+            return []
+
+        puntuaciones: Dict[int, Tuple[int, float]] = {}
+        for posicion in self._por_prefijo(termino):
+            nivel = 0 if self.entradas[posicion].texto.startswith(termino) else 1
+            puntuaciones[posicion] = min(puntuaciones.get(posicion, (nivel, 0.0)), (nivel, 0.0))
+
+        if len(puntuaciones) < limite:
+            buscados = trigramas(termino)
+            # Trigramas comunes con cada entrada, contados sobre el índice invertido
+            comunes = Counter()
+            for trigrama in buscados:
+                comunes.update(self._por_trigrama.get(trigrama, ()))
+            for posicion, cantidad in comunes.items():
+                if posicion in puntuaciones:
+                    continue
+                union = len(buscados) + len(self.entradas[posicion].trigramas) - cantidad
+                similitud = cantidad / union
+                if similitud >= UMBRAL_SIMILITUD:
+                    puntuaciones[posicion] = (2, -similitud)
+
+        ordenadas = sorted(
+            puntuaciones,
+            key=lambda posicion: (
+                *puntuaciones[posicion],
+                -self.entradas[posicion].vehiculos,
+                self.entradas[posicion].texto,
+            ),
+        )[:limite]
+        return [
+            {
+                "marca": self.entradas[posicion].marca,
+                "modelo": self.entradas[posicion].modelo,
+                "texto": f"{self.entradas[posicion].marca} {self.entradas[posicion].modelo}",
+                "vehiculos": self.entradas[posicion].vehiculos,
+            }
+            for posicion in ordenadas
+        ]
+
+
+_lock = threading.Lock()
+_catalogo: Optional[CatalogoMarcasModelos] = None
+_version_catalogo: Optional[int] = None
+
+
+def _cargar_catalogo() -> CatalogoMarcasModelos:
+    from .models import Vehiculo
+
+    filas = (
+        Vehiculo.objects.filter(activo=True)
+        .exclude(marca="")
+        .values_list("marca", "modelo")
+        .annotate(vehiculos=Count("id"))
+        .order_by()
+    )
+    return CatalogoMarcasModelos(list(filas))
+
+
+def obtener_catalogo() -> CatalogoMarcasModelos:
+    """Catálogo del proceso, recargado si la flota ha cambiado"""
+    global _catalogo, _version_catalogo
+
+    version = cache_disponibilidad.version_global()
+    if _catalogo is not None and version is not None and version == _version_catalogo:
+        return _catalogo
+
+    with _lock:
+        if _catalogo is None or version is None or version != _version_catalogo:
+            _catalogo = _cargar_catalogo()
+            _version_catalogo = version
+            logger.info(f"Catálogo de autocompletado cargado: {len(_catalogo.entradas)} marcas/modelos")
+        return _catalogo
+
+
+def autocompletar(termino: str, limite: int = LIMITE_POR_DEFECTO) -> List[Dict[str, Any]]:
+    """Sugerencias de marca/modelo para el texto escrito por el usuario"""
+    limite = max(1, min(limite, LIMITE_MAXIMO))
+    return obtener_catalogo().sugerir(termino, limite)
@@ -0,0 +1,192 @@
+# vehiculos/cache_disponibilidad.py
+"""
+Caché de resultados de búsquedas de disponibilidad
+
+Guarda la respuesta completa de `VehiculoViewSet.disponibilidad` en la caché
+compartida (Redis en producción), con clave derivada de los parámetros
+normalizados de la búsqueda.
+
+La invalidación es por versiones, sin borrar claves:
+- Cada día del calendario tiene un contador de versión. Una búsqueda incluye
+  en su clave las versiones de los días que cubre su ventana.
+- Un cambio en una Reserva (o en una tarifa con fecha de fin) incrementa solo
+  los días de su ventana, antigua y nueva: las búsquedas que no la solapan
+  siguen sirviéndose desde caché.
+- Un cambio en un Vehículo (o en una tarifa por defecto) afecta a cualquier
+  ventana e incrementa la versión global.
+- La devolución de una reserva fija dónde está el vehículo en todas las
+  ventanas posteriores. Las búsquedas filtradas por lugar incluyen además la
+  versión de ubicaciones, que incrementa cualquier cambio de reserva.
+
+Las entradas obsoletas dejan de ser alcanzables y expiran por su TTL.
+"""
+import hashlib
+import json
+import logging
+from datetime import date, datetime, timedelta
+from datetime import timezone as dt_timezone
+from typing import Any, Dict, List, Optional, Union
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from utils.cache_versiones import incrementar_version
+
+logger = logging.getLogger(__name__)
+
+CABECERA = "X-Disponibilidad-Cache"
+
+PREFIJO = "vehiculos:disponibilidad"
+CLAVE_VERSION_GLOBAL = f"{PREFIJO}:version"
+CLAVE_VERSION_UBICACION = f"{PREFIJO}:version_ubicacion"
+
+# Las versiones deben sobrevivir a cualquier resultado cacheado con ellas
+TIMEOUT_VERSIONES = 60 * 60 * 24 * 30
+
+# Ventanas más largas invalidan la versión global en lugar de día a día
+MAX_DIAS_INVALIDACION = 366
+
+
+def cache_habilitada() -> bool:
+    return getattr(settings, "DISPONIBILIDAD_CACHE_ENABLED", True)
+
+
+def _timeout_resultados() -> int:
+    return getattr(settings, "DISPONIBILIDAD_CACHE_TIMEOUT", 300)
+
+
+def _a_fecha(valor: Union[date, datetime]) -> date:
+    if isinstance(valor, datetime):
+        if timezone.is_aware(valor):
+            valor = timezone.localtime(valor)
+        return valor.date()
+    return valor
+
+
+def _dias(inicio: Union[date, datetime], fin: Union[date, datetime]) -> List[date]:
+    primero, ultimo = _a_fecha(inicio), _a_fecha(fin)
+    if ultimo < primero:
+        primero, ultimo = ultimo, primero
+    return [primero + timedelta(days=n) for n in range((ultimo - primero).days + 1)]
+
+
+def _clave_dia(dia: date) -> str:
+    return f"{PREFIJO}:dia:{dia.isoformat()}"
+
+
+def _normalizar_parametro(valor: Any) -> Optional[str]:
+    if valor in (None, ""):
+        return None
+    if isinstance(valor, datetime):
+        if timezone.is_naive(valor):
+            valor = timezone.make_aware(valor)
+        return valor.astimezone(dt_timezone.utc).replace(second=0, microsecond=0).isoformat()
+    return str(valor).strip().lower()
+
+
+def clave_busqueda(fecha_inicio: datetime, fecha_fin: datetime, **parametros: Any) -> str:
+    """Clave estable para los parámetros de una búsqueda (independiente de su orden y formato)"""
+    normalizados = {
+        "fecha_inicio": _normalizar_parametro(fecha_inicio),
+        "fecha_fin": _normalizar_parametro(fecha_fin),
+    }
+    normalizados.update(
+        {nombre: _normalizar_parametro(valor) for nombre, valor in parametros.items()}
+    )
+    return hashlib.sha1(
+        json.dumps(normalizados, sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def version_global() -> Optional[int]:
+    """Versión global vigente (cambia con cualquier cambio de flota); None si no se puede leer"""
+    try:
+        return cache.get(CLAVE_VERSION_GLOBAL, 0)
+    except Exception as e:
+        logger.warning(f"Error leyendo la versión de la caché de disponibilidad: {str(e)}")
+        return None
+
+
+def clave_resultado(
+    clave: str, fecha_inicio: datetime, fecha_fin: datetime, por_lugar: bool = False
+) -> Optional[str]:
+    """
+    Clave del resultado con las versiones vigentes de la ventana (una sola lectura).
+    Con `por_lugar` incluye también la versión de ubicaciones.
+
+    Debe obtenerse antes de calcular el resultado y usarse tanto para leerlo
+    como para guardarlo: si algo cambia mientras se calcula, el resultado queda
+    guardado bajo versiones ya superadas y nunca se sirve.
+    """
+    if not cache_habilitada():
+        return None
+    nombres = [CLAVE_VERSION_GLOBAL] + ([CLAVE_VERSION_UBICACION] if por_lugar else [])
+    nombres += [_clave_dia(dia) for dia in _dias(fecha_inicio, fecha_fin)]
+    try:
+        versiones = cache.get_many(nombres)
+    except Exception as e:
+        logger.warning(f"Error leyendo versiones de la caché de disponibilidad: {str(e)}")
+        return None
+    firma = ".".join(str(versiones.get(nombre, 0)) for nombre in nombres)
+    return f"{PREFIJO}:resultado:{clave}:{hashlib.sha1(firma.encode('utf-8')).hexdigest()}"
+
+
+def obtener_resultado(clave_versionada: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Devuelve el resultado cacheado de la búsqueda o None"""
+    if not clave_versionada:
+        return None
+    try:
+        return cache.get(clave_versionada)
+    except Exception as e:
+        logger.warning(f"Error leyendo caché de disponibilidad: {str(e)}")
+        return None
+
+
+def guardar_resultado(
+    clave_versionada: Optional[str], resultado: Dict[str, Any], timeout: Optional[int] = None
+) -> None:
+    """Guarda el resultado de la búsqueda bajo la clave obtenida antes de calcularlo"""
+    if not clave_versionada:
+        return
+    try:
+        cache.set(clave_versionada, resultado, timeout=timeout or _timeout_resultados())
+    except Exception as e:
+        logger.warning(f"Error guardando caché de disponibilidad: {str(e)}")
+
+
+def invalidar_todo() -> None:
+    """Invalida todas las búsquedas cacheadas"""
+    try:
+        incrementar_version(CLAVE_VERSION_GLOBAL, TIMEOUT_VERSIONES)
+    except Exception as e:
+        logger.warning(f"Error invalidando caché de disponibilidad: {str(e)}")
+
+
+def invalidar_ubicaciones() -> None:
+    """Invalida las búsquedas filtradas por lugar, en cualquier ventana"""
+    try:
+        incrementar_version(CLAVE_VERSION_UBICACION, TIMEOUT_VERSIONES)
+    except Exception as e:
+        logger.warning(f"Error invalidando caché de disponibilidad: {str(e)}")
+        invalidar_todo()
+
+
+def invalidar_periodo(
+    inicio: Optional[Union[date, datetime]], fin: Optional[Union[date, datetime]]
+) -> None:
+    """Invalida las búsquedas cuya ventana incluye algún día del período"""
+    if inicio is None or fin is None:
+        invalidar_todo()
+        return
+
+    dias = _dias(inicio, fin)
+    if len(dias) > MAX_DIAS_INVALIDACION:
+        invalidar_todo()
+        return
+
+    try:
+        for dia in dias:
+            incrementar_version(_clave_dia(dia), TIMEOUT_VERSIONES)
+    except Exception as e:
+        logger.warning(f"Error invalidando caché de disponibilidad: {str(e)}")
+        invalidar_todo()
@@ -0,0 +1,89 @@
+# vehiculos/facetas.py
+"""
+Facetas (opciones de filtrado con conteos) para listados y búsquedas de vehículos
+
+Las facetas se calculan con un único agregado agrupado por las columnas
+facetadas y se guardan en la caché compartida junto a la búsqueda, con las
+mismas versiones que la caché de disponibilidad (ver cache_disponibilidad.py):
+un cambio de flota, tarifa o reserva que afecte a la ventana las invalida.
+"""
+import logging
+from datetime import date, datetime
+from typing import Any, Dict, Union
+
+from django.db.models import Count, QuerySet
+
+from . import cache_disponibilidad
+from .pagination import ETIQUETAS_ORDEN
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_FACETA = ("marca", "modelo", "combustible")
+
+
+def facetas_vacias() -> Dict[str, Any]:
+    return {
+        **{campo: [] for campo in CAMPOS_FACETA},
+        "orden": list(ETIQUETAS_ORDEN),
+        "conteos": {campo: {} for campo in CAMPOS_FACETA},
+    }
+
+
+def calcular_facetas(vehiculos: QuerySet) -> Dict[str, Any]:
+    """
+    Valores distintos y número de vehículos por valor con una sola consulta.
+
+    Returns:
+        Dict compatible con `filterOptions`: listas ordenadas de valores por
+        campo, las opciones de orden y `conteos` {campo: {valor: total}}
+    """
+    conteos: Dict[str, Dict[str, int]] = {campo: {} for campo in CAMPOS_FACETA}
+
+    # Una fila por combinación distinta: se pliega en memoria por campo
+    for fila in (
+        vehiculos.order_by().values(*CAMPOS_FACETA).annotate(total=Count("id", distinct=True))
+    ):
+        for campo in CAMPOS_FACETA:
+            valor = fila[campo]
+            if valor:
+                conteos[campo][valor] = conteos[campo].get(valor, 0) + fila["total"]
+
+    facetas = facetas_vacias()
+    for campo in CAMPOS_FACETA:
+        facetas[campo] = sorted(conteos[campo])
+        facetas["conteos"][campo] = {valor: conteos[campo][valor] for valor in facetas[campo]}
+    return facetas
+
+
+def facetas_cacheadas(
+    clave: str,
+    vehiculos: QuerySet,
+    fecha_inicio: Union[date, datetime],
+    fecha_fin: Union[date, datetime],
+    por_lugar: bool = False,
+) -> Dict[str, Any]:
+    """
+    Facetas de una búsqueda, desde caché si ya se calcularon para la misma
+    búsqueda y nada ha cambiado en su ventana.
+
+    Args:
+        clave: Clave de la búsqueda (cache_disponibilidad.clave_busqueda), sin paginación
+        vehiculos: QuerySet de los vehículos resultantes
+        fecha_inicio, fecha_fin: Ventana de la búsqueda (para las versiones de caché)
+        por_lugar: Si la búsqueda filtra por lugar (ver cache_disponibilidad)
+    """
+    clave_versionada = cache_disponibilidad.clave_resultado(
+        f"facetas:{clave}", fecha_inicio, fecha_fin, por_lugar
+    )
+    facetas = cache_disponibilidad.obtener_resultado(clave_versionada)
+    if facetas is not None:
+        return facetas
+
+    try:
+        facetas = calcular_facetas(vehiculos)
+    except Exception as e:
+        logger.error(f"Error calculando facetas: {str(e)}")
+        return facetas_vacias()
+
+    cache_disponibilidad.guardar_resultado(clave_versionada, facetas)
+    return facetas
@@ -5,6 +5,7 @@ Filtros para las vistas de vehículos
 import django_filters
 
 from .models import Vehiculo
+from .tarifas import ANOTACION_PRECIO, anotar_precio_dia
 
 
 class VehiculoFilter(django_filters.FilterSet):
@@ -20,12 +21,10 @@ class VehiculoFilter(django_filters.FilterSet):
             ("electrico", "Eléctrico"),
         ]
     )
-    precio_min = django_filters.NumberFilter(
-        field_name="tarifas__precio_dia", lookup_expr="gte"
-    )
-    precio_max = django_filters.NumberFilter(
-        field_name="tarifas__precio_dia", lookup_expr="lte"
-    )
+    # Sobre el precio vigente hoy (anotado con una subconsulta), no sobre
+    # cualquier tarifa histórica o futura: sin JOIN ni filas duplicadas
+    precio_min = django_filters.NumberFilter(method="filtrar_precio", lookup_expr="gte")
+    precio_max = django_filters.NumberFilter(method="filtrar_precio", lookup_expr="lte")
     num_puertas = django_filters.NumberFilter()
     num_pasajeros = django_filters.NumberFilter()
 
@@ -40,3 +39,11 @@ class VehiculoFilter(django_filters.FilterSet):
             "num_puertas",
             "num_pasajeros",
         ]
+
+    def filtrar_precio(self, queryset, name, value):
+        """Filtra por la anotación `precio_dia_vigente` (también usada para ordenar)"""
+        lookup_expr = self.filters[name].lookup_expr
+        # Los vehículos sin tarifa (0.00) no tienen precio: nunca entran en un rango
+        return anotar_precio_dia(queryset).filter(
+            **{f"{ANOTACION_PRECIO}__{lookup_expr}": value, f"{ANOTACION_PRECIO}__gt": 0}
+        )
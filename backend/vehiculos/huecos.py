@@ -0,0 +1,188 @@
+# vehiculos/huecos.py
+"""
+Búsqueda de ventanas libres alternativas
+
+Cuando una búsqueda de disponibilidad no encuentra vehículos, se proponen las
+ventanas de la misma duración más cercanas a las fechas pedidas y, para las
+categorías (o grupos) vecinas, la ventana más cercana de cada una.
+
+Las ventanas de reserva de cada vehículo están ordenadas por inicio
+(IntervalosVehiculo), así que sus huecos libres salen de un único recorrido
+con el máximo acumulado de las fechas de fin. En cada hueco donde cabe el
+alquiler, el inicio más cercano al pedido es el pedido acotado al hueco.
+"""
+from datetime import datetime, timedelta
+from typing import (Any, Dict, Hashable, Iterator, List, Mapping, Optional,
+                    Set, Tuple)
+
+from django.utils import timezone
+
+# Las alternativas se buscan hasta estos días antes y después de la fecha pedida
+DIAS_BUSQUEDA = 30
+
+# Los inicios propuestos se alinean a esta granularidad
+GRANULARIDAD = timedelta(minutes=30)
+
+SUGERENCIAS_POR_DEFECTO = 3
+
+
+def _alinear(momento: datetime, arriba: bool) -> datetime:
+    """Alinea un instante a la granularidad (hacia arriba o hacia abajo)"""
+    base = momento.replace(minute=0, second=0, microsecond=0)
+    pasos = (momento - base) // GRANULARIDAD
+    alineado = base + pasos * GRANULARIDAD
+    if arriba and alineado < momento:
+        alineado += GRANULARIDAD
+    return alineado
+
+
+def huecos_libres(
+    ventanas: Any, desde: datetime, hasta: datetime
+) -> Iterator[Tuple[datetime, datetime]]:
+    """
+    Huecos libres [a, b) de un vehículo dentro de [desde, hasta).
+
+    Args:
+        ventanas: IntervalosVehiculo del vehículo (o None si no tiene reservas)
+    """
+    actual = desde
+    if ventanas is not None:
+        for inicio, fin in zip(ventanas.inicios, ventanas.fines, strict=True):
+            if inicio >= hasta:
+                break
+            if fin <= actual:
+                continue
+            if inicio > actual:
+                yield actual, inicio
+            actual = fin
+    if actual < hasta:
+        yield actual, hasta
+
+
+def _inicio_mas_cercano(
+    hueco: Tuple[datetime, datetime], objetivo: datetime, duracion: timedelta
+) -> Optional[datetime]:
+    """Inicio alineado más cercano a `objetivo` para el que el alquiler cabe en el hueco"""
+    primero, ultimo = hueco[0], hueco[1] - duracion
+    if ultimo < primero:
+        return None
+    if objetivo <= primero:
+        inicio = _alinear(primero, arriba=True)
+    elif objetivo >= ultimo:
+        inicio = _alinear(ultimo, arriba=False)
+    else:
+        inicio = objetivo
+    return inicio if primero <= inicio <= ultimo else None
+
+
+def _ubicado_en(ventanas: Any, ficha: Any, momento: datetime, lugar_id: Optional[int]) -> bool:
+    if lugar_id is None:
+        return True
+    ubicacion = (ventanas.lugar_en(momento) if ventanas is not None else None) or ficha.lugar_id
+    return ubicacion is None or ubicacion == lugar_id
+
+
+def sugerir_ventanas(
+    intervalos: Mapping[int, Any],
+    fichas: Mapping[int, Any],
+    fecha_inicio: datetime,
+    fecha_fin: datetime,
+    categoria_id: Optional[int] = None,
+    grupo_id: Optional[int] = None,
+    lugar_id: Optional[int] = None,
+    limite: int = SUGERENCIAS_POR_DEFECTO,
+    ahora: Optional[datetime] = None,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Ventanas alternativas de la misma duración que [fecha_inicio, fecha_fin).
+
+    Args:
+        intervalos: {vehiculo_id: IntervalosVehiculo} con las reservas activas
+        fichas: {vehiculo_id: FichaVehiculo}
+        categoria_id, grupo_id, lugar_id: Criterios de la búsqueda original
+        limite: Número máximo de ventanas por lista
+
+    Returns:
+        {
+            "fechas": ventanas más cercanas con los mismos criterios,
+            "alternativas": la ventana más cercana de cada categoría vecina
+                            (otros grupos de la categoría si se filtró por
+                            grupo; otras categorías si se filtró por categoría)
+        }
+        Cada ventana: {"fecha_inicio", "fecha_fin", "diferencia_horas",
+        "vehiculos": [ids], "categoria_id", "grupo_id"}
+    """
+    duracion = fecha_fin - fecha_inicio
+    ahora = _alinear(ahora or timezone.now(), arriba=True)
+    desde = max(fecha_inicio - timedelta(days=DIAS_BUSQUEDA), ahora)
+    hasta = fecha_fin + timedelta(days=DIAS_BUSQUEDA)
+    categoria_id = int(categoria_id) if categoria_id else None
+    grupo_id = int(grupo_id) if grupo_id else None
+    lugar_id = int(lugar_id) if lugar_id else None
+
+    def grupo_de(ficha) -> Optional[Hashable]:
+        """Grupo de resultados de un vehículo: "pedido", una clave vecina o None (descartado)"""
+        if categoria_id and ficha.categoria_id != categoria_id:
+            return None if grupo_id else ("categoria", ficha.categoria_id)
+        if grupo_id and ficha.grupo_id != grupo_id:
+            return ("grupo", ficha.grupo_id)
+        return "pedido"
+
+    # Un recorrido por vehículo: su inicio factible más cercano en cada hueco
+    candidatos: Dict[Hashable, Dict[datetime, Set[int]]] = {}
+    miembros: Dict[Hashable, List[int]] = {}
+    for vehiculo_id, ficha in fichas.items():
+        if not (ficha.activo and ficha.disponible):
+            continue
+        clave = grupo_de(ficha)
+        if clave is None:
+            continue
+        miembros.setdefault(clave, []).append(vehiculo_id)
+        ventanas = intervalos.get(vehiculo_id)
+        for hueco in huecos_libres(ventanas, desde, hasta):
+            inicio = _inicio_mas_cercano(hueco, fecha_inicio, duracion)
+            if inicio is not None and _ubicado_en(ventanas, ficha, inicio, lugar_id):
+                candidatos.setdefault(clave, {}).setdefault(inicio, set()).add(vehiculo_id)
+
+    def mas_cercanas(clave: Hashable, cantidad: int) -> List[Dict[str, Any]]:
+        inicios = sorted(
+            candidatos.get(clave, {}), key=lambda inicio: (abs(inicio - fecha_inicio), inicio)
+        )[:cantidad]
+        resultado = []
+        for inicio in inicios:
+            fin = inicio + duracion
+            # Todos los vehículos del grupo libres en esa ventana, no solo los que la propusieron
+            libres = sorted(
+                vehiculo_id
+                for vehiculo_id in miembros[clave]
+                if not (
+                    intervalos.get(vehiculo_id) is not None
+                    and intervalos[vehiculo_id].solapa(inicio, fin)
+                )
+                and _ubicado_en(intervalos.get(vehiculo_id), fichas[vehiculo_id], inicio, lugar_id)
+            )
+            muestra = fichas[libres[0]]
+            resultado.append(
+                {
+                    "fecha_inicio": inicio,
+                    "fecha_fin": fin,
+                    "diferencia_horas": round((inicio - fecha_inicio).total_seconds() / 3600, 1),
+                    "vehiculos": libres,
+                    "categoria_id": muestra.categoria_id,
+                    "grupo_id": muestra.grupo_id,
+                }
+            )
+        return resultado
+
+    alternativas = [
+        ventana
+        for clave in candidatos
+        if clave != "pedido"
+        for ventana in mas_cercanas(clave, 1)
+    ]
+    alternativas.sort(key=lambda ventana: (abs(ventana["diferencia_horas"]), ventana["fecha_inicio"]))
+
+    return {
+        "fechas": mas_cercanas("pedido", limite),
+        "alternativas": alternativas[:limite],
+    }
@@ -0,0 +1,248 @@
+# vehiculos/imagenes.py
+"""
+Variantes redimensionadas de las imágenes de vehículos
+
+Tras subir una ImagenVehiculo se generan, fuera del hilo de la petición,
+versiones reducidas (thumbnail, card, hero) en WebP y, si Pillow lo soporta,
+AVIF. Se guardan junto al original con claves deterministas:
+
+    vehiculos/2025/06/vehiculo_7_..._ab12cd34.jpg
+    vehiculos/2025/06/variantes/vehiculo_7_..._ab12cd34_card.webp
+
+y se registran en `ImagenVehiculo.variantes`, de modo que los serializers
+construyen el `srcset` sin consultar el almacenamiento (B2).
+"""
+import logging
+import os
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import IO, Any, Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Ancho máximo de cada variante (nunca se amplía el original)
+VARIANTES = {
+    "thumbnail": 320,
+    "card": 640,
+    "hero": 1280,
+}
+
+CARPETA_VARIANTES = "variantes"
+
+# Tipo MIME por formato, para <source type="..."> en el frontend
+TIPOS_MIME = {
+    "webp": "image/webp",
+    "avif": "image/avif",
+}
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def variantes_habilitadas() -> bool:
+    return getattr(settings, "IMAGENES_VARIANTES_ENABLED", True)
+
+
+def formatos_disponibles() -> List[str]:
+    """Formatos de salida que soporta la instalación de Pillow"""
+    from PIL import features
+
+    return [formato for formato in TIPOS_MIME if features.check(formato)]
+
+
+def _calidad() -> int:
+    return getattr(settings, "IMAGENES_VARIANTES_CALIDAD", 80)
+
+
+def dimensiones_desde_cabecera(archivo: IO[bytes]) -> Optional[Tuple[int, int]]:
+    """
+    (ancho, alto) de una imagen leyendo solo su cabecera.
+
+    Image.open() identifica el formato y el tamaño sin decodificar los
+    píxeles; el flujo se deja en su posición original para el guardado.
+    Tiene en cuenta la orientación EXIF, igual que las variantes.
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        posicion = archivo.tell()
+    except (AttributeError, OSError):
+        posicion = None
+    try:
+        with Image.open(archivo) as imagen:
+            ancho, alto = imagen.size
+            try:
+                # 5-8: rotada 90º/270º
+                if imagen.getexif().get(0x0112) in (5, 6, 7, 8):
+                    ancho, alto = alto, ancho
+            except Exception:
+                pass
+            return ancho, alto
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        logger.warning(f"No se pudieron leer las dimensiones de la imagen: {str(e)}")
+        return None
+    finally:
+        if posicion is not None:
+            archivo.seek(posicion)
+
+
+def ruta_variante(nombre_original: str, variante: str, formato: str) -> str:
+    """Clave determinista de una variante a partir de la ruta del original"""
+    carpeta, archivo = posixpath.split(nombre_original)
+    base = os.path.splitext(archivo)[0]
+    return posixpath.join(carpeta, CARPETA_VARIANTES, f"{base}_{variante}.{formato}")
+
+
+def variantes_vigentes(imagen: Any) -> Dict[str, Any]:
+    """Variantes registradas si corresponden al archivo actual de la imagen"""
+    variantes = imagen.variantes or {}
+    if not imagen.imagen or variantes.get("origen") != imagen.imagen.name:
+        return {}
+    return variantes
+
+
+def generar_variantes(imagen: Any, forzar: bool = False) -> Dict[str, Any]:
+    """
+    Genera y guarda las variantes de una ImagenVehiculo.
+
+    Args:
+        imagen: ImagenVehiculo con archivo
+        forzar: Regenerar aunque ya estén registradas para el archivo actual
+
+    Returns:
+        Dict guardado en `imagen.variantes` ({} si no hay archivo)
+    """
+    from PIL import Image, ImageOps
+
+    from . import cache_disponibilidad
+    from .models import ImagenVehiculo
+
+    if not imagen.imagen:
+        return {}
+    if not forzar and variantes_vigentes(imagen):
+        return imagen.variantes
+
+    nombre_original = imagen.imagen.name
+    formatos = formatos_disponibles()
+    storage = imagen.imagen.storage or default_storage
+
+    with storage.open(nombre_original, "rb") as archivo:
+        original = ImageOps.exif_transpose(Image.open(archivo))
+        original.load()
+    if original.mode not in ("RGB", "RGBA"):
+        original = original.convert("RGBA" if "transparency" in original.info else "RGB")
+
+    variantes: Dict[str, Any] = {"origen": nombre_original}
+    for variante, ancho_maximo in VARIANTES.items():
+        reducida = original.copy()
+        reducida.thumbnail((ancho_maximo, ancho_maximo * 4), Image.LANCZOS)
+        datos = {"ancho": reducida.width, "alto": reducida.height}
+
+        for formato in formatos:
+            ruta = ruta_variante(nombre_original, variante, formato)
+            buffer = BytesIO()
+            reducida.save(buffer, format=formato.upper(), quality=_calidad())
+            # Clave determinista: se sustituye la versión anterior si existe
+            if storage.exists(ruta):
+                storage.delete(ruta)
+            datos[formato] = storage.save(ruta, ContentFile(buffer.getvalue()))
+
+        variantes[variante] = datos
+
+    # update() no dispara señales: no se vuelve a programar la generación.
+    # Las imágenes antiguas sin dimensiones las toman del original ya decodificado
+    campos = {"variantes": variantes}
+    if not imagen.ancho or not imagen.alto:
+        campos.update(ancho=original.width, alto=original.height)
+    ImagenVehiculo.objects.filter(id=imagen.id).update(**campos)
+    for campo, valor in campos.items():
+        setattr(imagen, campo, valor)
+    cache_disponibilidad.invalidar_todo()
+
+    logger.info(
+        f"Variantes generadas para imagen {imagen.id}: "
+        f"{len(VARIANTES)} tamaños en {', '.join(formatos) or 'ningún formato'}"
+    )
+    return variantes
+
+
+def eliminar_variantes(variantes: Dict[str, Any]) -> None:
+    """Borra del almacenamiento los archivos de unas variantes"""
+    for variante in VARIANTES:
+        for formato in TIPOS_MIME:
+            ruta = (variantes.get(variante) or {}).get(formato)
+            if not ruta:
+                continue
+            try:
+                default_storage.delete(ruta)
+            except Exception as e:
+                logger.warning(f"No se pudo borrar la variante {ruta}: {str(e)}")
+
+
+def _procesar(imagen_id: int) -> None:
+    from .models import ImagenVehiculo
+
+    close_old_connections()
+    try:
+        imagen = ImagenVehiculo.objects.filter(id=imagen_id).first()
+        if imagen:
+            generar_variantes(imagen)
+    except Exception as e:
+        logger.error(f"Error generando variantes de la imagen {imagen_id}: {str(e)}", exc_info=True)
+    finally:
+        close_old_connections()
+
+
+def _obtener_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, "IMAGENES_VARIANTES_WORKERS", 2),
+            thread_name_prefix="variantes-imagen",
+        )
+    return _executor
+
+
+def programar_variantes(imagen_id: int) -> None:
+    """
+    Genera las variantes cuando se confirma la transacción, en un hilo de
+    fondo (o en el mismo hilo si IMAGENES_VARIANTES_ASINCRONAS=False).
+    """
+    if not variantes_habilitadas():
+        return
+
+    def _lanzar():
+        if getattr(settings, "IMAGENES_VARIANTES_ASINCRONAS", True):
+            _obtener_executor().submit(_procesar, imagen_id)
+        else:
+            _procesar(imagen_id)
+
+    transaction.on_commit(_lanzar)
+
+
+def construir_srcset(
+    imagen: Any, formato: str, construir_url: Callable[[str], Optional[str]]
+) -> Optional[str]:
+    """srcset ("url 320w, url 640w, ...") de una imagen en un formato, o None"""
+    variantes = variantes_vigentes(imagen)
+    partes = []
+    for variante in VARIANTES:
+        datos = variantes.get(variante) or {}
+        if datos.get(formato):
+            url = construir_url(default_storage.url(datos[formato]))
+            partes.append(f"{url} {datos['ancho']}w")
+    return ", ".join(partes) or None
+
+
+def url_variante(imagen: Any, variante: str) -> Optional[str]:
+    """URL relativa al almacenamiento de una variante (el primer formato disponible)"""
+    datos = variantes_vigentes(imagen).get(variante) or {}
+    for formato in TIPOS_MIME:
+        if datos.get(formato):
+            return default_storage.url(datos[formato])
+    return None
@@ -0,0 +1,591 @@
+# vehiculos/indice_disponibilidad.py
+"""
+Índice de disponibilidad en memoria
+
+Mantiene, por cada vehículo, una estructura ordenada con las ventanas de
+reservas activas. Las búsquedas de disponibilidad filtran la flota en memoria
+y solo consultan la base de datos para hidratar los vehículos finales.
+
+El índice se carga al arrancar el worker (ver config/wsgi.py) o de forma
+perezosa en la primera consulta, y se mantiene actualizado mediante las
+señales de Reserva y Vehiculo (ver vehiculos/signals.py). Como cada worker
+tiene su propia copia, los cambios se publican como un número de versión en
+la caché compartida: si un worker detecta una versión que no ha aplicado él
+mismo, recarga el índice completo. La coherencia entre workers depende de que
+esa caché sea realmente compartida (Redis): con LocMemCache cada worker tiene
+su propio contador y no ve los cambios de los demás, por lo que solo es válido
+con un único proceso (se avisa al precargar).
+
+Cada worker publica además periódicamente un informe con su versión y una
+huella de su contenido (ver `verificar_indice_disponibilidad`), que permite
+detectar desde fuera un índice que se ha desviado de la base de datos.
+
+Ubicación: un vehículo está, en un momento dado, en el lugar de devolución de
+su última reserva terminada antes de ese momento o, si no la hay, en su sede
+base (`lugar_actual`). Al cargar se resuelve la ubicación actual de cada
+vehículo y las reservas futuras del índice aportan las siguientes. Para no recorrer toda la flota en búsquedas por sede se
+mantiene por cada lugar el conjunto de vehículos que pueden estar allí (por
+`lugar_actual` o por alguna devolución); solo esos candidatos se comprueban.
+"""
+import hashlib
+import logging
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+from typing import (Any, Dict, Iterable, List, Mapping, NamedTuple, Optional,
+                    Tuple)
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from reservas.models import Reserva
+from utils.cache_versiones import incrementar_version
+
+logger = logging.getLogger(__name__)
+
+# Estados de reserva que bloquean el vehículo: los mismos que comprueba
+# Reserva.save y la restricción de exclusión
+ESTADOS_ACTIVOS = Reserva.ESTADOS_ACTIVOS
+
+# Estados de reserva cuya devolución determina dónde queda el vehículo
+ESTADOS_UBICACION = ESTADOS_ACTIVOS
+
+CACHE_KEY_VERSION = "vehiculos:indice_disponibilidad:version"
+CACHE_KEY_WORKERS = "vehiculos:indice_disponibilidad:workers"
+
+# Cada cuánto publica un worker el informe de su índice
+INTERVALO_INFORME = 60
+
+
+def ubicacion_en(momento: datetime) -> Coalesce:
+    """
+    Expresión para anotar en un QuerySet de vehículos su lugar en `momento`:
+    devolución de la última reserva terminada antes o, si no hay, la sede base
+    """
+    ultima_devolucion = (
+        Reserva.objects.filter(
+            vehiculo=OuterRef("pk"),
+            estado__in=ESTADOS_UBICACION,
+            fecha_devolucion__lte=momento,
+            lugar_devolucion__isnull=False,
+        )
+        .order_by("-fecha_devolucion")
+        .values("lugar_devolucion_id")[:1]
+    )
+    return Coalesce(
+        Subquery(ultima_devolucion), "lugar_actual_id", output_field=IntegerField()
+    )
+
+
+def _leer_fichas(
+    modelo_vehiculo: Any, vehiculo_ids: Optional[Iterable[int]] = None
+) -> Dict[int, "FichaVehiculo"]:
+    """Fichas de los vehículos con su ubicación actual ya resuelta"""
+    vehiculos = modelo_vehiculo.objects.all()
+    if vehiculo_ids is not None:
+        vehiculos = vehiculos.filter(id__in=vehiculo_ids)
+    return {
+        vehiculo_id: FichaVehiculo(categoria_id, grupo_id, activo, disponible, lugar_id)
+        for vehiculo_id, categoria_id, grupo_id, activo, disponible, lugar_id in (
+            vehiculos.annotate(ubicacion=ubicacion_en(timezone.now())).values_list(
+                "id", "categoria_id", "grupo_id", "activo", "disponible", "ubicacion"
+            )
+        )
+    }
+
+
+def _referenciar(
+    por_lugar: Dict[Optional[int], Dict[int, int]],
+    lugar_id: Optional[int],
+    vehiculo_id: int,
+    delta: int,
+) -> None:
+    """Suma o resta una referencia del vehículo al lugar (None = sin ubicación)"""
+    vehiculos = por_lugar.setdefault(lugar_id, {})
+    total = vehiculos.get(vehiculo_id, 0) + delta
+    if total > 0:
+        vehiculos[vehiculo_id] = total
+    else:
+        vehiculos.pop(vehiculo_id, None)
+
+
+def _normalizar_fecha(fecha: datetime) -> datetime:
+    """Asegura que la fecha sea aware para poder compararla con las del índice"""
+    if timezone.is_naive(fecha):
+        return timezone.make_aware(fecha)
+    return fecha
+
+
+def huella(
+    reservas: Iterable[Tuple[int, int, datetime, datetime]], fichas: Mapping[int, "FichaVehiculo"]
+) -> str:
+    """
+    Huella del contenido de un índice: reservas (id, vehículo, inicio, fin) y
+    fichas sin la ubicación, que depende del momento en que se resolvió.
+    """
+    contenido = repr((
+        sorted(
+            (reserva_id, vehiculo_id, inicio.timestamp(), fin.timestamp())
+            for reserva_id, vehiculo_id, inicio, fin in reservas
+        ),
+        sorted((vehiculo_id, tuple(ficha[:4])) for vehiculo_id, ficha in fichas.items()),
+    ))
+    return hashlib.sha1(contenido.encode("utf-8")).hexdigest()
+
+
+def huella_bd(ahora: datetime) -> str:
+    """Huella que tendría un índice coherente con la BD en `ahora`"""
+    from .models import Vehiculo
+
+    reservas = Reserva.objects.filter(
+        estado__in=ESTADOS_ACTIVOS, fecha_devolucion__gt=ahora
+    ).values_list("id", "vehiculo_id", "fecha_recogida", "fecha_devolucion")
+    return huella(reservas, _leer_fichas(Vehiculo))
+
+
+def _clave_informe(worker: str) -> str:
+    return f"vehiculos:indice_disponibilidad:informe:{worker}"
+
+
+def informes_workers() -> Dict[str, Dict[str, Any]]:
+    """Último informe publicado por cada worker vivo"""
+    registro = cache.get(CACHE_KEY_WORKERS) or {}
+    informes = cache.get_many([_clave_informe(worker) for worker in registro])
+    return {informe["worker"]: informe for informe in informes.values()}
+
+
+class FichaVehiculo(NamedTuple):
+    """Datos mínimos del vehículo necesarios para filtrar la flota en memoria"""
+
+    categoria_id: Optional[int]
+    grupo_id: Optional[int]
+    activo: bool
+    disponible: bool
+    lugar_id: Optional[int] = None
+
+
+class IntervalosVehiculo:
+    """
+    Ventanas de reserva de un vehículo ordenadas por fecha de inicio.
+
+    Además de las listas paralelas ordenadas se mantiene el máximo acumulado
+    de las fechas de fin, de modo que la comprobación de solapamiento es una
+    búsqueda binaria aunque existan ventanas solapadas entre sí.
+    """
+
+    __slots__ = ("inicios", "fines", "reservas", "lugares", "_max_fin")
+
+    def __init__(self) -> None:
+        self.inicios: List[datetime] = []
+        self.fines: List[datetime] = []
+        self.reservas: List[int] = []
+        # Lugar de devolución de cada ventana
+        self.lugares: List[Optional[int]] = []
+        self._max_fin: List[datetime] = []
+
+    def __len__(self) -> int:
+        return len(self.reservas)
+
+    def agregar(
+        self,
+        reserva_id: int,
+        inicio: datetime,
+        fin: datetime,
+        lugar_devolucion_id: Optional[int] = None,
+    ) -> None:
+        posicion = bisect_left(self.inicios, inicio)
+        self.inicios.insert(posicion, inicio)
+        self.fines.insert(posicion, fin)
+        self.reservas.insert(posicion, reserva_id)
+        self.lugares.insert(posicion, lugar_devolucion_id)
+        self._recalcular_max_fin(posicion)
+
+    def eliminar(self, reserva_id: int) -> bool:
+        try:
+            posicion = self.reservas.index(reserva_id)
+        except ValueError:
+            return False
+        del self.inicios[posicion]
+        del self.fines[posicion]
+        del self.reservas[posicion]
+        del self.lugares[posicion]
+        self._recalcular_max_fin(posicion)
+        return True
+
+    def lugar_en(self, momento: datetime) -> Optional[int]:
+        """Lugar de devolución de la última ventana terminada antes de `momento` (o None)"""
+        mejor = None
+        for i in range(bisect_left(self.inicios, momento) - 1, -1, -1):
+            if (
+                self.lugares[i] is not None
+                and self.fines[i] <= momento
+                and (mejor is None or self.fines[i] > self.fines[mejor])
+            ):
+                mejor = i
+        return self.lugares[mejor] if mejor is not None else None
+
+    def solapa(
+        self,
+        inicio: datetime,
+        fin: datetime,
+        excluir_reserva_id: Optional[int] = None,
+    ) -> bool:
+        """Indica si alguna ventana cumple inicio_reserva < fin y fin_reserva > inicio"""
+        # Solo las ventanas que empiezan antes de `fin` pueden solapar
+        limite = bisect_left(self.inicios, fin)
+        if limite == 0:
+            return False
+
+        if excluir_reserva_id is None:
+            return self._max_fin[limite - 1] > inicio
+
+        return any(
+            self.fines[i] > inicio and self.reservas[i] != excluir_reserva_id
+            for i in range(limite)
+        )
+
+    def ventanas(self) -> List[Tuple[int, datetime, datetime]]:
+        return list(zip(self.reservas, self.inicios, self.fines, strict=True))
+
+    def _recalcular_max_fin(self, desde: int) -> None:
+        del self._max_fin[desde:]
+        actual = self._max_fin[-1] if self._max_fin else None
+        for fin in self.fines[desde:]:
+            actual = fin if actual is None or fin > actual else actual
+            self._max_fin.append(actual)
+
+
+class IndiceDisponibilidad:
+    """Índice de disponibilidad de la flota compartido por el proceso"""
+
+    def __init__(self, publicar_informes: bool = False) -> None:
+        self._lock = threading.RLock()
+        self._vehiculos: Dict[int, FichaVehiculo] = {}
+        self._intervalos: Dict[int, IntervalosVehiculo] = {}
+        # reserva_id -> (vehiculo_id, inicio, fin) para detectar cambios de vehículo o fechas
+        self._reservas: Dict[int, Tuple[int, datetime, datetime]] = {}
+        # lugar_id -> {vehiculo_id: referencias} de vehículos que pueden estar en el lugar
+        self._por_lugar: Dict[Optional[int], Dict[int, int]] = {}
+        self._cargado = False
+        self._version: Optional[int] = None
+        # Solo el índice del worker publica informes (no los cargados por comandos o tests)
+        self._publicar_informes = publicar_informes
+        self._informado_en: Optional[float] = None
+
+    # ------------------------------------------------------------------
+    # Carga y sincronización
+    # ------------------------------------------------------------------
+
+    @property
+    def cargado(self) -> bool:
+        return self._cargado
+
+    def cargar(self) -> None:
+        """Reconstruye el índice completo con dos consultas"""
+        from .models import Vehiculo
+
+        # Se lee antes de consultar: un cambio publicado durante la carga
+        # provocará otra recarga en la siguiente consulta
+        version = self._leer_version()
+
+        vehiculos = _leer_fichas(Vehiculo)
+
+        reservas = Reserva.objects.filter(
+            estado__in=ESTADOS_ACTIVOS,
+            fecha_devolucion__gt=timezone.now(),
+        ).values_list(
+            "id", "vehiculo_id", "fecha_recogida", "fecha_devolucion", "lugar_devolucion_id"
+        )
+
+        intervalos: Dict[int, IntervalosVehiculo] = {}
+        registro: Dict[int, Tuple[int, datetime, datetime]] = {}
+        por_lugar: Dict[Optional[int], Dict[int, int]] = {}
+        for vehiculo_id, ficha in vehiculos.items():
+            _referenciar(por_lugar, ficha.lugar_id, vehiculo_id, 1)
+
+        for reserva_id, vehiculo_id, inicio, fin, lugar_id in reservas.order_by("fecha_recogida"):
+            ventanas = intervalos.setdefault(vehiculo_id, IntervalosVehiculo())
+            # Llegan ordenadas: añadir al final evita desplazar las listas
+            ventanas.inicios.append(inicio)
+            ventanas.fines.append(fin)
+            ventanas.reservas.append(reserva_id)
+            ventanas.lugares.append(lugar_id)
+            registro[reserva_id] = (vehiculo_id, inicio, fin)
+            _referenciar(por_lugar, lugar_id, vehiculo_id, 1)
+
+        for ventanas in intervalos.values():
+            ventanas._recalcular_max_fin(0)
+
+        with self._lock:
+            self._vehiculos = vehiculos
+            self._intervalos = intervalos
+            self._reservas = registro
+            self._por_lugar = por_lugar
+            self._version = version
+            self._cargado = True
+
+        logger.info(
+            f"Índice de disponibilidad cargado: {len(vehiculos)} vehículos, "
+            f"{len(registro)} reservas activas"
+        )
+
+    def precargar(self) -> None:
+        """Carga el índice al arrancar el worker sin interrumpir el arranque si falla"""
+        if "LocMemCache" in settings.CACHES.get("default", {}).get("BACKEND", ""):
+            logger.warning(
+                "Índice de disponibilidad con LocMemCache: cada worker tiene su propia "
+                "versión y no verá los cambios de los demás. Usa Redis con más de un worker."
+            )
+        try:
+            self.cargar()
+            if self._publicar_informes:
+                self.publicar_informe()
+        except Exception as e:
+            logger.warning(f"No se pudo precargar el índice de disponibilidad: {str(e)}")
+
+    def invalidar(self) -> None:
+        """Fuerza la recarga del índice en todos los workers"""
+        with self._lock:
+            self._cargado = False
+        incrementar_version(CACHE_KEY_VERSION)
+
+    def _asegurar_sincronizado(self) -> None:
+        if not self._cargado or self._leer_version() != self._version:
+            with self._lock:
+                if not self._cargado or self._leer_version() != self._version:
+                    self.cargar()
+        if self._publicar_informes and (
+            self._informado_en is None or time.monotonic() - self._informado_en >= INTERVALO_INFORME
+        ):
+            self.publicar_informe()
+
+    @staticmethod
+    def _leer_version() -> int:
+        return cache.get(CACHE_KEY_VERSION, 0)
+
+    def _publicar_cambio(self) -> None:
+        """
+        Publica un cambio aplicado localmente. Si otro worker publicó cambios
+        que este proceso no ha visto, se fuerza una recarga en la próxima consulta.
+        """
+        version_anterior = self._version
+        nueva_version = incrementar_version(CACHE_KEY_VERSION)
+        if version_anterior is not None and nueva_version == version_anterior + 1:
+            self._version = nueva_version
+        else:
+            self._cargado = False
+
+    # ------------------------------------------------------------------
+    # Actualizaciones incrementales (llamadas desde las señales)
+    # ------------------------------------------------------------------
+
+    def actualizar_reserva(self, reserva: Any) -> None:
+        """Inserta, mueve o elimina la ventana de una reserva según su estado"""
+        with self._lock:
+            if self._cargado:
+                self._quitar_reserva(reserva.pk)
+                activa = (
+                    reserva.estado in ESTADOS_ACTIVOS
+                    and reserva.fecha_recogida
+                    and reserva.fecha_devolucion
+                )
+                if activa:
+                    inicio = _normalizar_fecha(reserva.fecha_recogida)
+                    fin = _normalizar_fecha(reserva.fecha_devolucion)
+                    self._intervalos.setdefault(
+                        reserva.vehiculo_id, IntervalosVehiculo()
+                    ).agregar(reserva.pk, inicio, fin, reserva.lugar_devolucion_id)
+                    self._reservas[reserva.pk] = (reserva.vehiculo_id, inicio, fin)
+                    _referenciar(
+                        self._por_lugar, reserva.lugar_devolucion_id, reserva.vehiculo_id, 1
+                    )
+            self._publicar_cambio()
+
+        # Una reserva ya terminada cambia la ubicación actual del vehículo
+        if reserva.fecha_devolucion and _normalizar_fecha(reserva.fecha_devolucion) <= timezone.now():
+            self._refrescar_ficha(reserva.vehiculo_id)
+
+    def eliminar_reserva(self, reserva_id: int) -> None:
+        with self._lock:
+            if self._cargado:
+                self._quitar_reserva(reserva_id)
+            self._publicar_cambio()
+
+    def actualizar_vehiculo(self, vehiculo: Any) -> None:
+        self._refrescar_ficha(vehiculo.pk)
+        with self._lock:
+            self._publicar_cambio()
+
+    def eliminar_vehiculo(self, vehiculo_id: int) -> None:
+        with self._lock:
+            if self._cargado:
+                self._vehiculos.pop(vehiculo_id, None)
+                for reserva_id, _inicio, _fin in self._intervalos.pop(
+                    vehiculo_id, IntervalosVehiculo()
+                ).ventanas():
+                    self._reservas.pop(reserva_id, None)
+                for vehiculos in self._por_lugar.values():
+                    vehiculos.pop(vehiculo_id, None)
+            self._publicar_cambio()
+
+    def _refrescar_ficha(self, vehiculo_id: int) -> None:
+        """Relee la ficha del vehículo (la ubicación depende también de sus reservas)"""
+        from .models import Vehiculo
+
+        ficha = _leer_fichas(Vehiculo, [vehiculo_id]).get(vehiculo_id)
+        with self._lock:
+            if not self._cargado:
+                return
+            anterior = self._vehiculos.pop(vehiculo_id, None)
+            if anterior is not None:
+                _referenciar(self._por_lugar, anterior.lugar_id, vehiculo_id, -1)
+            if ficha is not None:
+                self._vehiculos[vehiculo_id] = ficha
+                _referenciar(self._por_lugar, ficha.lugar_id, vehiculo_id, 1)
+
+    def _quitar_reserva(self, reserva_id: int) -> None:
+        registro = self._reservas.pop(reserva_id, None)
+        if registro is None:
+            return
+        ventanas = self._intervalos.get(registro[0])
+        if ventanas is not None:
+            posicion = ventanas.reservas.index(reserva_id)
+            _referenciar(self._por_lugar, ventanas.lugares[posicion], registro[0], -1)
+            ventanas.eliminar(reserva_id)
+            if not ventanas:
+                del self._intervalos[registro[0]]
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    def vehiculos_libres(
+        self,
+        fecha_inicio: datetime,
+        fecha_fin: datetime,
+        categoria_id: Optional[int] = None,
+        grupo_id: Optional[int] = None,
+        vehiculo_ids: Optional[Iterable[int]] = None,
+        lugar_id: Optional[int] = None,
+    ) -> List[int]:
+        """
+        Devuelve los IDs de vehículos activos y disponibles sin reservas
+        solapadas con [fecha_inicio, fecha_fin) y, si se indica `lugar_id`,
+        presentes en ese lugar en el momento de la recogida
+        """
+        self._asegurar_sincronizado()
+        inicio = _normalizar_fecha(fecha_inicio)
+        fin = _normalizar_fecha(fecha_fin)
+        categoria_id = int(categoria_id) if categoria_id else None
+        grupo_id = int(grupo_id) if grupo_id else None
+        lugar_id = int(lugar_id) if lugar_id else None
+
+        with self._lock:
+            if lugar_id is not None:
+                # Solo los vehículos que pueden estar en el lugar y los que no tienen ubicación
+                ids = set(self._por_lugar.get(lugar_id, ()))
+                ids.update(self._por_lugar.get(None, ()))
+                if vehiculo_ids is not None:
+                    ids.intersection_update(vehiculo_ids)
+                vehiculo_ids = sorted(ids)
+
+            if vehiculo_ids is None:
+                candidatos = self._vehiculos.items()
+            else:
+                candidatos = (
+                    (vehiculo_id, self._vehiculos[vehiculo_id])
+                    for vehiculo_id in vehiculo_ids
+                    if vehiculo_id in self._vehiculos
+                )
+
+            libres = []
+            for vehiculo_id, ficha in candidatos:
+                if not (ficha.activo and ficha.disponible):
+                    continue
+                if categoria_id and ficha.categoria_id != categoria_id:
+                    continue
+                if grupo_id and ficha.grupo_id != grupo_id:
+                    continue
+                ventanas = self._intervalos.get(vehiculo_id)
+                if ventanas is not None and ventanas.solapa(inicio, fin):
+                    continue
+                if lugar_id is not None:
+                    ubicacion = (
+                        ventanas.lugar_en(inicio) if ventanas is not None else None
+                    ) or ficha.lugar_id
+                    if ubicacion is not None and ubicacion != lugar_id:
+                        continue
+                libres.append(vehiculo_id)
+
+        return libres
+
+    def sugerir_ventanas(
+        self, fecha_inicio: datetime, fecha_fin: datetime, **criterios: Any
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Ventanas libres alternativas más cercanas (ver vehiculos/huecos.py)"""
+        from .huecos import sugerir_ventanas
+
+        self._asegurar_sincronizado()
+        with self._lock:
+            return sugerir_ventanas(
+                self._intervalos,
+                self._vehiculos,
+                _normalizar_fecha(fecha_inicio),
+                _normalizar_fecha(fecha_fin),
+                **criterios,
+            )
+
+    # ------------------------------------------------------------------
+    # Verificación de consistencia
+    # ------------------------------------------------------------------
+
+    def informe(self) -> Dict[str, Any]:
+        """Versión y huella del índice del proceso, con las reservas aún no terminadas"""
+        ahora = timezone.now()
+        with self._lock:
+            reservas = [
+                (reserva_id, vehiculo_id, inicio, fin)
+                for reserva_id, (vehiculo_id, inicio, fin) in self._reservas.items()
+                if fin > ahora
+            ]
+            return {
+                "worker": f"{socket.gethostname()}:{os.getpid()}",
+                "version": self._version,
+                "ahora": ahora,
+                "huella": huella(reservas, self._vehiculos),
+                "reservas": len(reservas),
+                "vehiculos": len(self._vehiculos),
+            }
+
+    def publicar_informe(self) -> None:
+        """Publica el informe del proceso en la caché compartida"""
+        self._informado_en = time.monotonic()
+        if not self._cargado:
+            return
+        try:
+            informe = self.informe()
+            cache.set(_clave_informe(informe["worker"]), informe, timeout=3 * INTERVALO_INFORME)
+            # Registro de workers: una carrera solo retrasa un informe al siguiente intervalo
+            registro = cache.get(CACHE_KEY_WORKERS) or {}
+            registro[informe["worker"]] = time.time()
+            limite = time.time() - 3 * INTERVALO_INFORME
+            cache.set(
+                CACHE_KEY_WORKERS,
+                {worker: en for worker, en in registro.items() if en >= limite},
+                timeout=None,
+            )
+        except Exception as e:
+            logger.warning(f"No se pudo publicar el informe del índice de disponibilidad: {str(e)}")
+
+
+indice_disponibilidad = IndiceDisponibilidad(publicar_informes=True)
+
+
+def indice_habilitado() -> bool:
+    """Permite desactivar el índice por configuración y volver a la consulta SQL"""
+    return getattr(settings, "DISPONIBILIDAD_INDICE_ENABLED", True)
@@ -0,0 +1,64 @@
+# vehiculos/management/commands/generar_variantes_imagenes.py
+"""
+Comando para generar las variantes redimensionadas de las imágenes existentes
+"""
+from django.core.management.base import BaseCommand
+from vehiculos.imagenes import (VARIANTES, formatos_disponibles,
+                                generar_variantes, variantes_vigentes)
+from vehiculos.models import ImagenVehiculo
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera las variantes WebP/AVIF (thumbnail, card, hero) de las imágenes "
+        "de vehículos que aún no las tienen."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--vehiculo",
+            type=int,
+            action="append",
+            help="ID de vehículo a procesar (repetible; por defecto todos)",
+        )
+        parser.add_argument(
+            "--forzar",
+            action="store_true",
+            help="Regenerar también las imágenes que ya tienen variantes",
+        )
+
+    def handle(self, *args, **options):
+        formatos = formatos_disponibles()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"🖼️ Generando variantes ({', '.join(VARIANTES)}) en {', '.join(formatos) or 'ningún formato'}..."
+            )
+        )
+        if "avif" not in formatos:
+            self.stdout.write(
+                self.style.WARNING("⚠️ Pillow no soporta AVIF en esta instalación: solo se generará WebP")
+            )
+
+        imagenes = ImagenVehiculo.objects.exclude(imagen="").exclude(imagen__isnull=True)
+        if options["vehiculo"]:
+            imagenes = imagenes.filter(vehiculo_id__in=options["vehiculo"])
+
+        generadas = omitidas = errores = 0
+        for imagen in imagenes.order_by("id").iterator():
+            if not options["forzar"] and variantes_vigentes(imagen):
+                omitidas += 1
+                continue
+            try:
+                generar_variantes(imagen, forzar=True)
+                generadas += 1
+            except Exception as e:
+                errores += 1
+                self.stdout.write(
+                    self.style.ERROR(f"❌ Imagen {imagen.id} ({imagen.imagen.name}): {str(e)}")
+                )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Variantes generadas: {generadas} imágenes ({omitidas} ya al día, {errores} con error)"
+            )
+        )
@@ -0,0 +1,38 @@
+# vehiculos/management/commands/reconstruir_calendario_tarifas.py
+"""
+Comando para regenerar el calendario materializado de precios (`precio_diario_vehiculo`)
+"""
+from django.core.management.base import BaseCommand
+from vehiculos.tarifas import reconstruir_calendario
+
+
+class Command(BaseCommand):
+    help = (
+        "Regenera el calendario de precios por vehículo y día a partir de TarifaVehiculo. "
+        "Programar a diario para desplazar el horizonte."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--vehiculo",
+            type=int,
+            action="append",
+            help="ID de vehículo a regenerar (repetible; por defecto todos)",
+        )
+        parser.add_argument(
+            "--dias",
+            type=int,
+            default=None,
+            help="Días del horizonte (default: CALENDARIO_TARIFAS_DIAS)",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            self.style.SUCCESS("📅 Regenerando calendario de tarifas...")
+        )
+
+        filas = reconstruir_calendario(options["vehiculo"], dias=options["dias"])
+
+        self.stdout.write(
+            self.style.SUCCESS(f"✅ Calendario regenerado: {filas} días-vehículo")
+        )
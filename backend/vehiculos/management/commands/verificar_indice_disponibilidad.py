@@ -0,0 +1,139 @@
+# vehiculos/management/commands/verificar_indice_disponibilidad.py
+"""
+Comando para verificar los índices de disponibilidad de los workers contra la BD
+
+Cada worker publica en la caché compartida su versión y una huella de su
+índice (ver vehiculos/indice_disponibilidad.py). Un worker en la versión
+vigente cuya huella no coincide con la de la BD se ha desviado (por ejemplo,
+por cambios que no pasaron por las señales). Con LocMemCache los informes de
+otros procesos no son visibles.
+"""
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from vehiculos.indice_disponibilidad import (CACHE_KEY_VERSION,
+                                             IndiceDisponibilidad, huella_bd,
+                                             indice_disponibilidad,
+                                             informes_workers)
+from vehiculos.services import _buscar_vehiculos_disponibles_bd
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara la huella publicada por el índice de cada worker con la BD y "
+        "contrasta búsquedas aleatorias de un índice recién cargado con la consulta SQL"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--muestras",
+            type=int,
+            default=50,
+            help="Número de ventanas aleatorias a contrastar (default: 50)",
+        )
+        parser.add_argument(
+            "--dias",
+            type=int,
+            default=90,
+            help="Horizonte en días para generar las ventanas aleatorias (default: 90)",
+        )
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Publicar una nueva versión para que todos los workers recarguen el índice",
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            self.style.SUCCESS("🔍 Verificando índices de disponibilidad de los workers...")
+        )
+
+        problemas = self._verificar_workers()
+        problemas += self._contrastar_busquedas(options["muestras"], options["dias"])
+
+        if problemas == 0:
+            self.stdout.write(
+                self.style.SUCCESS("✅ Los índices son consistentes con la base de datos")
+            )
+        else:
+            self.stdout.write(
+                self.style.WARNING(f"⚠️ Se encontraron {problemas} discrepancias")
+            )
+
+        if options["fix"]:
+            indice_disponibilidad.invalidar()
+            self.stdout.write(
+                self.style.SUCCESS("🔄 Versión publicada: los workers recargarán el índice")
+            )
+
+    def _verificar_workers(self):
+        """Compara la huella de cada worker en la versión vigente con la de la BD"""
+        if "LocMemCache" in settings.CACHES.get("default", {}).get("BACKEND", ""):
+            self.stdout.write(
+                self.style.WARNING(
+                    "⚠️ Caché LocMemCache: los informes y versiones de otros procesos no son visibles"
+                )
+            )
+
+        informes = informes_workers()
+        if not informes:
+            self.stdout.write(
+                self.style.WARNING("⚠️ Ningún worker ha publicado el informe de su índice")
+            )
+            return 0
+
+        version = cache.get(CACHE_KEY_VERSION, 0)
+        desviados = 0
+        for worker, informe in sorted(informes.items()):
+            if informe["version"] != version:
+                self.stdout.write(
+                    f"⏳ {worker}: versión {informe['version']} (vigente {version}), "
+                    "recargará en su próxima consulta"
+                )
+            elif informe["huella"] != huella_bd(informe["ahora"]):
+                desviados += 1
+                self.stdout.write(
+                    self.style.ERROR(
+                        f"❌ {worker}: índice desviado de la BD en la versión {version} "
+                        f"({informe['reservas']} reservas, {informe['vehiculos']} vehículos)"
+                    )
+                )
+            else:
+                self.stdout.write(f"📋 {worker}: coherente en la versión {version}")
+        return desviados
+
+    def _contrastar_busquedas(self, muestras, dias):
+        """
+        Compara la lógica del índice (cargado en este proceso) con la consulta
+        SQL en ventanas aleatorias
+        """
+        indice = IndiceDisponibilidad()
+        indice.cargar()
+        ahora = timezone.now()
+        errores = 0
+
+        for _ in range(muestras):
+            inicio = ahora + timedelta(hours=random.randint(0, dias * 24))
+            fin = inicio + timedelta(hours=random.randint(24, 14 * 24))
+
+            en_indice = set(indice.vehiculos_libres(inicio, fin))
+            en_bd = set(
+                _buscar_vehiculos_disponibles_bd(inicio, fin).values_list("id", flat=True)
+            )
+
+            if en_indice != en_bd:
+                errores += 1
+                self.stdout.write(
+                    self.style.ERROR(
+                        f"❌ Ventana {inicio:%Y-%m-%d %H:%M} - {fin:%Y-%m-%d %H:%M}: "
+                        f"solo índice {sorted(en_indice - en_bd)[:10]}, "
+                        f"solo BD {sorted(en_bd - en_indice)[:10]}"
+                    )
+                )
+
+        self.stdout.write(f"📋 Búsquedas contrastadas: {muestras}, discrepantes: {errores}")
+        return errores
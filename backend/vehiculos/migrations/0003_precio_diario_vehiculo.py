@@ -0,0 +1,30 @@
+# Generated by Django 5.1.9 on 2026-10-17 01:30
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehiculos', '0002_make_grupo_optional'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrecioDiarioVehiculo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('precio_dia', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='0.00 si ninguna tarifa aplica ese día', max_digits=8, verbose_name='Precio por día')),
+                ('vehiculo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='precios_diarios', to='vehiculos.vehiculo')),
+            ],
+            options={
+                'verbose_name': 'Precio diario de vehículo',
+                'verbose_name_plural': 'Precios diarios de vehículos',
+                'db_table': 'precio_diario_vehiculo',
+                'unique_together': {('vehiculo', 'fecha')},
+            },
+        ),
+    ]
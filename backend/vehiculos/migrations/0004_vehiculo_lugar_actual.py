@@ -0,0 +1,20 @@
+# Generated by Django 5.1.9 on 2026-10-17 01:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('lugares', '0002_alter_lugar_nombre'),
+        ('vehiculos', '0003_precio_diario_vehiculo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehiculo',
+            name='lugar_actual',
+            field=models.ForeignKey(blank=True, help_text='Ubicación del vehículo si no tiene reservas terminadas con lugar de devolución; vacío si puede recogerse en cualquier sede.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='vehiculos_presentes', to='lugares.lugar', verbose_name='Sede base'),
+        ),
+    ]
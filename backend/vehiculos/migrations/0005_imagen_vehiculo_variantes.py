@@ -0,0 +1,18 @@
+# Generated by Django 5.1.9 on 2026-10-17 01:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vehiculos', '0004_vehiculo_lugar_actual'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagenvehiculo',
+            name='variantes',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Versiones redimensionadas generadas a partir de la imagen (ver vehiculos/imagenes.py)', verbose_name='Variantes'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Índices de búsqueda de texto sobre marca, modelo y matrícula
+
+import logging
+
+from django.db import migrations, transaction
+
+logger = logging.getLogger(__name__)
+
+CAMPOS = ("marca", "modelo", "matricula")
+
+
+def crear_indices(apps, schema_editor):
+    """
+    PostgreSQL: índices GIN de trigramas sobre UPPER(campo), la expresión que
+    genera `icontains`, para que los filtros por subcadena no recorran la tabla.
+    SQLite (desarrollo local): índices NOCASE, usables por LIKE con prefijo.
+    """
+    conexion = schema_editor.connection
+    if conexion.vendor == "postgresql":
+        try:
+            # Punto de guardado: sin permisos para la extensión no se aborta la migración
+            with transaction.atomic(using=conexion.alias):
+                schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except Exception as e:
+            logger.warning(f"No se pudo habilitar pg_trgm; se omiten los índices de trigramas: {e}")
+            return
+        for campo in CAMPOS:
+            schema_editor.execute(
+                f"CREATE INDEX IF NOT EXISTS vehiculo_{campo}_trgm "
+                f"ON vehiculo USING gin (UPPER({campo}::text) gin_trgm_ops)"
+            )
+    elif conexion.vendor == "sqlite":
+        for campo in CAMPOS:
+            schema_editor.execute(
+                f"CREATE INDEX IF NOT EXISTS vehiculo_{campo}_nocase "
+                f"ON vehiculo ({campo} COLLATE NOCASE)"
+            )
+
+
+def eliminar_indices(apps, schema_editor):
+    conexion = schema_editor.connection
+    sufijo = {"postgresql": "trgm", "sqlite": "nocase"}.get(conexion.vendor)
+    if not sufijo:
+        return
+    for campo in CAMPOS:
+        schema_editor.execute(f"DROP INDEX IF EXISTS vehiculo_{campo}_{sufijo}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("vehiculos", "0005_imagen_vehiculo_variantes"),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indices, eliminar_indices),
+    ]
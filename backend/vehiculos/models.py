@@ -153,6 +153,18 @@ class Vehiculo(models.Model):
     kilometraje = models.PositiveIntegerField(
         _("Kilometraje"), blank=True, null=True, validators=[MinValueValidator(0)]
     )
+    lugar_actual = models.ForeignKey(
+        "lugares.Lugar",
+        related_name="vehiculos_presentes",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        verbose_name=_("Sede base"),
+        help_text=_(
+            "Ubicación del vehículo si no tiene reservas terminadas con lugar de "
+            "devolución; vacío si puede recogerse en cualquier sede."
+        ),
+    )
     created_at = models.DateTimeField(default=timezone.now, editable=False)
     updated_at = models.DateTimeField(default=timezone.now)
 
@@ -184,51 +196,17 @@ class Vehiculo(models.Model):
         2. Si no, usar la tarifa por defecto más reciente (sin fecha_fin)
         3. Si existen múltiples tarifas por defecto, usar la más reciente
         """
-        from django.utils import timezone
-
-        try:
-            today = timezone.now().date()
-
-            # 1. Buscar tarifa específica activa (con fecha_fin que incluya hoy)
-            tarifa_especifica = (
-                self.tarifas.filter(
-                    fecha_inicio__lte=today,
-                    fecha_fin__gte=today,
-                    fecha_fin__isnull=False
-                )
-                .order_by('-fecha_inicio')
-                .first()
-            )
-
-            if tarifa_especifica:
-                logger.debug(f"Vehículo {self.id}: Usando tarifa específica {tarifa_especifica.precio_dia}€")
-                return tarifa_especifica.precio_dia
-
-            # 2. Si no hay tarifa específica, buscar tarifa por defecto (sin fecha_fin)
-            tarifa_defecto = (
-                self.tarifas.filter(
-                    fecha_inicio__lte=today,
-                    fecha_fin__isnull=True
-                )
-                .order_by('-fecha_inicio')  # La más reciente primero
-                .first()
-            )
-
-            if tarifa_defecto:
-                logger.debug(f"Vehículo {self.id}: Usando tarifa por defecto {tarifa_defecto.precio_dia}€")
-                return tarifa_defecto.precio_dia
-
-            # 3. Si no hay ninguna tarifa, devolver 0
-            logger.warning(f"Vehículo {self.id}: No se encontró ninguna tarifa válida")
-            return Decimal("0.00")
-
-        except Exception as e:
-            logger.error(f"Error obteniendo precio actual para vehículo {self.id}: {str(e)}")
-            return Decimal("0.00")
+        return self.get_precio_para_fechas(timezone.now().date())
 
     @property
     def precio_dia(self) -> Decimal:
-        """Alias para compatibilidad con código existente"""
+        """
+        Alias para compatibilidad con código existente.
+        Respeta el precio resuelto por lotes en la vista (`_precio_dia_temp`).
+        """
+        precio_resuelto = getattr(self, "_precio_dia_temp", None)
+        if precio_resuelto is not None:
+            return precio_resuelto
         return self.precio_dia_actual
 
     def get_precio_para_fechas(
@@ -236,51 +214,50 @@ class Vehiculo(models.Model):
     ) -> Decimal:
         """
         Obtiene el precio por día para una fecha específica usando la misma lógica
-        que precio_dia_actual pero para cualquier fecha
+        que precio_dia_actual pero para cualquier fecha.
+
+        Usa las tarifas precargadas con prefetch_related('tarifas') si existen;
+        en caso contrario resuelve con una única consulta.
         """
-        from django.utils import timezone
+        from .tarifas import (normalizar_fecha_tarifa, seleccionar_tarifa,
+                              tarifas_candidatas)
 
         try:
-            if isinstance(fecha_inicio, str):
-                fecha_inicio = timezone.datetime.fromisoformat(
-                    fecha_inicio.replace("Z", "+00:00")
-                ).date()
-            elif hasattr(fecha_inicio, "date"):
-                fecha_inicio = fecha_inicio.date()
-
-            # 1. Buscar tarifa específica activa para esa fecha
-            tarifa_especifica = (
-                self.tarifas.filter(
-                    fecha_inicio__lte=fecha_inicio,
-                    fecha_fin__gte=fecha_inicio,
-                    fecha_fin__isnull=False
-                )
-                .order_by('-fecha_inicio')
-                .first()
-            )
-
-            if tarifa_especifica:
-                return tarifa_especifica.precio_dia
-
-            # 2. Si no hay tarifa específica, buscar tarifa por defecto
-            tarifa_defecto = (
-                self.tarifas.filter(
-                    fecha_inicio__lte=fecha_inicio,
-                    fecha_fin__isnull=True
-                )
-                .order_by('-fecha_inicio')
-                .first()
-            )
-
-            if tarifa_defecto:
-                return tarifa_defecto.precio_dia
+            fecha = normalizar_fecha_tarifa(fecha_inicio)
+
+            prefetched = getattr(self, "_prefetched_objects_cache", {})
+            if "tarifas" in prefetched:
+                tarifas = prefetched["tarifas"]
+            else:
+                tarifas = self.tarifas.filter(tarifas_candidatas(fecha))
 
+            tarifa = seleccionar_tarifa(tarifas, fecha)
+            if tarifa:
+                logger.debug(f"Vehículo {self.id}: Usando tarifa {tarifa.precio_dia}€ para {fecha}")
+                return tarifa.precio_dia
+
+            logger.warning(f"Vehículo {self.id}: No se encontró ninguna tarifa válida para {fecha}")
             return Decimal("0.00")
             
         except Exception as e:
             logger.error(f"Error obteniendo precio para fechas en vehículo {self.id}: {str(e)}")
             return Decimal("0.00")
 
+    @property
+    def imagen_portada(self) -> Optional["ImagenVehiculo"]:
+        """
+        Imagen de portada del vehículo.
+
+        Se toma de las imágenes precargadas con prefetch_related('imagenes'),
+        que los serializers ya necesitan para el listado completo; solo
+        consulta la base de datos si no están precargadas.
+        """
+        prefetched = getattr(self, "_prefetched_objects_cache", {})
+        if "imagenes" in prefetched:
+            return next((imagen for imagen in prefetched["imagenes"] if imagen.portada), None)
+
+        return self.imagenes.filter(portada=True).first()
+
 
 class ImagenVehiculo(models.Model):
     vehiculo = models.ForeignKey(
@@ -298,6 +275,13 @@ class ImagenVehiculo(models.Model):
     )
     ancho = models.PositiveIntegerField(_("Ancho"), null=True, blank=True)
     alto = models.PositiveIntegerField(_("Alto"), null=True, blank=True)
+    variantes = models.JSONField(
+        _("Variantes"),
+        default=dict,
+        blank=True,
+        editable=False,
+        help_text=_("Versiones redimensionadas generadas a partir de la imagen (ver vehiculos/imagenes.py)"),
+    )
     created_at = models.DateTimeField(default=timezone.now, editable=False)
     updated_at = models.DateTimeField(default=timezone.now)
 
@@ -325,18 +309,17 @@ class ImagenVehiculo(models.Model):
                 vehiculo=self.vehiculo, portada=True
             ).exclude(id=self.id).update(portada=False)
 
+        # Dimensiones leídas de la cabecera del archivo subido, antes de enviarlo
+        # al almacenamiento: se guardan en el mismo INSERT/UPDATE
+        if self.imagen and not getattr(self.imagen, "_committed", True):
+            from .imagenes import dimensiones_desde_cabecera
+
+            dimensiones = dimensiones_desde_cabecera(self.imagen.file)
+            if dimensiones:
+                self.ancho, self.alto = dimensiones
+
         # Guardar directamente - el upload_path genera nombres únicos
         super().save(*args, **kwargs)
-        
-        # Extraer dimensiones de la imagen si está disponible
-        if self.imagen and hasattr(self.imagen, 'width') and hasattr(self.imagen, 'height'):
-            if not self.ancho or not self.alto:
-                self.ancho = self.imagen.width
-                self.alto = self.imagen.height
-                # Guardar solo los campos de dimensiones para evitar loop infinito
-                ImagenVehiculo.objects.filter(id=self.id).update(
-                    ancho=self.ancho, alto=self.alto
-                )
 
 
 class TarifaVehiculo(models.Model):
@@ -387,6 +370,37 @@ class TarifaVehiculo(models.Model):
         super().save(*args, **kwargs)
 
 
+class PrecioDiarioVehiculo(models.Model):
+    """
+    Calendario materializado de precios: una fila por vehículo y día.
+
+    Se regenera desde TarifaVehiculo (ver vehiculos/tarifas.py) y permite
+    calcular el precio de cualquier período con una única suma por rango.
+    """
+
+    vehiculo = models.ForeignKey(
+        Vehiculo, related_name="precios_diarios", on_delete=models.CASCADE, null=False
+    )
+    fecha = models.DateField(_("Fecha"), null=False)
+    precio_dia = models.DecimalField(
+        _("Precio por día"),
+        max_digits=8,
+        decimal_places=2,
+        null=False,
+        default=Decimal("0.00"),
+        help_text=_("0.00 si ninguna tarifa aplica ese día"),
+    )
+
+    class Meta:
+        db_table = "precio_diario_vehiculo"
+        verbose_name = _("Precio diario de vehículo")
+        verbose_name_plural = _("Precios diarios de vehículos")
+        unique_together = [["vehiculo", "fecha"]]
+
+    def __str__(self) -> str:
+        return f"{self.vehiculo} - {self.fecha}: {self.precio_dia}€"
+
+
 class Mantenimiento(models.Model):
     vehiculo = models.ForeignKey(
         Vehiculo, related_name="mantenimientos", on_delete=models.CASCADE, null=False
@@ -2,7 +2,19 @@
 """
 Paginación para las vistas de vehículos
 """
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+from typing import Any, List, Optional, Sequence, Tuple
+
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .tarifas import ANOTACION_PRECIO
 
 
 class StandardResultsSetPagination(PageNumberPagination):
@@ -13,3 +25,198 @@ class StandardResultsSetPagination(PageNumberPagination):
     page_size = 20
     page_size_query_param = "page_size"
     max_page_size = 100
+
+
+# Ordenaciones disponibles: (campo, descendente). Terminan en `id` para que la clave sea única
+ORDENES_VEHICULOS = {
+    "precio_asc": ((ANOTACION_PRECIO, False), ("id", False)),
+    "precio_desc": ((ANOTACION_PRECIO, True), ("id", True)),
+    "marca_asc": (("marca", False), ("modelo", False), ("id", False)),
+    "marca_desc": (("marca", True), ("modelo", True), ("id", True)),
+}
+
+# Etiquetas que anuncia filterOptions["orden"]
+ETIQUETAS_ORDEN = {
+    "Precio ascendente": "precio_asc",
+    "Precio descendente": "precio_desc",
+    "Marca A-Z": "marca_asc",
+    "Marca Z-A": "marca_desc",
+}
+
+ORDEN_POR_DEFECTO = "marca_asc"
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginación por clave (keyset) para listados de vehículos.
+
+    El cursor guarda los valores de la clave de ordenación del último (o
+    primer) elemento de la página, y la siguiente página se obtiene con un
+    filtro `(a, b, id) > (x, y, z)` más LIMIT: la base de datos ordena y
+    corta, y en memoria solo vive la página. El QuerySet debe llevar anotada
+    la columna de precio si se ordena por precio.
+    """
+
+    page_size = 20
+    page_size_query_param = "page_size"
+    max_page_size = 100
+    cursor_query_param = "cursor"
+    orden_query_param = "orden"
+
+    def __init__(self) -> None:
+        self.request = None
+        self.parametros = {}
+        self.base_url = None
+        self.orden = ORDEN_POR_DEFECTO
+        self.siguiente: Optional[str] = None
+        self.anterior: Optional[str] = None
+
+    # ------------------------------------------------------------------
+    # Parámetros
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _parametros(request, view=None):
+        """Parámetros de la petición; la vista puede aportarlos (p.ej. cuerpo de un POST)"""
+        return getattr(view, "parametros_paginacion", None) or request.query_params
+
+    def get_page_size(self, request) -> int:
+        try:
+            tamano = int(self.parametros.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(tamano, self.max_page_size))
+
+    def get_orden(self, request) -> str:
+        return self.get_orden_de(self.parametros)
+
+    def get_orden_de(self, parametros) -> str:
+        """Clave de ordenación a partir de los parámetros (acepta también las etiquetas)"""
+        orden = parametros.get(self.orden_query_param) or ORDEN_POR_DEFECTO
+        orden = ETIQUETAS_ORDEN.get(orden, orden)
+        if orden not in ORDENES_VEHICULOS:
+            raise ValidationError(
+                {self.orden_query_param: f"Orden no válido. Opciones: {', '.join(ORDENES_VEHICULOS)}"}
+            )
+        return orden
+
+    def ordenar(self, queryset: QuerySet, orden: str) -> QuerySet:
+        return queryset.order_by(
+            *(f"-{campo}" if desc else campo for campo, desc in ORDENES_VEHICULOS[orden])
+        )
+
+    # ------------------------------------------------------------------
+    # Cursor
+    # ------------------------------------------------------------------
+
+    def _codificar(self, valores: Sequence[Any], hacia_atras: bool) -> str:
+        datos = {"o": self.orden, "v": [str(valor) for valor in valores], "a": hacia_atras}
+        return base64.urlsafe_b64encode(json.dumps(datos).encode("utf-8")).decode("ascii")
+
+    def _decodificar(self, cursor: str) -> Tuple[List[Any], bool]:
+        try:
+            datos = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+            campos = ORDENES_VEHICULOS[datos["o"]]
+            if datos["o"] != self.orden or len(datos["v"]) != len(campos):
+                raise ValueError("El cursor no corresponde a la ordenación")
+            valores = [
+                self._convertir(campo, valor) for (campo, _desc), valor in zip(campos, datos["v"], strict=True)
+            ]
+            return valores, bool(datos.get("a"))
+        except (KeyError, ValueError, TypeError, InvalidOperation, json.JSONDecodeError) as e:
+            raise ValidationError({self.cursor_query_param: f"Cursor inválido: {str(e)}"}) from e
+
+    @staticmethod
+    def _convertir(campo: str, valor: str) -> Any:
+        if campo == "id":
+            return int(valor)
+        if campo == ANOTACION_PRECIO:
+            return Decimal(valor)
+        return valor
+
+    @staticmethod
+    def _filtro_posterior(campos, valores, invertir: bool) -> Q:
+        """(a, b, c) > (x, y, z) expandido, respetando la dirección de cada campo"""
+        filtro = Q()
+        iguales = Q()
+        for (campo, desc), valor in zip(campos, valores, strict=True):
+            mayor = desc == invertir
+            filtro |= iguales & Q(**{f"{campo}__{'gt' if mayor else 'lt'}": valor})
+            iguales &= Q(**{campo: valor})
+        return filtro
+
+    # ------------------------------------------------------------------
+    # API de DRF
+    # ------------------------------------------------------------------
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None) -> List[Any]:
+        self.request = request
+        self.parametros = self._parametros(request, view)
+        self.base_url = request.build_absolute_uri()
+        self.orden = self.get_orden(request)
+        tamano = self.get_page_size(request)
+        campos = ORDENES_VEHICULOS[self.orden]
+
+        cursor = self.parametros.get(self.cursor_query_param)
+        hacia_atras = False
+        if cursor:
+            valores, hacia_atras = self._decodificar(cursor)
+            queryset = queryset.filter(self._filtro_posterior(campos, valores, hacia_atras))
+
+        if hacia_atras:
+            # Se recorre en sentido inverso y se da la vuelta a la página
+            queryset = queryset.order_by(
+                *(campo if desc else f"-{campo}" for campo, desc in campos)
+            )
+        else:
+            queryset = self.ordenar(queryset, self.orden)
+
+        # Un elemento de más indica si hay otra página en ese sentido
+        resultados = list(queryset[: tamano + 1])
+        hay_mas = len(resultados) > tamano
+        resultados = resultados[:tamano]
+        if hacia_atras:
+            resultados.reverse()
+
+        self.siguiente = self.anterior = None
+        if resultados:
+            primero = [getattr(resultados[0], campo) for campo, _desc in campos]
+            ultimo = [getattr(resultados[-1], campo) for campo, _desc in campos]
+            if hacia_atras:
+                self.siguiente = self._codificar(ultimo, False)
+                if hay_mas:
+                    self.anterior = self._codificar(primero, True)
+            else:
+                if hay_mas:
+                    self.siguiente = self._codificar(ultimo, False)
+                if cursor:
+                    self.anterior = self._codificar(primero, True)
+
+        return resultados
+
+    def _enlace(self, cursor: Optional[str]) -> Optional[str]:
+        if cursor is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_next_link(self) -> Optional[str]:
+        return self._enlace(self.siguiente)
+
+    def get_previous_link(self) -> Optional[str]:
+        return self._enlace(self.anterior)
+
+    def get_paginated_response_data(self, data: dict) -> OrderedDict:
+        """Añade los enlaces y cursores a la respuesta estándar {success, results, ...}"""
+        return OrderedDict(
+            [
+                *data.items(),
+                ("orden", self.orden),
+                ("next", self.get_next_link()),
+                ("previous", self.get_previous_link()),
+                ("next_cursor", self.siguiente),
+                ("previous_cursor", self.anterior),
+            ]
+        )
+
+    def get_paginated_response(self, data: dict) -> Response:
+        return Response(self.get_paginated_response_data(data))
@@ -4,6 +4,7 @@ from typing import Any, Optional
 
 from rest_framework import serializers
 
+from .imagenes import TIPOS_MIME, construir_srcset
 from .models import (Categoria, GrupoCoche, ImagenVehiculo, Mantenimiento,
                      TarifaVehiculo, Vehiculo)
 
@@ -29,12 +30,49 @@ class GrupoCocheSerializer(serializers.ModelSerializer):
         ]
 
 
+def _url_absoluta(context: dict, url: str) -> str:
+    """URL absoluta a partir de la petición o, sin ella, de BASE_URL"""
+    if url.startswith(("http://", "https://")):
+        return url
+    request = context.get("request")
+    if request:
+        return request.build_absolute_uri(url)
+    from django.conf import settings
+
+    return f"{getattr(settings, 'BASE_URL', 'http://localhost:8000')}{url}"
+
+
+def _srcset_por_formato(context: dict, imagen: Optional[ImagenVehiculo]) -> dict:
+    """{formato: srcset} de las variantes generadas; vacío si aún no existen"""
+    if imagen is None:
+        return {}
+    srcsets = {
+        formato: construir_srcset(imagen, formato, lambda url: _url_absoluta(context, url))
+        for formato in TIPOS_MIME
+    }
+    return {formato: srcset for formato, srcset in srcsets.items() if srcset}
+
+
 class ImagenVehiculoSerializer(serializers.ModelSerializer):
     imagen_url = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = ImagenVehiculo
-        fields = ["id", "vehiculo", "imagen", "imagen_url", "portada", "ancho", "alto"]
+        fields = [
+            "id",
+            "vehiculo",
+            "imagen",
+            "imagen_url",
+            "srcset",
+            "portada",
+            "ancho",
+            "alto",
+        ]
+
+    def get_srcset(self, obj: ImagenVehiculo) -> dict:
+        """Variantes redimensionadas por formato ({"webp": "url 320w, ..."})"""
+        return _srcset_por_formato(self.context, obj)
 
     def get_imagen_url(self, obj: ImagenVehiculo) -> Optional[str]:
         """Obtener la URL de la imagen para compatibilidad con el frontend"""
@@ -97,6 +135,10 @@ class VehiculoListSerializer(serializers.ModelSerializer):
             if hasattr(obj, "_precio_dia_temp"):
                 return float(obj._precio_dia_temp)
 
+            # Precio anotado en la consulta (vehiculos.tarifas.anotar_precio_dia)
+            if hasattr(obj, "precio_dia_vigente"):
+                return float(obj.precio_dia_vigente or 0)
+
             # Usar precio actual como fallback
             precio = obj.precio_dia_actual
             return float(precio) if precio else 0.0
@@ -114,14 +156,15 @@ class VehiculoDetailSerializer(serializers.ModelSerializer):
         max_digits=10, decimal_places=2, read_only=True
     )
     imagen_principal = serializers.SerializerMethodField()
+    imagen_principal_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Vehiculo
         fields = "__all__"
 
     def get_imagen_principal(self, obj: Vehiculo) -> Optional[str]:
-        """Obtener la URL de la imagen principal del vehículo"""
-        imagen_principal = obj.imagenes.filter(portada=True).first()
+        """Obtener la URL de la imagen principal del vehículo (portada precargada)"""
+        imagen_principal = obj.imagen_portada
         if imagen_principal and imagen_principal.imagen:
             request = self.context.get("request")
             if request:
@@ -129,6 +172,10 @@ class VehiculoDetailSerializer(serializers.ModelSerializer):
             return imagen_principal.imagen.url
         return None
 
+    def get_imagen_principal_srcset(self, obj: Vehiculo) -> dict:
+        """srcset por formato de la imagen principal"""
+        return _srcset_por_formato(self.context, obj.imagen_portada)
+
 
 class VehiculoDisponibleSerializer(serializers.ModelSerializer):
     categoria = CategoriaSerializer(read_only=True)
@@ -138,6 +185,7 @@ class VehiculoDisponibleSerializer(serializers.ModelSerializer):
         max_digits=10, decimal_places=2, read_only=True
     )
     imagen_principal = serializers.SerializerMethodField()
+    imagen_principal_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Vehiculo
@@ -160,14 +208,19 @@ class VehiculoDisponibleSerializer(serializers.ModelSerializer):
             "imagenes",
             "precio_dia",
             "imagen_principal",
+            "imagen_principal_srcset",
         ]
 
     def get_imagen_principal(self, obj: Vehiculo) -> Optional[str]:
-        """Obtener la URL de la imagen principal del vehículo"""
-        imagen_principal = obj.imagenes.filter(portada=True).first()
+        """Obtener la URL de la imagen principal del vehículo (portada precargada)"""
+        imagen_principal = obj.imagen_portada
         if imagen_principal and imagen_principal.imagen:
             request = self.context.get("request")
             if request:
                 return request.build_absolute_uri(imagen_principal.imagen.url)
             return imagen_principal.imagen.url
         return None
+
+    def get_imagen_principal_srcset(self, obj: Vehiculo) -> dict:
+        """srcset por formato de la imagen principal"""
+        return _srcset_por_formato(self.context, obj.imagen_portada)
@@ -3,8 +3,9 @@
 Servicios para la gestión de vehículos y disponibilidad
 Migrado desde api/services/vehiculos.py
 """
+import base64
 import logging
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
 from decimal import Decimal
 from typing import Any, List, Optional
 
@@ -13,10 +14,19 @@ from django.utils import timezone
 # Direct imports - removing lazy imports as per best practices
 from reservas.models import Reserva
 
+from .analitica import dias_ocupados
+from .huecos import SUGERENCIAS_POR_DEFECTO
+from .indice_disponibilidad import (ESTADOS_ACTIVOS, IndiceDisponibilidad,
+                                    indice_disponibilidad, indice_habilitado,
+                                    ubicacion_en)
 from .models import Categoria, GrupoCoche, Vehiculo
+from .tarifas import precio_periodo
 
 logger = logging.getLogger(__name__)
 
+# Rango máximo de la matriz de disponibilidad (vista de calendario)
+MAX_DIAS_MATRIZ = 366
+
 
 def buscar_vehiculos_disponibles(
     fecha_inicio: datetime,
@@ -28,6 +38,10 @@ def buscar_vehiculos_disponibles(
     """
     Busca vehículos disponibles según criterios
 
+    La flota se filtra en memoria con el índice de disponibilidad y la base de
+    datos solo se consulta para hidratar los vehículos resultantes. Si el índice
+    está deshabilitado o falla, se usa la consulta de solapamiento en SQL.
+
     Args:
         fecha_inicio: Fecha/hora de recogida
         fecha_fin: Fecha/hora de devolución
@@ -48,22 +62,56 @@ def buscar_vehiculos_disponibles(
     if fecha_inicio >= fecha_fin:
         logger.error("Fecha de inicio debe ser anterior a fecha de fin")
         return Vehiculo.objects.none()
-    
-    # Base: vehículos activos y disponibles con relaciones optimizadas
-    vehiculos = Vehiculo.objects.filter(
-        activo=True, 
-        disponible=True
-    ).select_related(
+
+    if indice_habilitado():
+        try:
+            vehiculos_ids = indice_disponibilidad.vehiculos_libres(
+                fecha_inicio,
+                fecha_fin,
+                categoria_id=categoria_id,
+                grupo_id=grupo_id,
+                lugar_id=lugar_id,
+            )
+            logger.info(f"Vehículos disponibles encontrados (índice): {len(vehiculos_ids)}")
+            return _hidratar_vehiculos(Vehiculo.objects.filter(id__in=vehiculos_ids))
+        except Exception as e:
+            logger.error(
+                f"Error consultando índice de disponibilidad, usando SQL: {str(e)}",
+                exc_info=True,
+            )
+
+    return _buscar_vehiculos_disponibles_bd(
+        fecha_inicio,
+        fecha_fin,
+        categoria_id=categoria_id,
+        grupo_id=grupo_id,
+        lugar_id=lugar_id,
+    )
+
+
+def _hidratar_vehiculos(vehiculos: QuerySet[Vehiculo]) -> QuerySet[Vehiculo]:
+    """Relaciones que necesitan los serializers de resultados de búsqueda"""
+    return vehiculos.select_related(
         'categoria', 
         'grupo'
     ).prefetch_related(
         'imagenes', 
         'tarifas'
-    )    # Filtrar por lugar si se especifica (lugar de recogida)
-    if lugar_id:
-        # Nota: Filtrado por lugar deshabilitado hasta que se implemente el modelo Lugar
-        logger.info(f"Filtrado por lugar {lugar_id} solicitado pero no implementado")
-        pass
+    )
+
+
+def _buscar_vehiculos_disponibles_bd(
+    fecha_inicio: datetime,
+    fecha_fin: datetime,
+    categoria_id: Optional[int] = None,
+    grupo_id: Optional[int] = None,
+    lugar_id: Optional[int] = None
+) -> QuerySet[Vehiculo]:
+    """Búsqueda de disponibilidad directamente en base de datos (sin índice)"""
+    # Base: vehículos activos y disponibles con relaciones optimizadas
+    vehiculos = _hidratar_vehiculos(
+        Vehiculo.objects.filter(activo=True, disponible=True)
+    )
 
     # Filtrar por categoría si se especifica
     if categoria_id:
@@ -83,20 +131,22 @@ def buscar_vehiculos_disponibles(
             logger.info(f"Filtrado por grupo: {grupo.nombre}")
         except GrupoCoche.DoesNotExist:
             logger.warning(f"Grupo {grupo_id} no encontrado")
-            return Vehiculo.objects.none()    # Excluir vehículos con reservas que se solapen con las fechas
+            return Vehiculo.objects.none()
+
+    # Filtrar por lugar de recogida: vehículos presentes allí en la fecha de recogida
+    if lugar_id:
+        vehiculos = filtrar_por_ubicacion(vehiculos, lugar_id, fecha_inicio)
+
+    # Excluir vehículos con reservas que se solapen con las fechas
     try:
         # Consulta optimizada para encontrar reservas solapadas
         reservas_solapadas_query = Reserva.objects.filter(
             vehiculo_id__in=vehiculos.values_list("id", flat=True),
-            estado__in=["pendiente", "confirmada", "pagada", "en_curso"],
+            estado__in=ESTADOS_ACTIVOS,
             fecha_recogida__lt=fecha_fin,
             fecha_devolucion__gt=fecha_inicio,
         )
         
-        # Log de debug para ver cuántas reservas solapadas hay
-        num_reservas_solapadas = reservas_solapadas_query.count()
-        logger.info(f"Encontradas {num_reservas_solapadas} reservas solapadas en total")
-        
         # Obtener IDs de vehículos con reservas solapadas
         vehiculos_ocupados = list(reservas_solapadas_query.values_list("vehiculo_id", flat=True))
         
@@ -110,12 +160,25 @@ def buscar_vehiculos_disponibles(
         logger.error(f"Error filtrando reservas solapadas: {str(e)}", exc_info=True)
         # Continuar sin filtrar si hay error en reservas para no bloquear la búsqueda
 
-    vehiculos_count = vehiculos.count()
-    logger.info(f"Vehículos disponibles encontrados: {vehiculos_count}")
-    
     return vehiculos
 
 
+def filtrar_por_ubicacion(
+    vehiculos: QuerySet[Vehiculo], lugar_id: int, momento: datetime
+) -> QuerySet[Vehiculo]:
+    """
+    Filtra los vehículos que estarán en el lugar en el momento indicado.
+
+    La ubicación es el lugar de devolución de la última reserva que termina
+    antes del momento o, si no la hay, la sede base (`lugar_actual`). Los
+    vehículos sin ubicación conocida se consideran presentes en cualquier lugar.
+    (Misma regla que el índice de disponibilidad en memoria)
+    """
+    return vehiculos.annotate(
+        lugar_en_recogida=ubicacion_en(momento)
+    ).filter(Q(lugar_en_recogida=lugar_id) | Q(lugar_en_recogida__isnull=True))
+
+
 def calcular_precio_alquiler(
     vehiculo_id: int,
     fecha_inicio: datetime,
@@ -144,47 +207,48 @@ def calcular_precio_alquiler(
         logger.error(f"Vehículo {vehiculo_id} no encontrado")
         raise ValueError(f"Vehículo {vehiculo_id} no encontrado")
 
-    # Calcular días de alquiler
-    dias = (fecha_fin - fecha_inicio).days
-    if dias <= 0:
-        dias = 1  # Mínimo 1 día
-
-    # Obtener precio por día del vehículo
-    precio_dia = vehiculo.get_precio_para_fechas(fecha_inicio)
-    if not precio_dia or precio_dia <= 0:
+    # Precio base día a día (calendario de tarifas, una lectura por rango)
+    periodo = precio_periodo(vehiculo_id, fecha_inicio, fecha_fin)
+    dias = periodo.dias
+    if periodo.dias_sin_tarifa:
         logger.error(f"No hay tarifa válida para vehículo {vehiculo_id} en las fechas especificadas")
         raise ValueError("No hay tarifa válida para las fechas especificadas")
 
-    # Precio base
-    precio_base = precio_dia * dias
+    precio_dia = periodo.precio_primer_dia
+    precio_base = periodo.total
     
     # Calcular extras
     precio_extras = Decimal('0.00')
     extras_detalle = []
     
     if extras:
-        try:
-            # Lazy import de Extras
-            from reservas.models import Extras as ExtrasModel
-            
-            for extra_id in extras:
-                try:
-                    extra = ExtrasModel.objects.get(id=extra_id)
-                    precio_extra = extra.precio * dias  # Extras por día
-                    precio_extras += precio_extra
-                    extras_detalle.append({
-                        'id': extra.id,
-                        'nombre': extra.nombre,
-                        'precio_por_dia': float(extra.precio),
-                        'dias': dias,
-                        'precio_total': float(precio_extra)
-                    })
-                    logger.info(f"Extra agregado: {extra.nombre} - ${precio_extra}")
-                except ExtrasModel.DoesNotExist:
-                    logger.warning(f"Extra {extra_id} no encontrado")
-                    
-        except ImportError:
-            logger.warning("Modelo Extras no disponible, saltando cálculo de extras")
+        # Lazy import del catálogo de extras (en memoria, sin consultas por extra)
+        from reservas.extras import extras_por_id
+
+        # Los IDs pueden llegar como texto desde la petición
+        ids = []
+        for extra_id in extras:
+            try:
+                ids.append(int(extra_id))
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Error procesando extra {extra_id}: {str(e)}")
+
+        catalogo = extras_por_id(ids)
+        for extra_id in ids:
+            extra = catalogo.get(extra_id)
+            if extra is None:
+                logger.warning(f"Extra {extra_id} no encontrado")
+                continue
+            precio_extra = extra.precio * dias  # Extras por día
+            precio_extras += precio_extra
+            extras_detalle.append({
+                'id': extra.id,
+                'nombre': extra.nombre,
+                'precio_por_dia': float(extra.precio),
+                'dias': dias,
+                'precio_total': float(precio_extra)
+            })
+            logger.info(f"Extra agregado: {extra.nombre} - ${precio_extra}")
 
     # Precio antes de descuentos
     precio_antes_descuento = precio_base + precio_extras
@@ -399,3 +463,137 @@ def obtener_fechas_no_disponibles(vehiculo_id: int) -> List[dict]:
     except Exception as e:
         logger.error(f"Error obteniendo fechas no disponibles para vehículo {vehiculo_id}: {str(e)}")
         return []
+
+
+def sugerir_ventanas_alternativas(
+    fecha_inicio: datetime,
+    fecha_fin: datetime,
+    lugar_id: Optional[int] = None,
+    categoria_id: Optional[int] = None,
+    grupo_id: Optional[int] = None,
+    limite: int = SUGERENCIAS_POR_DEFECTO,
+) -> dict:
+    """
+    Ventanas de la misma duración más cercanas a las pedidas, para cuando una
+    búsqueda no encuentra vehículos (ver vehiculos/huecos.py).
+
+    Returns:
+        {"fechas": [...], "alternativas": [...]} con los nombres de categoría
+        y grupo de cada ventana; listas vacías si no se pudo calcular
+    """
+    try:
+        if indice_habilitado():
+            sugerencias = indice_disponibilidad.sugerir_ventanas(
+                fecha_inicio,
+                fecha_fin,
+                categoria_id=categoria_id,
+                grupo_id=grupo_id,
+                lugar_id=lugar_id,
+                limite=limite,
+            )
+        else:
+            # Sin índice compartido se carga uno temporal (dos consultas)
+            indice = IndiceDisponibilidad()
+            indice.cargar()
+            sugerencias = indice.sugerir_ventanas(
+                fecha_inicio,
+                fecha_fin,
+                categoria_id=categoria_id,
+                grupo_id=grupo_id,
+                lugar_id=lugar_id,
+                limite=limite,
+            )
+    except Exception as e:
+        logger.error(f"Error calculando ventanas alternativas: {str(e)}", exc_info=True)
+        return {"fechas": [], "alternativas": []}
+
+    ventanas = sugerencias["fechas"] + sugerencias["alternativas"]
+    categorias = dict(
+        Categoria.objects.filter(
+            id__in={ventana["categoria_id"] for ventana in ventanas}
+        ).values_list("id", "nombre")
+    )
+    grupos = dict(
+        GrupoCoche.objects.filter(
+            id__in={ventana["grupo_id"] for ventana in ventanas}
+        ).values_list("id", "nombre")
+    )
+    for ventana in ventanas:
+        ventana["categoria"] = categorias.get(ventana["categoria_id"])
+        ventana["grupo"] = grupos.get(ventana["grupo_id"])
+        ventana["num_vehiculos"] = len(ventana.pop("vehiculos"))
+
+    return sugerencias
+
+
+def calcular_matriz_disponibilidad(
+    fecha_inicio: date,
+    fecha_fin: date,
+    categoria_id: Optional[int] = None,
+    grupo_id: Optional[int] = None,
+) -> dict:
+    """
+    Matriz de ocupación vehículos × días para la vista de calendario.
+
+    Cada vehículo es una fila de bits (1 = ocupado ese día) que se pinta con
+    operaciones sobre enteros: una reserva es una máscara de bits contiguos
+    que se combina con OR, sin recorrer los días uno a uno. Las reservas se
+    leen con una sola consulta para toda la flota.
+
+    Args:
+        fecha_inicio: Primer día de la matriz
+        fecha_fin: Último día de la matriz (incluido)
+        categoria_id: Filtrar por categoría (opcional)
+        grupo_id: Filtrar por grupo (opcional)
+
+    Returns:
+        Dict con los IDs de vehículos (orden de las filas), el número de días y
+        la matriz empaquetada en base64: filas consecutivas de `bytes_por_fila`
+        bytes, bit más significativo primero (bit 0 = fecha_inicio)
+    """
+    dias = (fecha_fin - fecha_inicio).days + 1
+    if dias <= 0:
+        raise ValueError("La fecha de fin debe ser igual o posterior a la de inicio")
+    if dias > MAX_DIAS_MATRIZ:
+        raise ValueError(f"El rango máximo es de {MAX_DIAS_MATRIZ} días")
+
+    vehiculos = Vehiculo.objects.filter(activo=True)
+    if categoria_id:
+        vehiculos = vehiculos.filter(categoria_id=categoria_id)
+    if grupo_id:
+        vehiculos = vehiculos.filter(grupo_id=grupo_id)
+    vehiculo_ids = list(vehiculos.order_by("id").values_list("id", flat=True))
+    fila_por_vehiculo = {vehiculo_id: n for n, vehiculo_id in enumerate(vehiculo_ids)}
+
+    inicio_rango = timezone.make_aware(datetime.combine(fecha_inicio, time.min))
+    fin_rango = inicio_rango + timedelta(days=dias)
+    reservas = Reserva.objects.filter(
+        vehiculo_id__in=vehiculo_ids,
+        estado__in=ESTADOS_ACTIVOS,
+        fecha_recogida__lt=fin_rango,
+        fecha_devolucion__gt=inicio_rango,
+    ).values_list("vehiculo_id", "fecha_recogida", "fecha_devolucion")
+
+    # Bit (dias - 1 - d) de la fila = día d, para empaquetar con el día 0 en el bit más alto
+    filas = [0] * len(vehiculo_ids)
+    for vehiculo_id, recogida, devolucion in reservas:
+        tramo = dias_ocupados(recogida, devolucion, fecha_inicio, dias)
+        if tramo is None:
+            continue
+        primero, ultimo = tramo
+        longitud = ultimo - primero + 1
+        filas[fila_por_vehiculo[vehiculo_id]] |= ((1 << longitud) - 1) << (dias - 1 - ultimo)
+
+    bytes_por_fila = (dias + 7) // 8
+    relleno = bytes_por_fila * 8 - dias
+    matriz = b"".join((fila << relleno).to_bytes(bytes_por_fila, "big") for fila in filas)
+
+    return {
+        "fecha_inicio": fecha_inicio.isoformat(),
+        "fecha_fin": fecha_fin.isoformat(),
+        "dias": dias,
+        "vehiculos": vehiculo_ids,
+        "bytes_por_fila": bytes_por_fila,
+        "codificacion": "bitmap-base64",
+        "matriz": base64.b64encode(matriz).decode("ascii"),
+    }
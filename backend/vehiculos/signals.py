@@ -0,0 +1,242 @@
+# vehiculos/signals.py
+"""
+Señales de la app de vehículos
+
+Mantienen sincronizado el índice de disponibilidad en memoria con los cambios
+de reservas y vehículos, el calendario de precios con los cambios de tarifas,
+invalidan la caché de búsquedas de disponibilidad afectada y programan las
+variantes redimensionadas de las imágenes subidas.
+"""
+import logging
+
+from django.db import transaction
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_save)
+from django.dispatch import receiver
+from reservas.signals import estado_cambiado
+
+from . import cache_disponibilidad
+from .imagenes import (eliminar_variantes, programar_variantes,
+                       variantes_vigentes)
+from .indice_disponibilidad import indice_disponibilidad
+from .models import (ImagenVehiculo, Mantenimiento, PrecioDiarioVehiculo,
+                     TarifaVehiculo, Vehiculo)
+from .tarifas import reconstruir_calendario
+
+logger = logging.getLogger(__name__)
+
+
+def _al_confirmar(funcion, *args):
+    """Aplica el cambio al índice solo cuando la transacción se confirma"""
+
+    def _aplicar():
+        try:
+            funcion(*args)
+        except Exception as e:
+            logger.error(f"Error actualizando índice de disponibilidad: {str(e)}")
+            indice_disponibilidad.invalidar()
+
+    transaction.on_commit(_aplicar)
+
+
+@receiver(post_save, sender="reservas.Reserva")
+def reserva_guardada(sender, instance, **kwargs):
+    _al_confirmar(indice_disponibilidad.actualizar_reserva, instance)
+
+
+@receiver(post_delete, sender="reservas.Reserva")
+def reserva_eliminada(sender, instance, **kwargs):
+    _al_confirmar(indice_disponibilidad.eliminar_reserva, instance.pk)
+
+
+@receiver(post_save, sender=Vehiculo)
+def vehiculo_guardado(sender, instance, **kwargs):
+    _al_confirmar(indice_disponibilidad.actualizar_vehiculo, instance)
+
+
+@receiver(post_delete, sender=Vehiculo)
+def vehiculo_eliminado(sender, instance, **kwargs):
+    _al_confirmar(indice_disponibilidad.eliminar_vehiculo, instance.pk)
+
+
+def _regenerar_calendario(vehiculo_id):
+    """Regenera el calendario de precios del vehículo al confirmar la transacción"""
+
+    def _aplicar():
+        try:
+            reconstruir_calendario([vehiculo_id])
+        except Exception as e:
+            logger.error(
+                f"Error regenerando calendario de tarifas del vehículo {vehiculo_id}: {str(e)}"
+            )
+            # Sin filas, precio_periodo recurre a TarifaVehiculo en lugar de usar precios obsoletos
+            PrecioDiarioVehiculo.objects.filter(vehiculo_id=vehiculo_id).delete()
+
+    transaction.on_commit(_aplicar)
+
+
+@receiver(post_save, sender=TarifaVehiculo)
+@receiver(post_delete, sender=TarifaVehiculo)
+def tarifa_modificada(sender, instance, **kwargs):
+    _regenerar_calendario(instance.vehiculo_id)
+
+
+# === CACHÉ DE BÚSQUEDAS DE DISPONIBILIDAD ===
+
+
+def _invalidar_ventanas(*ventanas, ubicaciones=False):
+    """
+    Invalida, al confirmar la transacción, las búsquedas que solapan las
+    ventanas y, con `ubicaciones`, todas las filtradas por lugar
+    """
+
+    def _aplicar():
+        for inicio, fin in ventanas:
+            cache_disponibilidad.invalidar_periodo(inicio, fin)
+        if ubicaciones:
+            cache_disponibilidad.invalidar_ubicaciones()
+
+    transaction.on_commit(_aplicar)
+
+
+def _recordar_ventana(instance, campo_inicio, campo_fin):
+    """
+    Guarda en la instancia la ventana con la que se creó o se cargó, sin
+    consultar la BD. Si las fechas se difirieron (only/defer) no se guarda
+    nada y la ventana previa se lee al guardar.
+    """
+    valores = instance.__dict__
+    if campo_inicio in valores and campo_fin in valores:
+        instance._ventana_cache_anterior = (valores[campo_inicio], valores[campo_fin])
+
+
+def _completar_ventana(instance, sender, campo_inicio, campo_fin, update_fields):
+    """Lee la ventana previa solo si no se conoce y el guardado puede cambiarla"""
+    if hasattr(instance, "_ventana_cache_anterior") or instance._state.adding:
+        return
+    if update_fields is not None and not {campo_inicio, campo_fin} & set(update_fields):
+        return
+    anterior = sender.objects.filter(pk=instance.pk).values(campo_inicio, campo_fin).first()
+    if anterior:
+        instance._ventana_cache_anterior = (anterior[campo_inicio], anterior[campo_fin])
+
+
+def _ventanas_modificadas(instance, nueva, created=False):
+    ventanas = [nueva]
+    anterior = None if created else getattr(instance, "_ventana_cache_anterior", None)
+    if anterior and anterior != nueva:
+        ventanas.append(anterior)
+    # Punto de partida del siguiente guardado de la misma instancia
+    instance._ventana_cache_anterior = nueva
+    return ventanas
+
+
+@receiver(post_init, sender="reservas.Reserva")
+def reserva_inicializada(sender, instance, **kwargs):
+    _recordar_ventana(instance, "fecha_recogida", "fecha_devolucion")
+
+
+@receiver(pre_save, sender="reservas.Reserva")
+def reserva_antes_de_guardar(sender, instance, update_fields=None, **kwargs):
+    _completar_ventana(instance, sender, "fecha_recogida", "fecha_devolucion", update_fields)
+
+
+@receiver(post_save, sender="reservas.Reserva")
+@receiver(post_delete, sender="reservas.Reserva")
+def reserva_invalida_cache(sender, instance, **kwargs):
+    # La devolución decide dónde está el vehículo en las ventanas posteriores
+    _invalidar_ventanas(
+        *_ventanas_modificadas(
+            instance, (instance.fecha_recogida, instance.fecha_devolucion), kwargs.get("created")
+        ),
+        ubicaciones=True,
+    )
+
+
+@receiver(post_init, sender=TarifaVehiculo)
+def tarifa_inicializada(sender, instance, **kwargs):
+    _recordar_ventana(instance, "fecha_inicio", "fecha_fin")
+
+
+@receiver(pre_save, sender=TarifaVehiculo)
+def tarifa_antes_de_guardar(sender, instance, update_fields=None, **kwargs):
+    _completar_ventana(instance, sender, "fecha_inicio", "fecha_fin", update_fields)
+
+
+@receiver(estado_cambiado, sender="reservas.Reserva")
+def reserva_cambia_estado(sender, reservas, **kwargs):
+    if reservas is None:
+        # Transición en bloque: no se sabe qué ventanas han cambiado
+        transaction.on_commit(indice_disponibilidad.invalidar)
+        transaction.on_commit(cache_disponibilidad.invalidar_todo)
+        return
+    for reserva in reservas:
+        _al_confirmar(indice_disponibilidad.actualizar_reserva, reserva)
+    _invalidar_ventanas(
+        *[(reserva.fecha_recogida, reserva.fecha_devolucion) for reserva in reservas],
+        ubicaciones=True,
+    )
+
+
+@receiver(post_save, sender=TarifaVehiculo)
+@receiver(post_delete, sender=TarifaVehiculo)
+def tarifa_invalida_cache(sender, instance, **kwargs):
+    # Las tarifas por defecto (sin fecha_fin) afectan a todas las ventanas
+    _invalidar_ventanas(
+        *_ventanas_modificadas(
+            instance, (instance.fecha_inicio, instance.fecha_fin), kwargs.get("created")
+        )
+    )
+
+
+@receiver(post_init, sender=Mantenimiento)
+def mantenimiento_inicializado(sender, instance, **kwargs):
+    _recordar_ventana(instance, "fecha", "fecha")
+
+
+@receiver(pre_save, sender=Mantenimiento)
+def mantenimiento_antes_de_guardar(sender, instance, update_fields=None, **kwargs):
+    _completar_ventana(instance, sender, "fecha", "fecha", update_fields)
+
+
+@receiver(post_save, sender=Mantenimiento)
+@receiver(post_delete, sender=Mantenimiento)
+def mantenimiento_invalida_cache(sender, instance, **kwargs):
+    # Los días de mantenimiento cuentan en la analítica de utilización
+    _invalidar_ventanas(
+        *_ventanas_modificadas(instance, (instance.fecha, instance.fecha), kwargs.get("created"))
+    )
+
+
+@receiver(post_save, sender=Vehiculo)
+@receiver(post_delete, sender=Vehiculo)
+@receiver(post_save, sender=ImagenVehiculo)
+@receiver(post_delete, sender=ImagenVehiculo)
+def flota_invalida_cache(sender, instance, **kwargs):
+    transaction.on_commit(cache_disponibilidad.invalidar_todo)
+
+
+# ======================
+# VARIANTES DE IMÁGENES
+# ======================
+
+
+@receiver(post_save, sender=ImagenVehiculo)
+def imagen_programa_variantes(sender, instance, **kwargs):
+    """Genera las variantes de un archivo nuevo fuera del hilo de la petición"""
+    if not instance.imagen or variantes_vigentes(instance):
+        return
+
+    # Las variantes de un archivo sustituido ya no se sirven
+    anteriores = dict(instance.variantes or {})
+    if anteriores:
+        transaction.on_commit(lambda: eliminar_variantes(anteriores))
+
+    programar_variantes(instance.id)
+
+
+@receiver(post_delete, sender=ImagenVehiculo)
+def imagen_elimina_variantes(sender, instance, **kwargs):
+    variantes = dict(instance.variantes or {})
+    if variantes:
+        transaction.on_commit(lambda: eliminar_variantes(variantes))
@@ -0,0 +1,358 @@
+# vehiculos/tarifas.py
+"""
+Resolución de tarifas de vehículos por lotes
+
+Centraliza la regla de selección de tarifa para una fecha:
+1. Tarifa específica (con fecha_fin) vigente en la fecha, la de inicio más reciente
+2. Si no hay, tarifa por defecto (sin fecha_fin) iniciada antes de la fecha, la más reciente
+3. Si no hay ninguna, no hay precio
+
+Ofrece la regla en tres formas que no generan consultas por vehículo:
+- `seleccionar_tarifa`: sobre una colección de tarifas ya cargada (p.ej. prefetch)
+- `resolver_precios_dia`: {vehiculo_id: precio_dia} para un conjunto de vehículos en una consulta
+- `anotar_precio_dia`: anotación `precio_dia_vigente` calculada en la base de datos
+
+Calendario materializado (tabla `precio_diario_vehiculo`):
+- `reconstruir_calendario`: regenera los días del horizonte a partir de las tarifas
+- `precio_periodo`: precio de un alquiler día a día con una única suma por rango
+- `precios_periodo`: lo mismo para varios vehículos con una única suma agrupada
+"""
+import logging
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, List, NamedTuple, Optional, Union
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (Count, DecimalField, OuterRef, Q, QuerySet,
+                              Subquery, Sum, Value)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import PrecioDiarioVehiculo, TarifaVehiculo, Vehiculo
+
+logger = logging.getLogger(__name__)
+
+ANOTACION_PRECIO = "precio_dia_vigente"
+
+
+def normalizar_fecha_tarifa(fecha: Union[date, datetime, str, None]) -> date:
+    """Convierte la fecha recibida (date, datetime o ISO string) a date"""
+    if fecha is None:
+        return timezone.now().date()
+    if isinstance(fecha, str):
+        fecha = datetime.fromisoformat(fecha.replace("Z", "+00:00"))
+    if isinstance(fecha, datetime):
+        return fecha.date()
+    return fecha
+
+
+def seleccionar_tarifa(
+    tarifas: Iterable[TarifaVehiculo], fecha: Union[date, datetime, str, None]
+) -> Optional[TarifaVehiculo]:
+    """Aplica la regla de selección sobre tarifas ya cargadas en memoria"""
+    fecha = normalizar_fecha_tarifa(fecha)
+    especifica = None
+    defecto = None
+
+    for tarifa in tarifas:
+        if tarifa.fecha_inicio > fecha:
+            continue
+        if tarifa.fecha_fin is not None:
+            if tarifa.fecha_fin >= fecha and (
+                especifica is None or tarifa.fecha_inicio > especifica.fecha_inicio
+            ):
+                especifica = tarifa
+        elif defecto is None or tarifa.fecha_inicio > defecto.fecha_inicio:
+            defecto = tarifa
+
+    return especifica or defecto
+
+
+def tarifas_candidatas(fecha: Union[date, datetime, str, None]) -> Q:
+    """Filtro de tarifas que pueden aplicar en la fecha (específicas vigentes y por defecto)"""
+    fecha = normalizar_fecha_tarifa(fecha)
+    return Q(fecha_inicio__lte=fecha) & (Q(fecha_fin__isnull=True) | Q(fecha_fin__gte=fecha))
+
+
+def resolver_precios_dia(
+    vehiculos: Union[QuerySet, Iterable[Union[Vehiculo, int]]],
+    fecha: Union[date, datetime, str, None] = None,
+) -> Dict[int, Decimal]:
+    """
+    Resuelve el precio por día de varios vehículos con una sola consulta.
+
+    Args:
+        vehiculos: QuerySet de vehículos, instancias o IDs
+        fecha: Fecha para la que se resuelve la tarifa (hoy por defecto)
+
+    Returns:
+        Dict {vehiculo_id: precio_dia}; los vehículos sin tarifa no aparecen
+    """
+    fecha = normalizar_fecha_tarifa(fecha)
+
+    if isinstance(vehiculos, QuerySet):
+        filtro_vehiculos = Q(vehiculo__in=vehiculos.values("id"))
+    else:
+        ids = [v if isinstance(v, int) else v.pk for v in vehiculos]
+        if not ids:
+            return {}
+        filtro_vehiculos = Q(vehiculo_id__in=ids)
+
+    tarifas_por_vehiculo: Dict[int, list] = {}
+    for tarifa in TarifaVehiculo.objects.filter(
+        filtro_vehiculos, tarifas_candidatas(fecha)
+    ).only("id", "vehiculo_id", "fecha_inicio", "fecha_fin", "precio_dia"):
+        tarifas_por_vehiculo.setdefault(tarifa.vehiculo_id, []).append(tarifa)
+
+    precios = {}
+    for vehiculo_id, tarifas in tarifas_por_vehiculo.items():
+        tarifa = seleccionar_tarifa(tarifas, fecha)
+        if tarifa is not None:
+            precios[vehiculo_id] = tarifa.precio_dia
+    return precios
+
+
+def anotar_precio_dia(
+    queryset: QuerySet, fecha: Union[date, datetime, str, None] = None
+) -> QuerySet:
+    """
+    Anota `precio_dia_vigente` en un QuerySet de vehículos (0.00 si no hay tarifa).
+
+    Permite filtrar y ordenar por precio en la base de datos.
+    """
+    fecha = normalizar_fecha_tarifa(fecha)
+    especifica = (
+        TarifaVehiculo.objects.filter(
+            vehiculo=OuterRef("pk"),
+            fecha_inicio__lte=fecha,
+            fecha_fin__gte=fecha,
+        )
+        .order_by("-fecha_inicio")
+        .values("precio_dia")[:1]
+    )
+    defecto = (
+        TarifaVehiculo.objects.filter(
+            vehiculo=OuterRef("pk"),
+            fecha_inicio__lte=fecha,
+            fecha_fin__isnull=True,
+        )
+        .order_by("-fecha_inicio")
+        .values("precio_dia")[:1]
+    )
+    campo = DecimalField(max_digits=8, decimal_places=2)
+    return queryset.annotate(
+        **{
+            ANOTACION_PRECIO: Coalesce(
+                Subquery(especifica, output_field=campo),
+                Subquery(defecto, output_field=campo),
+                Value(Decimal("0.00"), output_field=campo),
+            )
+        }
+    )
+
+
+# === CALENDARIO MATERIALIZADO ===
+
+
+class PrecioPeriodo(NamedTuple):
+    """Resultado de tarificar un período día a día"""
+
+    total: Decimal
+    dias: int
+    precio_primer_dia: Decimal
+    dias_sin_tarifa: int
+
+
+def dias_tarificables(fecha_inicio: datetime, fecha_fin: datetime) -> int:
+    """Días facturables de un alquiler (mínimo 1), igual que en el cálculo de reservas"""
+    dias = (fecha_fin - fecha_inicio).days
+    return dias if dias > 0 else 1
+
+
+def _horizonte_calendario(desde: Optional[date] = None, dias: Optional[int] = None):
+    desde = normalizar_fecha_tarifa(desde) if desde else timezone.now().date() - timedelta(days=1)
+    dias = dias or getattr(settings, "CALENDARIO_TARIFAS_DIAS", 400)
+    return desde, desde + timedelta(days=dias - 1)
+
+
+def _precios_por_dia(tarifas: List[TarifaVehiculo], desde: date, hasta: date) -> List[Decimal]:
+    """Precio de cada día del rango [desde, hasta] según la regla de selección"""
+    precios = []
+    dia = desde
+    while dia <= hasta:
+        tarifa = seleccionar_tarifa(tarifas, dia)
+        precios.append(tarifa.precio_dia if tarifa else Decimal("0.00"))
+        dia += timedelta(days=1)
+    return precios
+
+
+def _tarifas_en_rango(vehiculo_ids, desde: date, hasta: date) -> Dict[int, List[TarifaVehiculo]]:
+    filtro = Q(fecha_inicio__lte=hasta) & (Q(fecha_fin__isnull=True) | Q(fecha_fin__gte=desde))
+    if vehiculo_ids is not None:
+        filtro &= Q(vehiculo_id__in=vehiculo_ids)
+
+    tarifas: Dict[int, List[TarifaVehiculo]] = {}
+    for tarifa in TarifaVehiculo.objects.filter(filtro).only(
+        "id", "vehiculo_id", "fecha_inicio", "fecha_fin", "precio_dia"
+    ):
+        tarifas.setdefault(tarifa.vehiculo_id, []).append(tarifa)
+    return tarifas
+
+
+def reconstruir_calendario(
+    vehiculo_ids: Optional[Iterable[int]] = None,
+    desde: Optional[date] = None,
+    dias: Optional[int] = None,
+) -> int:
+    """
+    Regenera el calendario de precios de los vehículos indicados (todos si es None).
+
+    Args:
+        vehiculo_ids: IDs de vehículos a regenerar
+        desde: Primer día del horizonte (ayer por defecto)
+        dias: Días del horizonte (CALENDARIO_TARIFAS_DIAS por defecto)
+
+    Returns:
+        Número de filas escritas
+    """
+    desde, hasta = _horizonte_calendario(desde, dias)
+    vehiculos = Vehiculo.objects.all()
+    if vehiculo_ids is not None:
+        vehiculos = vehiculos.filter(id__in=list(vehiculo_ids))
+    # Solo vehículos existentes (las tarifas borradas en cascada también avisan)
+    vehiculo_ids = list(vehiculos.values_list("id", flat=True))
+    if not vehiculo_ids:
+        return 0
+
+    tarifas = _tarifas_en_rango(vehiculo_ids, desde, hasta)
+    filas = []
+    for vehiculo_id in vehiculo_ids:
+        for offset, precio in enumerate(
+            _precios_por_dia(tarifas.get(vehiculo_id, []), desde, hasta)
+        ):
+            filas.append(
+                PrecioDiarioVehiculo(
+                    vehiculo_id=vehiculo_id,
+                    fecha=desde + timedelta(days=offset),
+                    precio_dia=precio,
+                )
+            )
+
+    with transaction.atomic():
+        # Se reemplaza el calendario completo: los días fuera del horizonte no se presupuestan
+        PrecioDiarioVehiculo.objects.filter(vehiculo_id__in=vehiculo_ids).delete()
+        PrecioDiarioVehiculo.objects.bulk_create(filas, batch_size=2000)
+
+    logger.info(
+        f"Calendario de tarifas regenerado: {len(vehiculo_ids)} vehículos, "
+        f"{desde} - {hasta} ({len(filas)} filas)"
+    )
+    return len(filas)
+
+
+def precio_periodo(
+    vehiculo_id: int, fecha_inicio: datetime, fecha_fin: datetime
+) -> PrecioPeriodo:
+    """
+    Precio base de un alquiler sumando la tarifa de cada día.
+
+    Resuelve el período con una única lectura por rango sobre el calendario
+    materializado. Si el calendario no cubre todos los días (fuera del
+    horizonte o aún sin generar) se calcula desde TarifaVehiculo.
+    """
+    dias = dias_tarificables(fecha_inicio, fecha_fin)
+    primer_dia = normalizar_fecha_tarifa(fecha_inicio)
+    ultimo_dia = primer_dia + timedelta(days=dias - 1)
+
+    agregado = PrecioDiarioVehiculo.objects.filter(
+        vehiculo_id=vehiculo_id, fecha__range=(primer_dia, ultimo_dia)
+    ).aggregate(
+        total=Sum("precio_dia"),
+        cubiertos=Count("id"),
+        primer_dia=Sum("precio_dia", filter=Q(fecha=primer_dia)),
+        sin_tarifa=Count("id", filter=Q(precio_dia__lte=0)),
+    )
+
+    if agregado["cubiertos"] == dias:
+        return PrecioPeriodo(
+            total=agregado["total"],
+            dias=dias,
+            precio_primer_dia=agregado["primer_dia"],
+            dias_sin_tarifa=agregado["sin_tarifa"],
+        )
+
+    logger.info(
+        f"Calendario sin cubrir para vehículo {vehiculo_id} ({primer_dia} - {ultimo_dia}), "
+        f"calculando desde tarifas"
+    )
+    return _periodo_desde_tarifas(
+        _tarifas_en_rango([vehiculo_id], primer_dia, ultimo_dia).get(vehiculo_id, []),
+        primer_dia,
+        ultimo_dia,
+    )
+
+
+def _periodo_desde_tarifas(
+    tarifas: List[TarifaVehiculo], primer_dia: date, ultimo_dia: date
+) -> PrecioPeriodo:
+    precios = _precios_por_dia(tarifas, primer_dia, ultimo_dia)
+    return PrecioPeriodo(
+        total=sum(precios, Decimal("0.00")),
+        dias=len(precios),
+        precio_primer_dia=precios[0],
+        dias_sin_tarifa=sum(1 for precio in precios if precio <= 0),
+    )
+
+
+def precios_periodo(
+    vehiculo_ids: Iterable[int], fecha_inicio: datetime, fecha_fin: datetime
+) -> Dict[int, PrecioPeriodo]:
+    """
+    precio_periodo() de varios vehículos para el mismo alquiler.
+
+    Una suma agrupada por vehículo sobre el calendario materializado; los
+    vehículos con días sin cubrir se calculan juntos con una lectura de
+    TarifaVehiculo.
+    """
+    vehiculo_ids = list(dict.fromkeys(vehiculo_ids))
+    if not vehiculo_ids:
+        return {}
+    dias = dias_tarificables(fecha_inicio, fecha_fin)
+    primer_dia = normalizar_fecha_tarifa(fecha_inicio)
+    ultimo_dia = primer_dia + timedelta(days=dias - 1)
+
+    periodos: Dict[int, PrecioPeriodo] = {}
+    for fila in (
+        PrecioDiarioVehiculo.objects.filter(
+            vehiculo_id__in=vehiculo_ids, fecha__range=(primer_dia, ultimo_dia)
+        )
+        .values("vehiculo_id")
+        .annotate(
+            total=Sum("precio_dia"),
+            cubiertos=Count("id"),
+            primer_dia=Sum("precio_dia", filter=Q(fecha=primer_dia)),
+            sin_tarifa=Count("id", filter=Q(precio_dia__lte=0)),
+        )
+        .order_by()
+    ):
+        if fila["cubiertos"] == dias:
+            periodos[fila["vehiculo_id"]] = PrecioPeriodo(
+                total=fila["total"],
+                dias=dias,
+                precio_primer_dia=fila["primer_dia"],
+                dias_sin_tarifa=fila["sin_tarifa"],
+            )
+
+    sin_cubrir = [vehiculo_id for vehiculo_id in vehiculo_ids if vehiculo_id not in periodos]
+    if sin_cubrir:
+        logger.info(
+            f"Calendario sin cubrir para {len(sin_cubrir)} vehículos ({primer_dia} - {ultimo_dia}), "
+            f"calculando desde tarifas"
+        )
+        tarifas = _tarifas_en_rango(sin_cubrir, primer_dia, ultimo_dia)
+        for vehiculo_id in sin_cubrir:
+            periodos[vehiculo_id] = _periodo_desde_tarifas(
+                tarifas.get(vehiculo_id, []), primer_dia, ultimo_dia
+            )
+    return periodos
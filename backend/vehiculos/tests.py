@@ -0,0 +1,1006 @@
+"""
+Tests para la funcionalidad de vehículos
+"""
+
+import base64
+import os
+import shutil
+import tempfile
+from datetime import datetime, time, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from lugares.models import Direccion, Lugar
+from PIL import Image
+from politicas.models import PoliticaPago
+from reservas.models import Extras, Reserva
+from usuarios.models import Usuario
+
+from .analitica import calcular_utilizacion, dias_ocupados_vehiculo
+from .busqueda import CatalogoMarcasModelos
+from .facetas import calcular_facetas
+from .filters import VehiculoFilter
+from .huecos import sugerir_ventanas
+from .imagenes import ruta_variante
+from .indice_disponibilidad import (FichaVehiculo, IndiceDisponibilidad,
+                                    IntervalosVehiculo, huella_bd,
+                                    indice_disponibilidad)
+from .models import (Categoria, GrupoCoche, ImagenVehiculo, Mantenimiento,
+                     PrecioDiarioVehiculo, TarifaVehiculo, Vehiculo)
+from .serializers import (ImagenVehiculoSerializer,
+                          VehiculoDetailSerializer,
+                          VehiculoDisponibleSerializer)
+from .services import (buscar_vehiculos_disponibles,
+                       calcular_matriz_disponibilidad, calcular_precio_alquiler)
+from .tarifas import (anotar_precio_dia, precio_periodo, precios_periodo,
+                      reconstruir_calendario, resolver_precios_dia)
+from .views import VehiculoViewSet
+
+
+class FlotaTestMixin:
+    """Datos comunes: flota mínima, lugar, política y usuario"""
+
+    def crear_datos_base(self):
+        self.categoria = Categoria.objects.create(nombre="Coches")
+        self.grupo = GrupoCoche.objects.create(nombre="Compactos")
+        direccion = Direccion.objects.create(
+            calle="Avenida Test", ciudad="Málaga", pais="España", codigo_postal="29004"
+        )
+        self.lugar = Lugar.objects.create(nombre="Aeropuerto", direccion=direccion)
+        self.politica = PoliticaPago.objects.create(titulo="Básica", tarifa=Decimal("0.00"))
+        self.usuario = Usuario.objects.create(
+            username="cliente_test", email="cliente@test.com"
+        )
+
+    def crear_vehiculo(self, matricula, **kwargs):
+        datos = {
+            "categoria": self.categoria,
+            "grupo": self.grupo,
+            "combustible": "Gasolina",
+            "marca": "Seat",
+            "modelo": "Ibiza",
+            "matricula": matricula,
+            "anio": 2022,
+            "color": "Blanco",
+            "num_puertas": 5,
+            "num_pasajeros": 5,
+            "capacidad_maletero": 300,
+            "disponible": True,
+            "activo": True,
+        }
+        datos.update(kwargs)
+        vehiculo = Vehiculo.objects.create(**datos)
+        TarifaVehiculo.objects.create(
+            vehiculo=vehiculo,
+            fecha_inicio=timezone.now().date() - timedelta(days=30),
+            precio_dia=Decimal("40.00"),
+        )
+        return vehiculo
+
+    def crear_reserva(self, vehiculo, inicio, fin, estado="confirmada"):
+        return Reserva.objects.create(
+            usuario=self.usuario,
+            politica_pago=self.politica,
+            vehiculo=vehiculo,
+            lugar_recogida=self.lugar,
+            lugar_devolucion=self.lugar,
+            fecha_recogida=inicio,
+            fecha_devolucion=fin,
+            estado=estado,
+            precio_dia=Decimal("40.00"),
+            precio_total=Decimal("120.00"),
+        )
+
+
+class IntervalosVehiculoTest(TestCase):
+    """Tests para la estructura ordenada de ventanas de un vehículo"""
+
+    def setUp(self):
+        self.base = timezone.now()
+        self.intervalos = IntervalosVehiculo()
+
+    def dia(self, n):
+        return self.base + timedelta(days=n)
+
+    def test_solapamiento_basico(self):
+        """Detecta solapamientos y respeta los extremos abiertos"""
+        self.intervalos.agregar(1, self.dia(2), self.dia(5))
+        self.intervalos.agregar(2, self.dia(10), self.dia(12))
+
+        self.assertTrue(self.intervalos.solapa(self.dia(4), self.dia(6)))
+        self.assertTrue(self.intervalos.solapa(self.dia(0), self.dia(11)))
+        self.assertFalse(self.intervalos.solapa(self.dia(5), self.dia(10)))
+        self.assertFalse(self.intervalos.solapa(self.dia(0), self.dia(2)))
+        self.assertFalse(self.intervalos.solapa(self.dia(12), self.dia(20)))
+
+    def test_ventanas_solapadas_entre_si(self):
+        """Una ventana larga anterior sigue bloqueando aunque haya otras después"""
+        self.intervalos.agregar(1, self.dia(0), self.dia(30))
+        self.intervalos.agregar(2, self.dia(5), self.dia(6))
+
+        self.assertTrue(self.intervalos.solapa(self.dia(20), self.dia(21)))
+
+    def test_eliminar_y_excluir(self):
+        """Eliminar una ventana libera el período; excluir ignora la reserva indicada"""
+        self.intervalos.agregar(1, self.dia(0), self.dia(30))
+        self.intervalos.agregar(2, self.dia(5), self.dia(6))
+
+        self.assertFalse(self.intervalos.solapa(self.dia(20), self.dia(21), excluir_reserva_id=1))
+        self.assertTrue(self.intervalos.eliminar(1))
+        self.assertFalse(self.intervalos.solapa(self.dia(20), self.dia(21)))
+        self.assertFalse(self.intervalos.eliminar(1))
+
+
+class IndiceDisponibilidadTest(FlotaTestMixin, TestCase):
+    """Tests para el índice de disponibilidad y su sincronización"""
+
+    def setUp(self):
+        self.crear_datos_base()
+        self.inicio = timezone.now() + timedelta(days=5)
+        self.fin = self.inicio + timedelta(days=3)
+        self.libre = self.crear_vehiculo("1111AAA")
+        self.ocupado = self.crear_vehiculo("2222BBB")
+        self.crear_reserva(self.ocupado, self.inicio, self.fin)
+        # El índice del proceso se comparte entre tests: partir de la BD actual
+        indice_disponibilidad.cargar()
+
+    def test_carga_excluye_vehiculos_ocupados(self):
+        """El índice cargado desde BD excluye vehículos con reservas solapadas"""
+        indice = IndiceDisponibilidad()
+        indice.cargar()
+
+        libres = indice.vehiculos_libres(self.inicio + timedelta(days=1), self.fin)
+        self.assertEqual(libres, [self.libre.id])
+
+    def test_senales_actualizan_indice(self):
+        """Crear y cancelar reservas actualiza el índice del proceso"""
+        with self.captureOnCommitCallbacks(execute=True):
+            reserva = self.crear_reserva(self.libre, self.inicio, self.fin)
+        self.assertEqual(
+            indice_disponibilidad.vehiculos_libres(self.inicio, self.fin), []
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Reserva.objects.get(pk=reserva.pk).delete()
+        self.assertEqual(
+            indice_disponibilidad.vehiculos_libres(self.inicio, self.fin),
+            [self.libre.id],
+        )
+
+    def test_huella_coincide_con_bd(self):
+        """La huella del índice recién cargado coincide con la de la BD"""
+        indice = IndiceDisponibilidad()
+        indice.cargar()
+
+        informe = indice.informe()
+        self.assertEqual(informe["huella"], huella_bd(informe["ahora"]))
+
+    def test_busqueda_usa_indice(self):
+        """La búsqueda de disponibilidad devuelve solo los vehículos libres"""
+        vehiculos = buscar_vehiculos_disponibles(self.inicio, self.fin)
+
+        self.assertEqual(list(vehiculos.values_list("id", flat=True)), [self.libre.id])
+
+    def test_comando_verificacion(self):
+        """El comando compara la huella publicada por el worker y detecta desviaciones"""
+        indice_disponibilidad.publicar_informe()
+        salida = StringIO()
+        call_command("verificar_indice_disponibilidad", muestras=5, stdout=salida)
+        self.assertIn("coherente", salida.getvalue())
+        self.assertIn("consistentes", salida.getvalue())
+
+        # Un cambio que no pasa por las señales deja el índice del worker desviado
+        Reserva.objects.update(fecha_devolucion=self.fin + timedelta(days=1))
+        indice_disponibilidad.publicar_informe()
+        salida = StringIO()
+        call_command("verificar_indice_disponibilidad", muestras=0, stdout=salida)
+        self.assertIn("desviado", salida.getvalue())
+
+
+class TarifasLoteTest(FlotaTestMixin, TestCase):
+    """Tests para la resolución de tarifas por lotes"""
+
+    def setUp(self):
+        self.crear_datos_base()
+        self.hoy = timezone.now().date()
+        self.con_oferta = self.crear_vehiculo("3333CCC")
+        TarifaVehiculo.objects.create(
+            vehiculo=self.con_oferta,
+            fecha_inicio=self.hoy - timedelta(days=2),
+            fecha_fin=self.hoy + timedelta(days=2),
+            precio_dia=Decimal("25.00"),
+        )
+        self.sin_oferta = self.crear_vehiculo("4444DDD")
+        self.sin_tarifa = self.crear_vehiculo("5555EEE")
+        self.sin_tarifa.tarifas.all().delete()
+
+    def test_resolver_precios_una_consulta(self):
+        """La tarifa específica prevalece sobre la de defecto, en una sola consulta"""
+        with self.assertNumQueries(1):
+            precios = resolver_precios_dia(Vehiculo.objects.all(), self.hoy)
+
+        self.assertEqual(
+            precios,
+            {self.con_oferta.id: Decimal("25.00"), self.sin_oferta.id: Decimal("40.00")},
+        )
+
+    def test_precios_periodo_agrupados(self):
+        """precios_periodo coincide con precio_periodo en una sola consulta"""
+        ids = [self.con_oferta.id, self.sin_oferta.id]
+        recogida = timezone.now().replace(microsecond=0)
+        devolucion = recogida + timedelta(days=4)
+        reconstruir_calendario(ids)
+        with self.assertNumQueries(1):
+            periodos = precios_periodo(ids, recogida, devolucion)
+
+        for vehiculo_id in ids:
+            self.assertEqual(periodos[vehiculo_id], precio_periodo(vehiculo_id, recogida, devolucion))
+
+    def test_anotacion_coincide_con_modelo(self):
+        """La anotación en BD coincide con la regla del modelo, también fuera de la oferta"""
+        for fecha in (self.hoy, self.hoy + timedelta(days=5)):
+            anotados = anotar_precio_dia(Vehiculo.objects.all(), fecha)
+            for vehiculo in anotados:
+                self.assertEqual(
+                    vehiculo.precio_dia_vigente,
+                    Vehiculo.objects.get(pk=vehiculo.pk).get_precio_para_fechas(fecha),
+                )
+
+    def test_filtro_precio_sobre_tarifa_vigente(self):
+        """precio_min/precio_max solo miran la tarifa vigente y no duplican vehículos"""
+        TarifaVehiculo.objects.create(
+            vehiculo=self.sin_oferta,
+            fecha_inicio=self.hoy - timedelta(days=60),
+            fecha_fin=self.hoy - timedelta(days=31),
+            precio_dia=Decimal("20.00"),
+        )
+        TarifaVehiculo.objects.create(
+            vehiculo=self.sin_oferta,
+            fecha_inicio=self.hoy + timedelta(days=10),
+            fecha_fin=self.hoy + timedelta(days=20),
+            precio_dia=Decimal("22.00"),
+        )
+
+        def filtrar(**params):
+            filtro = VehiculoFilter(params, queryset=Vehiculo.objects.all())
+            return sorted(filtro.qs.values_list("id", flat=True))
+
+        self.assertEqual(filtrar(precio_max="30"), [self.con_oferta.id])
+        self.assertEqual(filtrar(precio_min="30"), [self.sin_oferta.id])
+        self.assertEqual(filtrar(precio_min="10", precio_max="50"), [self.con_oferta.id, self.sin_oferta.id])
+
+
+class CalendarioTarifasTest(FlotaTestMixin, TestCase):
+    """Tests para el calendario materializado de precios"""
+
+    def setUp(self):
+        self.crear_datos_base()
+        self.hoy = timezone.now().date()
+        self.vehiculo = self.crear_vehiculo("6666FFF")
+        # Período con tarifa especial en mitad del alquiler
+        with self.captureOnCommitCallbacks(execute=True):
+            TarifaVehiculo.objects.create(
+                vehiculo=self.vehiculo,
+                fecha_inicio=self.hoy + timedelta(days=10),
+                fecha_fin=self.hoy + timedelta(days=11),
+                precio_dia=Decimal("25.00"),
+            )
+        self.recogida = timezone.now() + timedelta(days=9)
+        self.devolucion = self.recogida + timedelta(days=4)
+
+    def test_alquiler_que_cruza_tarifas(self):
+        """Cada día se cobra con su tarifa, en una única consulta al calendario"""
+        with self.assertNumQueries(1):
+            periodo = precio_periodo(self.vehiculo.id, self.recogida, self.devolucion)
+
+        self.assertEqual(periodo.dias, 4)
+        self.assertEqual(periodo.total, Decimal("130.00"))
+        self.assertEqual(periodo.precio_primer_dia, Decimal("40.00"))
+        self.assertEqual(periodo.dias_sin_tarifa, 0)
+
+    def test_fallback_sin_calendario(self):
+        """Sin calendario el precio se calcula desde las tarifas con el mismo resultado"""
+        PrecioDiarioVehiculo.objects.all().delete()
+
+        periodo = precio_periodo(self.vehiculo.id, self.recogida, self.devolucion)
+
+        self.assertEqual(periodo.total, Decimal("130.00"))
+
+    def test_extras_con_id_como_texto(self):
+        """Los IDs de extras recibidos como texto se cobran igual que los numéricos"""
+        extra = Extras.objects.create(nombre="GPS", precio=Decimal("5.00"))
+
+        resultado = calcular_precio_alquiler(
+            self.vehiculo.id, self.recogida, self.devolucion, extras=[str(extra.id)]
+        )
+
+        self.assertEqual(resultado["precios"]["precio_extras"], 20.0)
+        self.assertEqual([detalle["id"] for detalle in resultado["extras"]], [extra.id])
+
+    def test_cambio_de_tarifa_regenera_calendario(self):
+        """Modificar una tarifa actualiza el calendario al confirmar la transacción"""
+        tarifa = self.vehiculo.tarifas.get(fecha_fin__isnull=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            tarifa.precio_dia = Decimal("50.00")
+            tarifa.save()
+
+        periodo = precio_periodo(self.vehiculo.id, self.recogida, self.devolucion)
+        self.assertEqual(periodo.total, Decimal("150.00"))
+        self.assertEqual(
+            reconstruir_calendario([self.vehiculo.id], dias=30),
+            PrecioDiarioVehiculo.objects.filter(vehiculo=self.vehiculo).count(),
+        )
+
+
+class CacheDisponibilidadTest(FlotaTestMixin, TestCase):
+    """Tests para la caché de búsquedas de disponibilidad"""
+
+    url = "/api/vehiculos/disponibilidad/"
+
+    def setUp(self):
+        cache.clear()
+        self.crear_datos_base()
+        self.vehiculo = self.crear_vehiculo("7777GGG")
+        indice_disponibilidad.cargar()
+        self.inicio = timezone.now().replace(microsecond=0) + timedelta(days=20)
+        self.fin = self.inicio + timedelta(days=3)
+
+    def buscar(self, inicio=None, fin=None):
+        return self.client.get(
+            self.url,
+            {
+                "fecha_recogida": (inicio or self.inicio).isoformat(),
+                "fecha_devolucion": (fin or self.fin).isoformat(),
+            },
+        )
+
+    def test_segunda_busqueda_desde_cache(self):
+        """La misma búsqueda se sirve desde caché con idéntico contenido"""
+        primera = self.buscar()
+        segunda = self.buscar()
+
+        self.assertEqual(primera["X-Disponibilidad-Cache"], "MISS")
+        self.assertEqual(segunda["X-Disponibilidad-Cache"], "HIT")
+        self.assertEqual(primera.json(), segunda.json())
+        self.assertEqual(segunda.json()["count"], 1)
+
+    def test_reserva_invalida_solo_ventanas_solapadas(self):
+        """Una reserva invalida las búsquedas que solapa y conserva las demás"""
+        otra_inicio = self.inicio + timedelta(days=30)
+        otra_fin = otra_inicio + timedelta(days=2)
+        self.buscar()
+        self.buscar(otra_inicio, otra_fin)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crear_reserva(self.vehiculo, self.inicio, self.fin)
+
+        afectada = self.buscar()
+        self.assertEqual(afectada["X-Disponibilidad-Cache"], "MISS")
+        self.assertEqual(afectada.json()["count"], 0)
+        self.assertEqual(
+            self.buscar(otra_inicio, otra_fin)["X-Disponibilidad-Cache"], "HIT"
+        )
+
+    def test_mover_reserva_invalida_ventana_anterior_sin_consultarla(self):
+        """Al mover una reserva se invalidan ambas ventanas sin releer la anterior de la BD"""
+        with self.captureOnCommitCallbacks(execute=True):
+            reserva = self.crear_reserva(self.vehiculo, self.inicio, self.fin)
+        self.assertEqual(self.buscar().json()["count"], 0)
+
+        reserva = Reserva.objects.get(pk=reserva.pk)
+        reserva.fecha_recogida += timedelta(days=30)
+        reserva.fecha_devolucion += timedelta(days=30)
+        with CaptureQueriesContext(connection) as consultas:
+            with self.captureOnCommitCallbacks(execute=True):
+                reserva.save()
+
+        ventana_previa = 'SELECT "reserva"."fecha_recogida", "reserva"."fecha_devolucion" FROM'
+        self.assertFalse(
+            [c["sql"] for c in consultas.captured_queries if c["sql"].startswith(ventana_previa)]
+        )
+        respuesta = self.buscar()
+        self.assertEqual(respuesta["X-Disponibilidad-Cache"], "MISS")
+        self.assertEqual(respuesta.json()["count"], 1)
+
+    def test_devolucion_invalida_busquedas_por_lugar_posteriores(self):
+        """Devolver en otro lugar invalida las búsquedas por lugar de ventanas posteriores"""
+        centro = Lugar.objects.create(
+            nombre="Centro",
+            direccion=Direccion.objects.create(calle="Calle Larios", ciudad="Málaga", pais="España"),
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vehiculo.lugar_actual = self.lugar
+            self.vehiculo.save()
+        despues = self.fin + timedelta(days=10)
+
+        def buscar_en_lugar():
+            return self.client.get(
+                self.url,
+                {
+                    "fecha_recogida": despues.isoformat(),
+                    "fecha_devolucion": (despues + timedelta(days=1)).isoformat(),
+                    "lugar_recogida_id": str(self.lugar.id),
+                },
+            )
+
+        self.assertEqual(buscar_en_lugar().json()["count"], 1)
+        self.buscar(despues, despues + timedelta(days=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            reserva = self.crear_reserva(self.vehiculo, self.inicio, self.fin)
+            reserva.lugar_devolucion = centro
+            reserva.save()
+
+        respuesta = buscar_en_lugar()
+        self.assertEqual(respuesta["X-Disponibilidad-Cache"], "MISS")
+        self.assertEqual(respuesta.json()["count"], 0)
+        self.assertEqual(
+            self.buscar(despues, despues + timedelta(days=1))["X-Disponibilidad-Cache"], "HIT"
+        )
+
+    def test_cambio_de_vehiculo_invalida_todo(self):
+        """Modificar un vehículo invalida todas las búsquedas"""
+        self.buscar()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vehiculo.color = "Rojo"
+            self.vehiculo.save()
+
+        self.assertEqual(self.buscar()["X-Disponibilidad-Cache"], "MISS")
+
+
+class MatrizDisponibilidadTest(FlotaTestMixin, TestCase):
+    """Tests para la matriz de ocupación de la flota"""
+
+    def setUp(self):
+        self.crear_datos_base()
+        self.hoy = timezone.localdate()
+        self.libre = self.crear_vehiculo("8888HHH")
+        self.ocupado = self.crear_vehiculo("9999JJJ")
+        recogida = timezone.make_aware(
+            datetime.combine(self.hoy + timedelta(days=5), time(10, 0))
+        )
+        self.crear_reserva(self.ocupado, recogida, recogida + timedelta(days=3))
+
+    def dias_ocupados(self, matriz, fila):
+        datos = base64.b64decode(matriz["matriz"])
+        ancho = matriz["bytes_por_fila"]
+        bits = int.from_bytes(datos[fila * ancho:(fila + 1) * ancho], "big")
+        total = ancho * 8
+        return [d for d in range(matriz["dias"]) if bits >> (total - 1 - d) & 1]
+
+    def test_matriz_pinta_reservas(self):
+        """Cada reserva marca los días que toca, con una fila por vehículo"""
+        matriz = calcular_matriz_disponibilidad(self.hoy, self.hoy + timedelta(days=89))
+
+        self.assertEqual(matriz["vehiculos"], [self.libre.id, self.ocupado.id])
+        self.assertEqual(matriz["bytes_por_fila"], 12)
+        self.assertEqual(self.dias_ocupados(matriz, 0), [])
+        self.assertEqual(self.dias_ocupados(matriz, 1), [5, 6, 7, 8])
+
+    def test_endpoint_matriz(self):
+        """El endpoint valida las fechas y devuelve la matriz empaquetada"""
+        url = "/api/vehiculos/disponibilidad/matriz/"
+        self.assertEqual(self.client.get(url).status_code, 400)
+
+        respuesta = self.client.get(
+            url,
+            {
+                "fecha_inicio": (self.hoy + timedelta(days=6)).isoformat(),
+                "fecha_fin": (self.hoy + timedelta(days=15)).isoformat(),
+                "categoria_id": self.categoria.id,
+            },
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(self.dias_ocupados(respuesta.json(), 1), [0, 1, 2])
+
+
+class DisponibilidadPorLugarTest(FlotaTestMixin, TestCase):
+    """Tests para la búsqueda de disponibilidad por sede"""
+
+    def setUp(self):
+        self.crear_datos_base()
+        direccion = Direccion.objects.create(
+            calle="Calle Larios", ciudad="Málaga", pais="España", codigo_postal="29005"
+        )
+        self.centro = Lugar.objects.create(nombre="Centro", direccion=direccion)
+        self.en_aeropuerto = self.crear_vehiculo("1212KKK", lugar_actual=self.lugar)
+        self.en_centro = self.crear_vehiculo("3434LLL", lugar_actual=self.centro)
+        self.sin_ubicacion = self.crear_vehiculo("5656MMM")
+
+        # Una reserva que se recoge en el aeropuerto y se devuelve en el centro
+        self.ida = timezone.now() + timedelta(days=2)
+        reserva = self.crear_reserva(self.en_aeropuerto, self.ida, self.ida + timedelta(days=2))
+        reserva.lugar_devolucion = self.centro
+        reserva.save()
+        indice_disponibilidad.cargar()
+        self.despues = self.ida + timedelta(days=5)
+
+    def buscar(self, lugar, inicio):
+        return set(
+            buscar_vehiculos_disponibles(
+                inicio, inicio + timedelta(days=1), lugar_id=lugar.id
+            ).values_list("id", flat=True)
+        )
+
+    def test_ubicacion_segun_ultima_devolucion(self):
+        """El vehículo está en el lugar de devolución de su última reserva"""
+        self.assertEqual(
+            self.buscar(self.lugar, timezone.now()),
+            {self.en_aeropuerto.id, self.sin_ubicacion.id},
+        )
+        self.assertEqual(
+            self.buscar(self.centro, self.despues),
+            {self.en_aeropuerto.id, self.en_centro.id, self.sin_ubicacion.id},
+        )
+        self.assertEqual(self.buscar(self.lugar, self.despues), {self.sin_ubicacion.id})
+
+    def test_sql_coincide_con_indice(self):
+        """La consulta SQL de respaldo aplica la misma regla de ubicación"""
+        from .services import _buscar_vehiculos_disponibles_bd
+
+        for lugar in (self.lugar, self.centro):
+            for inicio in (timezone.now(), self.despues):
+                en_bd = set(
+                    _buscar_vehiculos_disponibles_bd(
+                        inicio, inicio + timedelta(days=1), lugar_id=lugar.id
+                    ).values_list("id", flat=True)
+                )
+                self.assertEqual(en_bd, self.buscar(lugar, inicio))
+
+    def test_reserva_terminada_fija_ubicacion_actual(self):
+        """Sin reservas pendientes, el vehículo está donde se devolvió la última"""
+        hace_una_semana = timezone.now() - timedelta(days=7)
+        Reserva.objects.filter(vehiculo=self.en_aeropuerto).update(
+            fecha_recogida=hace_una_semana,
+            fecha_devolucion=hace_una_semana + timedelta(days=2),
+        )
+        indice_disponibilidad.cargar()
+
+        self.assertEqual(
+            self.buscar(self.centro, timezone.now()),
+            {self.en_aeropuerto.id, self.en_centro.id, self.sin_ubicacion.id},
+        )
+        informe = indice_disponibilidad.informe()
+        self.assertEqual(informe["huella"], huella_bd(informe["ahora"]))
+
+
+class PaginacionKeysetTest(FlotaTestMixin, TestCase):
+    """Tests para la paginación por clave del listado de vehículos"""
+
+    url = "/api/vehiculos/vehiculos/"
+
+    def setUp(self):
+        self.crear_datos_base()
+        self.precios = {}
+        for n, precio in enumerate(["30.00", "55.00", "30.00", "80.00", "45.00"]):
+            vehiculo = self.crear_vehiculo(f"00{n}0NNN", marca=f"Marca{n}")
+            vehiculo.tarifas.update(precio_dia=Decimal(precio))
+            self.precios[vehiculo.id] = Decimal(precio)
+
+    def recorrer(self, orden):
+        ids, cursor, paginas = [], None, 0
+        while True:
+            params = {"orden": orden, "page_size": 2}
+            if cursor:
+                params["cursor"] = cursor
+            datos = self.client.get(self.url, params).json()
+            ids.extend(vehiculo["id"] for vehiculo in datos["results"])
+            paginas += 1
+            cursor = datos["next_cursor"]
+            if not cursor:
+                return ids, paginas, datos
+
+    def test_recorrido_por_precio(self):
+        """Las páginas siguen el orden por precio sin repetir ni saltar vehículos"""
+        ids, paginas, _ = self.recorrer("Precio ascendente")
+
+        esperado = sorted(self.precios, key=lambda vid: (self.precios[vid], vid))
+        self.assertEqual(ids, esperado)
+        self.assertEqual(paginas, 3)
+
+    def test_pagina_anterior(self):
+        """El cursor anterior devuelve la página previa"""
+        primera = self.client.get(self.url, {"orden": "marca_desc", "page_size": 2}).json()
+        segunda = self.client.get(
+            self.url, {"orden": "marca_desc", "page_size": 2, "cursor": primera["next_cursor"]}
+        ).json()
+        vuelta = self.client.get(
+            self.url,
+            {"orden": "marca_desc", "page_size": 2, "cursor": segunda["previous_cursor"]},
+        ).json()
+
+        self.assertEqual(primera["count"], 5)
+        self.assertEqual(
+            [v["id"] for v in vuelta["results"]], [v["id"] for v in primera["results"]]
+        )
+
+    def test_orden_invalido(self):
+        """Un orden desconocido es un error de validación"""
+        self.assertEqual(self.client.get(self.url, {"orden": "color"}).status_code, 400)
+
+
+class FacetasTest(FlotaTestMixin, TestCase):
+    """Tests para las facetas con conteos de listados y búsquedas"""
+
+    url = "/api/vehiculos/vehiculos/"
+
+    def setUp(self):
+        cache.clear()
+        self.crear_datos_base()
+        self.crear_vehiculo("0001FFF", marca="Seat", modelo="Ibiza")
+        self.crear_vehiculo("0002FFF", marca="Seat", modelo="León", combustible="Diésel")
+        self.crear_vehiculo("0003FFF", marca="Fiat", modelo="500")
+
+    def test_facetas_con_conteos_en_una_consulta(self):
+        """Valores y conteos por campo salen de un único agregado agrupado"""
+        with self.assertNumQueries(1):
+            facetas = calcular_facetas(Vehiculo.objects.all())
+
+        self.assertEqual(facetas["marca"], ["Fiat", "Seat"])
+        self.assertEqual(facetas["conteos"]["marca"], {"Fiat": 1, "Seat": 2})
+        self.assertEqual(facetas["conteos"]["combustible"], {"Diésel": 1, "Gasolina": 2})
+
+    def test_facetas_del_listado_cacheadas_e_invalidadas(self):
+        """Las facetas se reutilizan entre peticiones hasta que cambia la flota"""
+        primera = self.client.get(self.url, {"page_size": 1}).json()
+        self.assertEqual(primera["filterOptions"]["conteos"]["marca"], {"Fiat": 1, "Seat": 2})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crear_vehiculo("0004FFF", marca="Fiat", modelo="Panda")
+
+        segunda = self.client.get(self.url, {"page_size": 2}).json()
+        self.assertEqual(segunda["filterOptions"]["conteos"]["marca"], {"Fiat": 2, "Seat": 2})
+
+
+class ImagenPortadaTest(FlotaTestMixin, TestCase):
+    """Tests para la portada precargada en los serializers"""
+
+    def setUp(self):
+        self.crear_datos_base()
+        self.vehiculos = [self.crear_vehiculo(f"000{n}PPP") for n in range(3)]
+        ImagenVehiculo.objects.bulk_create(
+            [
+                ImagenVehiculo(vehiculo=vehiculo, imagen=f"vehiculos/{vehiculo.id}_{n}.jpg", portada=n == 1)
+                for vehiculo in self.vehiculos
+                for n in range(2)
+            ]
+        )
+
+    def test_serializar_disponibles_sin_consultas_por_fila(self):
+        """Serializar un resultado de búsqueda no consulta imágenes vehículo a vehículo"""
+        inicio = timezone.now() + timedelta(days=5)
+        vehiculos = list(buscar_vehiculos_disponibles(inicio, inicio + timedelta(days=2)))
+
+        with self.assertNumQueries(0):
+            datos = VehiculoDisponibleSerializer(vehiculos, many=True).data
+
+        for vehiculo in datos:
+            self.assertEqual(vehiculo["imagen_principal"], f"/media/vehiculos/{vehiculo['id']}_1.jpg")
+
+    def test_portada_reutiliza_imagenes_precargadas(self):
+        """La portada sale de la misma precarga de imágenes: vehículos, imágenes y tarifas"""
+        with self.assertNumQueries(3):
+            vehiculos = list(VehiculoViewSet.queryset.all())
+
+        with self.assertNumQueries(0):
+            datos = VehiculoDetailSerializer(vehiculos, many=True).data
+
+        for vehiculo in datos:
+            self.assertEqual(len(vehiculo["imagenes"]), 2)
+            self.assertEqual(vehiculo["imagen_principal"], f"/media/vehiculos/{vehiculo['id']}_1.jpg")
+
+    def test_portada_sin_precarga(self):
+        """Sin precarga, la portada se obtiene con una consulta"""
+        vehiculo = Vehiculo.objects.get(id=self.vehiculos[0].id)
+        with self.assertNumQueries(1):
+            self.assertEqual(vehiculo.imagen_portada.imagen.name, f"vehiculos/{vehiculo.id}_1.jpg")
+
+
+class VariantesImagenTest(FlotaTestMixin, TestCase):
+    """Tests para las variantes redimensionadas de las imágenes"""
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        ajustes = override_settings(MEDIA_ROOT=self.media, IMAGENES_VARIANTES_ASINCRONAS=False)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        self.crear_datos_base()
+        self.vehiculo = self.crear_vehiculo("0001IMG")
+
+    def subir_imagen(self, ancho=2000, alto=1000):
+        buffer = BytesIO()
+        Image.new("RGB", (ancho, alto), "red").save(buffer, format="JPEG")
+        with self.captureOnCommitCallbacks(execute=True):
+            return ImagenVehiculo.objects.create(
+                vehiculo=self.vehiculo,
+                portada=True,
+                imagen=SimpleUploadedFile("coche.jpg", buffer.getvalue(), content_type="image/jpeg"),
+            )
+
+    def test_variantes_generadas_al_subir(self):
+        """Al subir una imagen se generan las variantes WebP con claves deterministas"""
+        imagen = self.subir_imagen()
+        imagen.refresh_from_db()
+
+        self.assertEqual(imagen.variantes["origen"], imagen.imagen.name)
+        self.assertEqual(imagen.variantes["thumbnail"]["ancho"], 320)
+        self.assertEqual(imagen.variantes["hero"]["alto"], 640)
+        self.assertEqual(
+            imagen.variantes["card"]["webp"], ruta_variante(imagen.imagen.name, "card", "webp")
+        )
+        self.assertTrue(os.path.exists(os.path.join(self.media, imagen.variantes["card"]["webp"])))
+
+        srcset = ImagenVehiculoSerializer(imagen).data["srcset"]["webp"]
+        self.assertIn(" 320w", srcset)
+        self.assertIn(" 1280w", srcset)
+
+    def test_variantes_no_amplian_el_original(self):
+        """Una imagen pequeña no se amplía en las variantes grandes"""
+        imagen = self.subir_imagen(ancho=400, alto=300)
+        imagen.refresh_from_db()
+
+        self.assertEqual(imagen.variantes["thumbnail"]["ancho"], 320)
+        self.assertEqual(imagen.variantes["hero"]["ancho"], 400)
+
+    def test_dimensiones_en_el_insert(self):
+        """Las dimensiones salen de la cabecera de la subida y se guardan en el INSERT"""
+        buffer = BytesIO()
+        Image.new("RGB", (1200, 800), "blue").save(buffer, format="PNG")
+        imagen = ImagenVehiculo(
+            vehiculo=self.vehiculo,
+            imagen=SimpleUploadedFile("lateral.png", buffer.getvalue(), content_type="image/png"),
+        )
+
+        with self.assertNumQueries(1):
+            imagen.save()
+
+        self.assertEqual(
+            ImagenVehiculo.objects.filter(id=imagen.id).values_list("ancho", "alto").get(),
+            (1200, 800),
+        )
+
+    def test_comando_backfill(self):
+        """El comando genera las variantes de imágenes que no las tienen"""
+        imagen = self.subir_imagen()
+        ImagenVehiculo.objects.filter(id=imagen.id).update(variantes={})
+
+        salida = StringIO()
+        call_command("generar_variantes_imagenes", stdout=salida)
+
+        imagen.refresh_from_db()
+        self.assertIn("card", imagen.variantes)
+        self.assertIn("Variantes generadas: 1", salida.getvalue())
+
+
+class VentanasAlternativasTest(FlotaTestMixin, TestCase):
+    """Tests para las ventanas libres alternativas de búsquedas sin resultados"""
+
+    def setUp(self):
+        self.ahora = datetime(2026, 1, 1, 8, 0, tzinfo=dt_timezone.utc)
+        self.ocupado = IntervalosVehiculo()
+        self.ocupado.agregar(
+            1,
+            datetime(2026, 1, 10, 10, 0, tzinfo=dt_timezone.utc),
+            datetime(2026, 1, 14, 10, 0, tzinfo=dt_timezone.utc),
+        )
+        self.fichas = {
+            1: FichaVehiculo(categoria_id=1, grupo_id=1, activo=True, disponible=True),
+            2: FichaVehiculo(categoria_id=2, grupo_id=1, activo=True, disponible=True),
+        }
+        self.inicio = datetime(2026, 1, 12, 10, 0, tzinfo=dt_timezone.utc)
+
+    def sugerir(self, **criterios):
+        return sugerir_ventanas(
+            {1: self.ocupado},
+            self.fichas,
+            self.inicio,
+            self.inicio + timedelta(days=1),
+            ahora=self.ahora,
+            **criterios,
+        )
+
+    def test_ventanas_mas_cercanas_de_la_misma_duracion(self):
+        """Se proponen los huecos más próximos a ambos lados de la ventana pedida"""
+        fechas = self.sugerir(categoria_id=1)["fechas"]
+
+        self.assertEqual(
+            [(v["fecha_inicio"].day, v["fecha_fin"].day) for v in fechas], [(14, 15), (9, 10)]
+        )
+        self.assertEqual(fechas[0]["diferencia_horas"], 48.0)
+        self.assertEqual(fechas[1]["diferencia_horas"], -72.0)
+
+    def test_alternativa_en_categoria_vecina(self):
+        """Otra categoría libre en las mismas fechas aparece como alternativa"""
+        alternativas = self.sugerir(categoria_id=1)["alternativas"]
+
+        self.assertEqual(len(alternativas), 1)
+        self.assertEqual(alternativas[0]["categoria_id"], 2)
+        self.assertEqual(alternativas[0]["fecha_inicio"], self.inicio)
+        self.assertEqual(alternativas[0]["vehiculos"], [2])
+
+    def test_lugar_como_texto_de_la_peticion(self):
+        """El lugar llega como texto desde la vista y filtra igual que un entero"""
+        self.fichas[1] = self.fichas[1]._replace(lugar_id=1)
+        self.fichas[2] = self.fichas[2]._replace(lugar_id=2)
+
+        fechas = self.sugerir(lugar_id="1")["fechas"]
+        self.assertEqual(fechas, self.sugerir(lugar_id=1)["fechas"])
+        self.assertTrue(fechas)
+        self.assertTrue(all(v["vehiculos"] == [1] for v in fechas))
+
+    def test_respuesta_sin_resultados_incluye_sugerencias(self):
+        """La búsqueda vacía devuelve las ventanas libres más cercanas"""
+        cache.clear()
+        self.crear_datos_base()
+        vehiculo = self.crear_vehiculo("0001SUG")
+        inicio = timezone.now().replace(minute=0, second=0, microsecond=0) + timedelta(days=5)
+        self.crear_reserva(vehiculo, inicio - timedelta(days=2), inicio + timedelta(days=2))
+        indice_disponibilidad.cargar()
+
+        datos = self.client.get(
+            "/api/vehiculos/disponibilidad/",
+            {"fecha_inicio": inicio.isoformat(), "fecha_fin": (inicio + timedelta(days=1)).isoformat()},
+        ).json()
+
+        self.assertTrue(datos["isEmpty"])
+        primera = datos["sugerencias"]["fechas"][0]
+        self.assertEqual(primera["num_vehiculos"], 1)
+        self.assertEqual(primera["categoria"], "Coches")
+        self.assertEqual(primera["diferencia_horas"], 48.0)
+
+
+class UtilizacionFlotaTest(FlotaTestMixin, TestCase):
+    """Tests para la analítica de utilización de la flota"""
+
+    def setUp(self):
+        cache.clear()
+        self.crear_datos_base()
+        self.hoy = timezone.localdate()
+        self.desde = self.hoy - timedelta(days=9)
+        self.alquilado = self.crear_vehiculo("0001UUU")
+        self.parado = self.crear_vehiculo("0002UUU")
+
+        # Días 2, 3 y 4 del rango (la devolución a las 00:00 no ocupa el día 5)
+        reserva = self.crear_reserva(
+            self.alquilado, timezone.now() + timedelta(days=1), timezone.now() + timedelta(days=4)
+        )
+        Reserva.objects.filter(id=reserva.id).update(
+            fecha_recogida=self.en_dia(2, hora=10),
+            fecha_devolucion=self.en_dia(5),
+            precio_total=Decimal("120.00"),
+        )
+        Mantenimiento.objects.create(
+            vehiculo=self.alquilado, fecha=self.en_dia(7, hora=9), tipo_servicio="ITV", coste=Decimal("50.00")
+        )
+
+    def en_dia(self, dia, hora=0):
+        return timezone.make_aware(datetime.combine(self.desde + timedelta(days=dia), time(hora)))
+
+    def test_metricas_por_vehiculo_y_categoria(self):
+        """Ocupación, huecos e ingresos salen de las máscaras de días"""
+        resultado = calcular_utilizacion(self.desde, self.hoy)
+        fila = next(v for v in resultado["vehiculos"] if v["vehiculo_id"] == self.alquilado.id)
+
+        self.assertEqual(fila["dias_ocupados"], 3)
+        self.assertEqual(fila["dias_disponibles"], 9)
+        self.assertEqual(fila["ocupacion"], 30.0)
+        self.assertEqual(fila["utilizacion"], 33.3)
+        self.assertEqual((fila["huecos"], fila["hueco_mas_largo"]), (3, 2))
+        self.assertEqual(fila["ingresos"], Decimal("120.00"))
+        self.assertEqual(fila["ingreso_por_dia_disponible"], Decimal("13.33"))
+
+        categoria = resultado["categorias"][0]
+        self.assertEqual((categoria["vehiculos"], categoria["dias_ocupados"]), (2, 3))
+        self.assertEqual(categoria["ocupacion"], 15.0)
+
+    def test_ingreso_prorrateado_al_rango(self):
+        """Solo cuenta la parte del importe de los días dentro del rango"""
+        resultado = calcular_utilizacion(self.desde + timedelta(days=3), self.hoy)
+        fila = next(v for v in resultado["vehiculos"] if v["vehiculo_id"] == self.alquilado.id)
+
+        self.assertEqual(fila["dias_ocupados"], 2)
+        self.assertEqual(fila["ingresos"], Decimal("80.00"))
+
+    def test_dias_ocupados_en_toda_la_historia(self):
+        """Los días ocupados del vehículo abarcan todas sus reservas confirmadas"""
+        anterior = self.crear_reserva(
+            self.alquilado, timezone.now() + timedelta(days=10), timezone.now() + timedelta(days=12)
+        )
+        Reserva.objects.filter(id=anterior.id).update(
+            fecha_recogida=self.en_dia(-400, hora=10), fecha_devolucion=self.en_dia(-398, hora=10)
+        )
+
+        with self.assertNumQueries(1):
+            self.assertEqual(dias_ocupados_vehiculo(self.alquilado.id), 6)
+        self.assertEqual(dias_ocupados_vehiculo(self.parado.id), 0)
+
+    def test_endpoint_solo_staff(self):
+        """El endpoint JSON exige usuario staff"""
+        url = "/api/vehiculos/analitica/utilizacion/"
+        params = {"fecha_inicio": self.desde.isoformat(), "fecha_fin": self.hoy.isoformat()}
+        self.assertIn(self.client.get(url, params).status_code, (401, 403))
+
+        self.client.force_login(
+            Usuario.objects.create(username="gestor", email="gestor@test.com", is_staff=True)
+        )
+        datos = self.client.get(url, params).json()
+        self.assertTrue(datos["success"])
+        self.assertEqual(datos["flota"]["dias_ocupados"], 3)
+
+
+class AutocompletadoTest(FlotaTestMixin, TestCase):
+    """Tests para el autocompletado de marca y modelo"""
+
+    def setUp(self):
+        self.catalogo = CatalogoMarcasModelos(
+            [("Seat", "Ibiza", 4), ("Seat", "León", 2), ("Citroën", "Berlingo", 7), ("Fiat", "Ibis", 1)]
+        )
+
+    def textos(self, termino):
+        return [sugerencia["texto"] for sugerencia in self.catalogo.sugerir(termino)]
+
+    def test_prefijo_de_marca_antes_que_de_modelo(self):
+        """El texto que empieza por el término va primero; luego, por número de vehículos"""
+        self.assertEqual(self.textos("seat"), ["Seat Ibiza", "Seat León"])
+        self.assertEqual(self.textos("ibi"), ["Seat Ibiza", "Fiat Ibis"])
+
+    def test_acentos_y_erratas(self):
+        """Se ignoran acentos y se toleran erratas por similitud de trigramas"""
+        self.assertEqual(self.textos("citroen"), ["Citroën Berlingo"])
+        self.assertEqual(self.textos("leon"), ["Seat León"])
+        self.assertIn("Citroën Berlingo", self.textos("berlngo"))
+
+    def test_catalogo_grande_sin_recorrido_completo(self):
+        """Con 10.000 combinaciones solo se leen las candidatas (bisección e índice invertido)"""
+        catalogo = CatalogoMarcasModelos(
+            [(f"Marca{n % 200}", f"Modelo{n}", n % 7 + 1) for n in range(10000)]
+            + [("Citroën", "Berlingo", 7)]
+        )
+
+        class EntradasLeidas(list):
+            """Registra las posiciones leídas y prohíbe recorrer la lista entera"""
+
+            def __init__(self, entradas):
+                super().__init__(entradas)
+                self.leidas = set()
+
+            def __getitem__(self, posicion):
+                self.leidas.add(posicion)
+                return super().__getitem__(posicion)
+
+            def __iter__(self):
+                raise AssertionError("sugerir() no debe recorrer todo el catálogo")
+
+        catalogo.entradas = EntradasLeidas(catalogo.entradas)
+
+        # Prefijo: Modelo999 y Modelo9990..9999
+        self.assertEqual(len(catalogo.sugerir("modelo999")), 10)
+        self.assertEqual(len(catalogo.entradas.leidas), 11)
+
+        # Errata: solo las entradas que comparten algún trigrama con el término
+        catalogo.entradas.leidas.clear()
+        self.assertEqual(catalogo.sugerir("berlngo")[0]["texto"], "Citroën Berlingo")
+        self.assertEqual(catalogo.entradas.leidas, {10000})
+
+    def test_endpoint_refleja_cambios_de_flota(self):
+        """El catálogo se recarga cuando cambia la flota"""
+        cache.clear()
+        self.crear_datos_base()
+        url = "/api/vehiculos/vehiculos/autocompletar/"
+        self.crear_vehiculo("0001AAC", marca="Dacia", modelo="Sandero")
+        self.assertEqual(self.client.get(url, {"q": "dac"}).json()["count"], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.crear_vehiculo("0002AAC", marca="Dacia", modelo="Duster")
+
+        datos = self.client.get(url, {"q": "dac"}).json()
+        self.assertEqual([s["texto"] for s in datos["results"]], ["Dacia Duster", "Dacia Sandero"])
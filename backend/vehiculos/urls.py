@@ -15,5 +15,7 @@ urlpatterns = [
     path("", include(router.urls)),
     # URLs específicas migradas desde api/urls.py
     path("disponibilidad/", VehiculoViewSet.as_view({"get": "disponibilidad", "post": "disponibilidad"}), name="disponibilidad"),
+    path("disponibilidad/matriz/", VehiculoViewSet.as_view({"get": "matriz_disponibilidad"}), name="matriz-disponibilidad"),
+    path("analitica/utilizacion/", VehiculoViewSet.as_view({"get": "utilizacion"}), name="utilizacion"),
     path("vehiculos/search/", VehiculoViewSet.as_view({"get": "disponibilidad", "post": "disponibilidad"}), name="search"),
 ]
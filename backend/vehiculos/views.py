@@ -1,28 +1,40 @@
 # vehiculos/views.py
 import json
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 from typing import Any, Optional
 
-from django.db.models import Prefetch, Q
+from django.db.models import Prefetch, Q, QuerySet
 from django.http import Http404
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
 from rest_framework.request import Request
 from rest_framework.response import Response
+from utils.cache_referencia import cache_referencia
 
+from . import cache_disponibilidad
+from .analitica import utilizacion_cacheada
+from .busqueda import LIMITE_POR_DEFECTO, autocompletar
+from .facetas import calcular_facetas, facetas_cacheadas
 from .filters import VehiculoFilter
 from .models import Categoria, GrupoCoche, Vehiculo
-from .pagination import StandardResultsSetPagination
+from .pagination import KeysetPagination
 from .permissions import IsAdminOrReadOnly, PublicAccessPermission
 from .serializers import (CategoriaSerializer, GrupoCocheSerializer,
                           VehiculoDetailSerializer,
                           VehiculoDisponibleSerializer, VehiculoListSerializer)
-from .services import (buscar_vehiculos_disponibles, calcular_precio_alquiler,
+from .services import (buscar_vehiculos_disponibles,
+                       calcular_matriz_disponibilidad, calcular_precio_alquiler,
+                       sugerir_ventanas_alternativas,
                        verificar_disponibilidad_vehiculo)
+from .tarifas import ANOTACION_PRECIO, anotar_precio_dia
 
 logger = logging.getLogger(__name__)
 
@@ -33,13 +45,16 @@ class CategoriaViewSet(viewsets.ModelViewSet):
     queryset = Categoria.objects.all()
     serializer_class = CategoriaSerializer
     permission_classes = [PublicAccessPermission]  # Acceso público para consultas
+    modelos_referencia = ("vehiculos.Categoria",)
 
+    @cache_referencia
     def list(self, request: Request, *args: Any, **kwargs: Any) -> Response:
         """Listado de categorías con manejo de errores"""
         try:
-            queryset = self.get_queryset().order_by("nombre")
+            # Una sola consulta: la lista sirve para el conteo y la serialización
+            categorias = list(self.get_queryset().order_by("nombre"))
 
-            if not queryset.exists():
+            if not categorias:
                 logger.warning("No se encontraron categorías de vehículos")
                 return Response(
                     {
@@ -51,12 +66,12 @@ class CategoriaViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_200_OK,
                 )
 
-            serializer = self.get_serializer(queryset, many=True)
+            serializer = self.get_serializer(categorias, many=True)
 
             return Response(
                 {
                     "success": True,
-                    "count": queryset.count(),
+                    "count": len(categorias),
                     "results": serializer.data,
                 },
                 status=status.HTTP_200_OK,
@@ -73,6 +88,7 @@ class CategoriaViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
+    @cache_referencia
     def retrieve(self, request: Request, *args: Any, **kwargs: Any) -> Response:
         """Obtener una categoría específica"""
         try:
@@ -111,13 +127,16 @@ class GrupoCocheViewSet(viewsets.ModelViewSet):
     queryset = GrupoCoche.objects.all()
     serializer_class = GrupoCocheSerializer
     permission_classes = [PublicAccessPermission]  # Acceso público para consultas
+    modelos_referencia = ("vehiculos.GrupoCoche",)
 
+    @cache_referencia
     def list(self, request: Request, *args: Any, **kwargs: Any) -> Response:
         """Listado de grupos de coches con manejo de errores"""
         try:
-            queryset = self.get_queryset().order_by("nombre")
+            # Una sola consulta: la lista sirve para el conteo y la serialización
+            grupos = list(self.get_queryset().order_by("nombre"))
 
-            if not queryset.exists():
+            if not grupos:
                 logger.warning("No se encontraron grupos de coches")
                 return Response(
                     {
@@ -129,12 +148,12 @@ class GrupoCocheViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_200_OK,
                 )
 
-            serializer = self.get_serializer(queryset, many=True)
+            serializer = self.get_serializer(grupos, many=True)
 
             return Response(
                 {
                     "success": True,
-                    "count": queryset.count(),
+                    "count": len(grupos),
                     "results": serializer.data,
                 },
                 status=status.HTTP_200_OK,
@@ -153,6 +172,7 @@ class GrupoCocheViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
+    @cache_referencia
     def retrieve(self, request, *args, **kwargs):
         """Obtener un grupo de coche específico"""
         try:
@@ -196,18 +216,23 @@ class VehiculoViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAdminOrReadOnly]  # Por defecto
     filter_backends = [DjangoFilterBackend]
     filterset_class = VehiculoFilter
-    pagination_class = StandardResultsSetPagination
+    pagination_class = KeysetPagination
 
     def get_permissions(self):
         """Personalizar permisos según la acción"""
         if self.action in [
             "disponibilidad",
             "disponibilidad_fechas",
+            "matriz_disponibilidad",
+            "autocompletar",
             "list",
             "retrieve",
         ]:
             # Acceso público para consultas
             return [PublicAccessPermission()]
+        elif self.action == "utilizacion":
+            # Analítica con ingresos: solo staff
+            return [IsAdminUser()]
         else:
             # Solo admin para modificaciones
             return [IsAdminOrReadOnly()]
@@ -224,46 +249,28 @@ class VehiculoViewSet(viewsets.ModelViewSet):
         try:
             queryset = self.filter_queryset(self.get_queryset())
 
-            # Manejar caso cuando no hay vehículos en la base de datos
-            if not queryset.exists():
-                logger.info("No hay vehículos disponibles en la base de datos")
-                return Response(
-                    {
-                        "success": True,
-                        "message": "No hay vehículos disponibles en este momento. El administrador debe agregar vehículos al sistema.",
-                        "count": 0,
-                        "results": [],
-                        "filterOptions": {},
-                        "isEmpty": True
-                    },
-                    status=status.HTTP_200_OK,
-                )
-
-            # Agregar precio por defecto a vehículos que tienen tarifa válida
-            vehiculos_con_precio = []
-            for vehiculo in queryset:
-                try:
-                    # Usar la nueva propiedad precio_dia_actual
-                    precio_actual = vehiculo.precio_dia_actual
-
-                    # Solo incluir vehículos con tarifa válida
-                    if precio_actual and precio_actual > 0:
-                        # Asignar temporalmente para compatibilidad con serializer
-                        vehiculo._precio_dia_temp = precio_actual
-                        vehiculos_con_precio.append(vehiculo)
-                    else:
-                        logger.warning(
-                            f"Vehículo {vehiculo.id} sin tarifa válida, excluido del listado"
-                        )
-
-                except Exception as e:
-                    logger.error(
-                        f"Error obteniendo precio para vehículo {vehiculo.id}: {str(e)}"
+            # Precio actual anotado: se filtra, ordena y pagina en la base de datos
+            con_precio = anotar_precio_dia(queryset).filter(**{f"{ANOTACION_PRECIO}__gt": 0})
+            page = self.paginator.paginate_queryset(con_precio, request, view=self)
+            es_primera_pagina = not request.query_params.get(self.paginator.cursor_query_param)
+
+            if not page and es_primera_pagina:
+                # Manejar caso cuando no hay vehículos en la base de datos
+                if not queryset.exists():
+                    logger.info("No hay vehículos disponibles en la base de datos")
+                    return Response(
+                        {
+                            "success": True,
+                            "message": "No hay vehículos disponibles en este momento. El administrador debe agregar vehículos al sistema.",
+                            "count": 0,
+                            "results": [],
+                            "filterOptions": {},
+                            "isEmpty": True
+                        },
+                        status=status.HTTP_200_OK,
                     )
-                    continue
 
-            # Manejar caso cuando hay vehículos pero ninguno tiene tarifa válida
-            if not vehiculos_con_precio:
+                # Manejar caso cuando hay vehículos pero ninguno tiene tarifa válida
                 logger.warning("Hay vehículos en la BD pero ninguno tiene tarifa válida")
                 return Response(
                     {
@@ -277,28 +284,28 @@ class VehiculoViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_200_OK,
                 )
 
-            page = self.paginate_queryset(vehiculos_con_precio)
-            if page is not None:
-                serializer = self.get_serializer(page, many=True)
-                return self.get_paginated_response(
-                    {
-                        "success": True,
-                        "results": serializer.data,
-                        "filterOptions": self._extract_filter_options(queryset),
-                    }
+            for vehiculo in page:
+                # Asignar temporalmente para compatibilidad con serializer
+                vehiculo._precio_dia_temp = vehiculo.precio_dia_vigente
+
+            serializer = self.get_serializer(page, many=True)
+            datos = {"success": True, "results": serializer.data}
+            if es_primera_pagina:
+                # Totales y opciones solo en la primera página (agregados en la BD)
+                total = con_precio.count()
+                datos["count"] = total
+                hoy = timezone.localdate()
+                datos["filterOptions"] = self._extract_filter_options(
+                    con_precio, self._clave_facetas_listado(request, hoy), hoy, hoy
                 )
+                datos["message"] = f"Se encontraron {total} vehículo{'s' if total != 1 else ''} disponible{'s' if total != 1 else ''}"
+            return self.paginator.get_paginated_response(datos)
 
-            serializer = self.get_serializer(vehiculos_con_precio, many=True)
+        except ValidationError as e:
             return Response(
-                {
-                    "success": True,
-                    "count": len(vehiculos_con_precio),
-                    "results": serializer.data,
-                    "filterOptions": self._extract_filter_options(queryset),
-                    "message": f"Se encontraron {len(vehiculos_con_precio)} vehículo{'s' if len(vehiculos_con_precio) != 1 else ''} disponible{'s' if len(vehiculos_con_precio) != 1 else ''}"
-                }
+                {"success": False, "error": e.detail},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-
         except Exception as e:
             logger.error(f"Error en listado de vehículos: {str(e)}", exc_info=True)
             return Response(
@@ -341,27 +348,11 @@ class VehiculoViewSet(viewsets.ModelViewSet):
             lugar_devolucion_id = request_data.get("lugar_devolucion_id") or request_data.get("dropoffLocation")
             categoria_id = request_data.get("categoria_id")
             grupo_id = request_data.get("grupo_id")
-            
-            # Manejar tipo de vehículo (coches/furgonetas) - usar categorías existentes
             tipo_vehiculo = request_data.get("tipo")
-            if tipo_vehiculo and not categoria_id:
-                try:
-                    if tipo_vehiculo == "coches":
-                        categoria = Categoria.objects.get(nombre__iexact="coches")
-                        categoria_id = categoria.id
-                        logger.info(f"Búsqueda filtrada por categoría 'Coches' (ID: {categoria_id})")
-                    elif tipo_vehiculo == "furgonetas":
-                        categoria = Categoria.objects.get(nombre__iexact="furgonetas")
-                        categoria_id = categoria.id
-                        logger.info(f"Búsqueda filtrada por categoría 'Furgonetas' (ID: {categoria_id})")
-                except Categoria.DoesNotExist:
-                    logger.warning(f"Categoría '{tipo_vehiculo}' no encontrada en la base de datos")
-                    # Continuar sin filtrar por categoría
 
             # Log para debugging
             logger.info(f"Búsqueda de disponibilidad - Datos recibidos: {request_data}")
-            logger.info(f"Tipo de vehículo solicitado: {tipo_vehiculo}, Categoría final: {categoria_id}, Grupo: {grupo_id}")
-            
+
             # Validar fechas
             if not fecha_recogida or not fecha_devolucion:
                 return Response(
@@ -389,6 +380,48 @@ class VehiculoViewSet(viewsets.ModelViewSet):
                     status=status.HTTP_400_BAD_REQUEST,
                 )
 
+            # Resultado cacheado para la misma búsqueda (versiones leídas antes de calcular)
+            criterios = {
+                "tipo": tipo_vehiculo,
+                "categoria_id": categoria_id,
+                "grupo_id": grupo_id,
+                "lugar_recogida_id": lugar_recogida_id,
+                "lugar_devolucion_id": lugar_devolucion_id,
+            }
+            clave_cache = cache_disponibilidad.clave_resultado(
+                cache_disponibilidad.clave_busqueda(
+                    fecha_recogida,
+                    fecha_devolucion,
+                    **criterios,
+                    orden=request_data.get("orden"),
+                    cursor=request_data.get("cursor"),
+                    page_size=request_data.get("page_size"),
+                ),
+                fecha_recogida,
+                fecha_devolucion,
+                por_lugar=bool(lugar_recogida_id),
+            )
+            resultado_cacheado = cache_disponibilidad.obtener_resultado(clave_cache)
+            if resultado_cacheado is not None:
+                return self._respuesta_disponibilidad(resultado_cacheado, "HIT")
+
+            # Manejar tipo de vehículo (coches/furgonetas) - usar categorías existentes
+            if tipo_vehiculo and not categoria_id:
+                try:
+                    if tipo_vehiculo == "coches":
+                        categoria = Categoria.objects.get(nombre__iexact="coches")
+                        categoria_id = categoria.id
+                        logger.info(f"Búsqueda filtrada por categoría 'Coches' (ID: {categoria_id})")
+                    elif tipo_vehiculo == "furgonetas":
+                        categoria = Categoria.objects.get(nombre__iexact="furgonetas")
+                        categoria_id = categoria.id
+                        logger.info(f"Búsqueda filtrada por categoría 'Furgonetas' (ID: {categoria_id})")
+                except Categoria.DoesNotExist:
+                    logger.warning(f"Categoría '{tipo_vehiculo}' no encontrada en la base de datos")
+                    # Continuar sin filtrar por categoría
+
+            logger.info(f"Tipo de vehículo solicitado: {tipo_vehiculo}, Categoría final: {categoria_id}, Grupo: {grupo_id}")
+
             # Usar el servicio de búsqueda de vehículos disponibles
             vehiculos_disponibles = buscar_vehiculos_disponibles(
                 fecha_inicio=fecha_recogida,
@@ -398,76 +431,94 @@ class VehiculoViewSet(viewsets.ModelViewSet):
                 grupo_id=grupo_id
             )
 
-            # Manejar caso cuando no hay vehículos en la base de datos
-            if not vehiculos_disponibles.exists():
-                logger.info(f"No hay vehículos disponibles para las fechas {fecha_recogida} - {fecha_devolucion}")
-                return Response(
-                    {
-                        "success": True,
-                        "message": "No hay vehículos disponibles para las fechas y ubicación seleccionadas. Intenta con otras fechas o ubicaciones.",
-                        "count": 0,
-                        "results": [],
-                        "filterOptions": {},
-                        "isEmpty": True,
-                        "suggestion": "Prueba con fechas diferentes o contacta con nosotros para más opciones."
-                    },
-                    status=status.HTTP_200_OK,
+            # Precio para las fechas anotado: se filtra y ordena en la base de datos
+            con_precio = anotar_precio_dia(vehiculos_disponibles, fecha_recogida).filter(
+                **{f"{ANOTACION_PRECIO}__gt": 0}
+            )
+
+            # Paginación opcional (cursor/page_size); sin ella se devuelven todos los resultados
+            self.parametros_paginacion = request_data
+            paginar = any(
+                request_data.get(param)
+                for param in (self.paginator.cursor_query_param, self.paginator.page_size_query_param)
+            )
+            if paginar:
+                vehiculos_pagina = self.paginator.paginate_queryset(con_precio, request, view=self)
+                total = con_precio.count()
+            else:
+                vehiculos_pagina = list(
+                    self.paginator.ordenar(con_precio, self.paginator.get_orden_de(request_data))
                 )
+                total = len(vehiculos_pagina)
 
-            # Obtener vehículos con precio válido para las fechas
-            vehiculos_con_precio = []
-            for vehiculo in vehiculos_disponibles:
-                try:
-                    # Usar el nuevo método para obtener precio para fechas específicas
-                    precio_dia = vehiculo.get_precio_para_fechas(fecha_recogida)
-
-                    if precio_dia and precio_dia > 0:
-                        # Asignar temporalmente para el serializer
-                        vehiculo._precio_dia_temp = precio_dia
-                        vehiculos_con_precio.append(vehiculo)
-                    else:
-                        logger.warning(
-                            f"Vehículo {vehiculo.id} sin tarifa válida para fechas {fecha_recogida} - {fecha_devolucion}"
-                        )
-
-                except Exception as e:
-                    logger.error(
-                        f"Error obteniendo precio para vehículo {vehiculo.id}: {str(e)}"
-                    )
-                    continue
+            # Manejar caso cuando no hay vehículos en la base de datos
+            if not total and not vehiculos_disponibles.exists():
+                logger.info(f"No hay vehículos disponibles para las fechas {fecha_recogida} - {fecha_devolucion}")
+                resultado = {
+                    "success": True,
+                    "message": "No hay vehículos disponibles para las fechas y ubicación seleccionadas. Intenta con otras fechas o ubicaciones.",
+                    "count": 0,
+                    "results": [],
+                    "filterOptions": {},
+                    "isEmpty": True,
+                    "suggestion": "Prueba con fechas diferentes o contacta con nosotros para más opciones.",
+                    # Ventanas libres más cercanas: la siguiente búsqueda ya sabe dónde hay hueco
+                    "sugerencias": sugerir_ventanas_alternativas(
+                        fecha_recogida,
+                        fecha_devolucion,
+                        lugar_id=lugar_recogida_id,
+                        categoria_id=categoria_id,
+                        grupo_id=grupo_id,
+                    ),
+                }
 
             # Manejar caso cuando hay vehículos pero ninguno tiene tarifa válida
-            if not vehiculos_con_precio:
+            elif not total:
                 logger.warning("Hay vehículos disponibles pero ninguno tiene tarifa válida")
-                return Response(
-                    {
-                        "success": True,
-                        "message": "Los vehículos disponibles no tienen tarifas configuradas para las fechas seleccionadas. Contacta al administrador.",
-                        "count": 0,
-                        "results": [],
-                        "filterOptions": {},
-                        "isEmpty": True
-                    },
-                    status=status.HTTP_200_OK,
-                )
-
-            # Serializar resultados
-            serializer = self.get_serializer(vehiculos_con_precio, many=True)
+                resultado = {
+                    "success": True,
+                    "message": "Los vehículos disponibles no tienen tarifas configuradas para las fechas seleccionadas. Contacta al administrador.",
+                    "count": 0,
+                    "results": [],
+                    "filterOptions": {},
+                    "isEmpty": True
+                }
 
-            # Generar filterOptions basado en vehículos válidos
-            filter_options = self._extract_filter_options(vehiculos_con_precio)
+            else:
+                for vehiculo in vehiculos_pagina:
+                    # Asignar temporalmente para el serializer
+                    vehiculo._precio_dia_temp = vehiculo.precio_dia_vigente
+
+                # Serializar resultados
+                serializer = self.get_serializer(vehiculos_pagina, many=True)
+
+                # Facetas de la búsqueda completa, compartidas por todas sus páginas y órdenes
+                filter_options = self._extract_filter_options(
+                    con_precio,
+                    cache_disponibilidad.clave_busqueda(fecha_recogida, fecha_devolucion, **criterios),
+                    fecha_recogida,
+                    fecha_devolucion,
+                    por_lugar=bool(lugar_recogida_id),
+                )
 
-            return Response(
-                {
+                resultado = {
                     "success": True,
-                    "count": len(vehiculos_con_precio),
+                    "count": total,
                     "results": serializer.data,
                     "filterOptions": filter_options,
-                    "message": f"Se encontraron {len(vehiculos_con_precio)} vehículo{'s' if len(vehiculos_con_precio) != 1 else ''} disponible{'s' if len(vehiculos_con_precio) != 1 else ''} para las fechas seleccionadas"
-                },
-                status=status.HTTP_200_OK,
-            )
+                    "message": f"Se encontraron {total} vehículo{'s' if total != 1 else ''} disponible{'s' if total != 1 else ''} para las fechas seleccionadas"
+                }
+                if paginar:
+                    resultado = dict(self.paginator.get_paginated_response_data(resultado))
+
+            cache_disponibilidad.guardar_resultado(clave_cache, resultado)
+            return self._respuesta_disponibilidad(resultado, "MISS")
 
+        except ValidationError as e:
+            return Response(
+                {"success": False, "error": e.detail},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
         except Exception as e:
             logger.error(f"Error en búsqueda de disponibilidad: {str(e)}")
             return Response(
@@ -475,8 +526,46 @@ class VehiculoViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR,
             )
 
-    def _extract_filter_options(self, vehiculos):
-        """Extrae opciones de filtrado de una lista de vehículos - CORREGIDO"""
+    def _clave_facetas_listado(self, request, hoy):
+        """Clave de las facetas del listado: sus filtros, sin paginación ni orden"""
+        excluidos = {
+            self.paginator.cursor_query_param,
+            self.paginator.page_size_query_param,
+            self.paginator.orden_query_param,
+        }
+        filtros = {
+            nombre: ",".join(sorted(valores))
+            for nombre, valores in request.query_params.lists()
+            if nombre not in excluidos
+        }
+        return cache_disponibilidad.clave_busqueda(
+            hoy, hoy, listado=json.dumps(filtros, sort_keys=True)
+        )
+
+    def _respuesta_disponibilidad(self, resultado, estado_cache):
+        """Respuesta de disponibilidad con la cabecera de acierto/fallo de caché"""
+        response = Response(resultado, status=status.HTTP_200_OK)
+        response[cache_disponibilidad.CABECERA] = estado_cache
+        return response
+
+    def _extract_filter_options(
+        self, vehiculos, clave=None, fecha_inicio=None, fecha_fin=None, por_lugar=False
+    ):
+        """
+        Extrae opciones de filtrado de una lista o QuerySet de vehículos.
+
+        Para un QuerySet se calculan en la BD con conteos por valor (ver
+        facetas.py) y, si se indica la clave de la búsqueda, se cachean con ella.
+        """
+        if isinstance(vehiculos, QuerySet):
+            if clave:
+                return facetas_cacheadas(clave, vehiculos, fecha_inicio, fecha_fin, por_lugar)
+            try:
+                return calcular_facetas(vehiculos)
+            except Exception as e:
+                logger.error(f"Error extrayendo opciones de filtro: {str(e)}")
+                vehiculos = []
+
         if not vehiculos:
             return {
                 "marca": [],
@@ -526,6 +615,114 @@ class VehiculoViewSet(viewsets.ModelViewSet):
                     "Marca A-Z",
                     "Marca Z-A",
                 ],            }
+
+    @action(detail=False, methods=["get"], url_path="matriz-disponibilidad")
+    def matriz_disponibilidad(self, request):
+        """Matriz de ocupación vehículos × días de toda la flota o de una categoría"""
+        try:
+            fecha_inicio = parse_date(request.GET.get("fecha_inicio", ""))
+            fecha_fin = parse_date(request.GET.get("fecha_fin", ""))
+        except ValueError:
+            fecha_inicio = fecha_fin = None
+
+        if not fecha_inicio or not fecha_fin:
+            return Response(
+                {
+                    "success": False,
+                    "error": "Fechas requeridas",
+                    "message": "Se requieren fecha_inicio y fecha_fin con formato YYYY-MM-DD",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            matriz = calcular_matriz_disponibilidad(
+                fecha_inicio,
+                fecha_fin,
+                categoria_id=request.GET.get("categoria_id") or None,
+                grupo_id=request.GET.get("grupo_id") or None,
+            )
+        except ValueError as e:
+            return Response(
+                {"success": False, "error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except Exception as e:
+            logger.error(f"Error calculando matriz de disponibilidad: {str(e)}")
+            return Response(
+                {"success": False, "error": "Error interno del servidor"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+        return Response({"success": True, **matriz}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=["get"])
+    def autocompletar(self, request):
+        """Sugerencias de marca/modelo para el buscador"""
+        termino = request.GET.get("q", "").strip()
+        try:
+            limite = int(request.GET.get("limite", LIMITE_POR_DEFECTO))
+        except ValueError:
+            limite = LIMITE_POR_DEFECTO
+
+        if len(termino) < 2:
+            return Response(
+                {"success": True, "count": 0, "results": []},
+                status=status.HTTP_200_OK,
+            )
+
+        try:
+            sugerencias = autocompletar(termino, limite)
+        except Exception as e:
+            logger.error(f"Error en autocompletado de vehículos: {str(e)}")
+            return Response(
+                {"success": False, "error": "Error interno del servidor"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+        return Response(
+            {"success": True, "count": len(sugerencias), "results": sugerencias},
+            status=status.HTTP_200_OK,
+        )
+
+    @action(detail=False, methods=["get"], url_path="utilizacion")
+    def utilizacion(self, request):
+        """Ocupación, huecos e ingresos por vehículo, categoría y sede (solo staff)"""
+        hoy = timezone.localdate()
+        try:
+            fecha_inicio = parse_date(request.GET.get("fecha_inicio", "")) or hoy - timedelta(days=29)
+            fecha_fin = parse_date(request.GET.get("fecha_fin", "")) or hoy
+        except ValueError:
+            return Response(
+                {
+                    "success": False,
+                    "error": "Formato de fecha inválido",
+                    "message": "Las fechas deben tener formato YYYY-MM-DD",
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        try:
+            resultado = utilizacion_cacheada(
+                fecha_inicio,
+                fecha_fin,
+                categoria_id=request.GET.get("categoria_id") or None,
+                lugar_id=request.GET.get("lugar_id") or None,
+            )
+        except ValueError as e:
+            return Response(
+                {"success": False, "error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        except Exception as e:
+            logger.error(f"Error calculando utilización de la flota: {str(e)}", exc_info=True)
+            return Response(
+                {"success": False, "error": "Error interno del servidor"},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            )
+
+        return Response({"success": True, **resultado}, status=status.HTTP_200_OK)
+
     @action(detail=True, methods=["get"])
     def disponibilidad_fechas(self, request, pk=None):
         """Obtiene las fechas en las que un vehículo NO está disponible"""